@@ -31,4 +31,8 @@ def main() -> int:
 
 
 if __name__ == "__main__":
+    # exe化したアプリでシナリオ比較のプロセスプールを使うために必要
+    import multiprocessing
+
+    multiprocessing.freeze_support()
     raise SystemExit(main())
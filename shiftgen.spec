@@ -19,6 +19,11 @@ for pkg in ("ortools", "openpyxl", "jpholiday"):
     except Exception:
         pass
 
+# Precomputed holiday table (lets frozen builds skip jpholiday at runtime).
+datas += [(str(project_root / "shiftgen" / "jp_holidays_table.json"), "shiftgen")]
+# Published input schema (used by shiftgen.io to validate JSON input).
+datas += [(str(project_root / "shiftgen" / "month_input.schema.json"), "shiftgen")]
+
 # ortools often uses dynamic imports and native binaries.
 hiddenimports += collect_submodules("ortools")
 
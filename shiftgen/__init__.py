@@ -1,13 +1,27 @@
 __all__ = [
     "app_paths",
+    "availability",
+    "batch",
     "calendar_utils",
     "cli",
+    "consolidated",
+    "cpu_budget",
     "domain",
     "excel",
+    "export",
     "gui",
+    "history",
     "io",
     "jp_holidays",
+    "scenarios",
+    "schedule",
+    "server",
+    "slots",
+    "snapshot",
     "solver",
     "template_excel",
+    "validate",
+    "watch",
+    "warmup",
 ]
 
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Any, Iterable, Mapping
+
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+ALL_WEEKDAYS = 0x7F  # bit0 = 月曜 ... bit6 = 日曜
+
+
+def weekday_mask(values: Iterable[Any]) -> int:
+    """["tue", 3, "Sat"] のような曜日指定をビットマスクにする (Mon=0 ... Sun=6)。"""
+    mask = 0
+    for v in values:
+        if isinstance(v, int):
+            wd = v
+        else:
+            s = str(v).strip().lower()
+            if s.isdigit():
+                wd = int(s)
+            elif s[:3] in WEEKDAY_NAMES:
+                wd = WEEKDAY_NAMES.index(s[:3])
+            elif s in "月火水木金土日" and len(s) == 1:
+                wd = "月火水木金土日".index(s)
+            else:
+                raise ValueError(f"曜日の指定が不正です: {v!r}")
+        if not 0 <= wd <= 6:
+            raise ValueError(f"曜日は 0-6 で指定してください: {v!r}")
+        mask |= 1 << wd
+    return mask
+
+
+def _monday(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+
+@dataclass(frozen=True)
+class AvailabilityRule:
+    """
+    Recurring unavailability: the weekdays in `weekdays` (bitmask) between
+    `start` and `end` inclusive (open-ended when None), only in every
+    `every_n_weeks`-th week counted from the week containing `anchor`
+    (defaults to `start`, or the 1970-01-05 Monday when both are None).
+    """
+
+    weekdays: int = ALL_WEEKDAYS
+    start: date | None = None
+    end: date | None = None
+    every_n_weeks: int = 1
+    anchor: date | None = None
+
+    def matches(self, d: date) -> bool:
+        if not (self.weekdays >> d.weekday()) & 1:
+            return False
+        if self.start is not None and d < self.start:
+            return False
+        if self.end is not None and d > self.end:
+            return False
+        if self.every_n_weeks > 1:
+            anchor = self.anchor or self.start or date(1970, 1, 5)
+            weeks = (_monday(d) - _monday(anchor)).days // 7
+            if weeks % self.every_n_weeks:
+                return False
+        return True
+
+    def bits(self, first_day: date, n_days: int) -> int:
+        mask = 0
+        for i in range(n_days):
+            if self.matches(first_day + timedelta(days=i)):
+                mask |= 1 << i
+        return mask
+
+
+@dataclass(frozen=True)
+class Availability:
+    """
+    A staff member's unavailability: recurring `rules`, plus explicit `off`
+    dates and `on` dates that override the rules (available despite a rule).
+    Stored as rules; expanded per month into a day bitset on demand.
+    """
+
+    rules: tuple[AvailabilityRule, ...] = ()
+    off: tuple[date, ...] = ()
+    on: tuple[date, ...] = ()
+
+    def unavailable_bits(self, first_day: date, n_days: int) -> int:
+        return _unavailable_bits(self, first_day, n_days)
+
+    def unavailable_dates(self, first_day: date, n_days: int) -> list[date]:
+        bits = self.unavailable_bits(first_day, n_days)
+        return [first_day + timedelta(days=i) for i in range(n_days) if (bits >> i) & 1]
+
+
+def _day_bits(dates: Iterable[date], first_day: date, n_days: int) -> int:
+    mask = 0
+    for d in dates:
+        off = (d - first_day).days
+        if 0 <= off < n_days:
+            mask |= 1 << off
+    return mask
+
+
+@lru_cache(maxsize=4096)
+def _unavailable_bits(av: Availability, first_day: date, n_days: int) -> int:
+    mask = 0
+    for rule in av.rules:
+        mask |= rule.bits(first_day, n_days)
+    mask &= ~_day_bits(av.on, first_day, n_days)
+    return mask | _day_bits(av.off, first_day, n_days)
+
+
+# --- JSON 形式 ---
+
+
+def _parse_date(s: str) -> date:
+    return date.fromisoformat(str(s).strip())
+
+
+def availability_from_raw(raw: Mapping[str, Any]) -> Availability:
+    rules = []
+    for r in raw.get("rules", []):
+        wds = r.get("weekdays")
+        rules.append(
+            AvailabilityRule(
+                weekdays=weekday_mask(wds) if wds else ALL_WEEKDAYS,
+                start=_parse_date(r["start"]) if r.get("start") else None,
+                end=_parse_date(r["end"]) if r.get("end") else None,
+                every_n_weeks=max(1, int(r.get("every_n_weeks", 1))),
+                anchor=_parse_date(r["anchor"]) if r.get("anchor") else None,
+            )
+        )
+    return Availability(
+        rules=tuple(rules),
+        off=tuple(sorted({_parse_date(d) for d in raw.get("off", [])})),
+        on=tuple(sorted({_parse_date(d) for d in raw.get("on", [])})),
+    )
+
+
+def availability_to_raw(av: Availability) -> dict[str, Any]:
+    rules = []
+    for r in av.rules:
+        item: dict[str, Any] = {}
+        if r.weekdays != ALL_WEEKDAYS:
+            item["weekdays"] = [WEEKDAY_NAMES[wd] for wd in range(7) if (r.weekdays >> wd) & 1]
+        if r.start is not None:
+            item["start"] = r.start.isoformat()
+        if r.end is not None:
+            item["end"] = r.end.isoformat()
+        if r.every_n_weeks > 1:
+            item["every_n_weeks"] = r.every_n_weeks
+        if r.anchor is not None:
+            item["anchor"] = r.anchor.isoformat()
+        rules.append(item)
+    out: dict[str, Any] = {"rules": rules}
+    if av.off:
+        out["off"] = [d.isoformat() for d in av.off]
+    if av.on:
+        out["on"] = [d.isoformat() for d in av.on]
+    return out
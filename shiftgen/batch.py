@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+import glob
+import itertools
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from .cpu_budget import CpuBudget, default_budget
+from .domain import MonthInput
+from .excel import export_xlsx
+from .export import FORMAT_XLSX, export_schedule
+from .io import MonthInputJsonError, iter_month_input_documents, loads, month_input_from_dict
+from .snapshot import SNAPSHOT_SUFFIX, save_snapshot
+from .solver import SolveResult, solve
+from .template_excel import TemplateImportError, import_from_template_xlsx
+
+# ディレクトリ・glob から拾う入力の拡張子
+INPUT_SUFFIXES = (".json", ".jsonl", ".ndjson", ".xlsx")
+JSON_SUFFIXES = (".json", ".jsonl", ".ndjson")
+JOURNAL_NAME = "batch_journal.jsonl"
+# プロセスあたり何件まで先に読んで渡しておくか (実行中のものを含む)
+SUBMIT_AHEAD = 2
+
+STATUS_OK = "ok"
+STATUS_PARTIAL = "partial"  # 緩和モードの結果 (出力はしている)
+STATUS_FAILED = "failed"
+DONE_STATUSES = (STATUS_OK, STATUS_PARTIAL)
+
+
+class BatchInputError(ValueError):
+    """入力の指定 (パス・glob・マニフェスト) が不正なとき送出する。"""
+    pass
+
+
+@dataclass(frozen=True)
+class BatchJob:
+    key: str  # ジャーナルのキー (入力の絶対パス#何件目)
+    name: str  # 表示名 (出力ディレクトリからの相対パス、拡張子なし)
+    in_path: str
+    out_path: str
+    fingerprint: tuple[int, int]  # 入力の (サイズ, 更新時刻 ns)。変わっていれば再開時もやり直す
+    doc: int | None = None  # 複数件 JSON の何件目か (中身は実行時に読む)
+    error: str | None = None  # 読み込みの段階で失敗した理由
+
+
+@dataclass(frozen=True)
+class JobRecord:
+    """1ジョブの結果。ジャーナル (JSON Lines) の1行になる。"""
+
+    job: str
+    name: str
+    input: str
+    output: str
+    fingerprint: tuple[int, int]
+    status: str
+    snapshot: bool = False  # スナップショットも保存したか
+    error: str | None = None
+    month: str | None = None
+    staff: int | None = None
+    phase: str | None = None
+    optimal: bool | None = None
+    objective: float | None = None
+    bound: float | None = None
+    solutions: int | None = None
+    solve_seconds: float | None = None
+    workers: int | None = None
+    seconds: float = 0.0  # 読み込み・求解・出力の合計
+    finished_at: float = 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+
+@dataclass(frozen=True)
+class BatchSummary:
+    records: tuple[JobRecord, ...] = ()  # 今回実行したジョブ (終わった順)
+    skipped: tuple[str, ...] = ()  # ジャーナルから再開して飛ばしたジョブのキー
+    interrupted: bool = False
+
+    def count(self, status: str) -> int:
+        return sum(1 for r in self.records if r.status == status)
+
+    @property
+    def failed(self) -> int:
+        return self.count(STATUS_FAILED)
+
+
+# --- 入力の列挙 ---
+
+
+def _fingerprint(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _is_input_file(path: str) -> bool:
+    base = os.path.basename(path)
+    # 隠しファイルと Excel のロックファイル (~$book.xlsx) は除く
+    return base.lower().endswith(INPUT_SUFFIXES) and not base.startswith((".", "~$")) and os.path.isfile(path)
+
+
+def _inside(path: str, directory: str | None) -> bool:
+    if directory is None:
+        return False
+    return os.path.commonpath([os.path.abspath(path), directory]) == directory
+
+
+def _glob_root(pattern: str) -> str:
+    """glob の先頭の、ワイルドカードを含まないディレクトリ部分。"""
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+
+def expand_inputs(specs: Iterable[str], exclude_dir: str | None = None) -> list[tuple[str, str]]:
+    """
+    Expand input arguments (files, directories searched recursively, or
+    glob patterns) into sorted (path, root) pairs; `root` is what output
+    names are made relative to. Files under `exclude_dir` (the output
+    directory) are skipped so a rerun never picks up its own outputs.
+    """
+    exclude = os.path.abspath(exclude_dir) if exclude_dir else None
+    out: list[tuple[str, str]] = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            found = [
+                os.path.join(d, f) for d, _dirs, files in os.walk(spec) for f in files if _is_input_file(os.path.join(d, f))
+            ]
+            root = spec
+        elif glob.has_magic(spec):
+            found = [p for p in glob.glob(spec, recursive=True) if _is_input_file(p)]
+            root = _glob_root(spec)
+        elif os.path.isfile(spec):
+            found = [spec]
+            root = os.path.dirname(spec) or "."
+        else:
+            raise BatchInputError(f"入力が見つかりません: {spec}")
+        out.extend((p, root) for p in sorted(found) if not _inside(p, exclude))
+    return out
+
+
+def read_manifest(path: str) -> list[tuple[str, str | None, str | None]]:
+    """
+    Read a manifest: one job per line, either a bare input path or a JSON
+    object {"in": ..., "out": ..., "name": ...}. Blank lines and lines
+    starting with # are ignored; relative paths are relative to the
+    manifest. Returns (in, out or None, name or None) tuples.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    obj = loads(line.encode("utf-8"))
+                except ValueError as e:
+                    raise BatchInputError(f"{path}:{no}: JSON として読めません: {e}") from e
+                if not isinstance(obj, dict) or not isinstance(obj.get("in"), str):
+                    raise BatchInputError(f'{path}:{no}: "in" に入力ファイルのパスを指定してください')
+                in_path, out_path, name = obj["in"], obj.get("out"), obj.get("name")
+            else:
+                in_path, out_path, name = line, None, None
+            in_path = os.path.join(base, in_path)
+            if not os.path.isfile(in_path):
+                raise BatchInputError(f"{path}:{no}: 入力が見つかりません: {in_path}")
+            entries.append((in_path, os.path.join(base, out_path) if out_path else None, name))
+    return entries
+
+
+def _numbered(path: str, i: int) -> str:
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{i + 1:03d}{ext}"
+
+
+def _is_json(path: str) -> bool:
+    return path.lower().endswith(JSON_SUFFIXES)
+
+
+def _file_jobs(in_path: str, name: str, out_path: str) -> Iterator[BatchJob]:
+    """
+    Jobs for one input file; a multi-input JSON file becomes one job per
+    document. Documents are only counted here (one at a time, nothing is
+    kept), and read again when their job is submitted.
+    """
+    key = os.path.abspath(in_path)
+    fp = _fingerprint(in_path)
+    if not _is_json(in_path):
+        yield BatchJob(f"{key}#0", name, in_path, out_path, fp)
+        return
+    n, error = 0, None
+    try:
+        for _raw in iter_month_input_documents(in_path):
+            n += 1
+    except MonthInputJsonError as e:
+        error = str(e)
+    if error is None and n <= 1:
+        yield BatchJob(f"{key}#0", name, in_path, out_path, fp, error=None if n else "入力が空です")
+        return
+    if n > 1:
+        for i in range(n):
+            yield BatchJob(f"{key}#{i}", f"{name}_{i + 1:03d}", in_path, _numbered(out_path, i), fp, doc=i)
+    if error is not None:
+        # 構文エラー以降は読めないので、ファイル全体を1件の失敗として残す
+        yield BatchJob(f"{key}#*", name, in_path, out_path, fp, error=error)
+
+
+def collect_jobs(
+    inputs: Sequence[str], out_dir: str, fmt: str, manifests: Sequence[str] = ()
+) -> list[BatchJob]:
+    """
+    Build the job list for `inputs` (files, directories, globs) and
+    `manifests`. Outputs go to `out_dir` under the input's path relative to
+    its root with the format's extension, unless a manifest names one.
+    The same input file given twice is solved once.
+    """
+    files: list[tuple[str, str | None, str]] = []
+    for path, root in expand_inputs(inputs, exclude_dir=out_dir):
+        files.append((path, None, os.path.splitext(os.path.relpath(path, root))[0]))
+    for manifest in manifests:
+        for path, out_path, name in read_manifest(manifest):
+            files.append((path, out_path, name or os.path.splitext(os.path.basename(path))[0]))
+
+    seen: set[str] = set()
+    names: set[str] = set()
+    jobs: list[BatchJob] = []
+    for path, out_path, name in files:
+        key = os.path.abspath(path)
+        if key in seen:
+            continue
+        seen.add(key)
+        # 同じ名前 (a.json と a.xlsx など) は番号を付けて出力がぶつからないようにする
+        unique, n = name, 1
+        while unique in names:
+            n += 1
+            unique = f"{name}_{n}"
+        names.add(unique)
+        out = out_path or os.path.join(out_dir, f"{unique}.{fmt}")
+        jobs.extend(_file_jobs(path, unique, out))
+    return jobs
+
+
+# --- ジャーナル ---
+
+
+def read_journal(path: str) -> dict[str, dict[str, Any]]:
+    """ジャーナルを読み、ジョブのキーごとに最後の記録を返す。中断で途中まで書かれた行は無視する。"""
+    done: dict[str, dict[str, Any]] = {}
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return done
+    with f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and isinstance(rec.get("job"), str):
+                done[rec["job"]] = rec
+    return done
+
+
+def _snapshot_path(job: BatchJob) -> str:
+    return os.path.splitext(job.out_path)[0] + SNAPSHOT_SUFFIX
+
+
+def _is_done(job: BatchJob, rec: dict[str, Any] | None, snapshot: bool = False) -> bool:
+    """前回の記録で完了済みか。`snapshot` の実行では、スナップショットも残っていることが条件。"""
+    return (
+        rec is not None
+        and rec.get("status") in DONE_STATUSES
+        and rec.get("output") == job.out_path
+        and tuple(rec.get("fingerprint") or ()) == job.fingerprint
+        and os.path.exists(job.out_path)
+        and (not snapshot or (rec.get("snapshot") is True and os.path.exists(_snapshot_path(job))))
+    )
+
+
+# --- 実行 ---
+
+
+def _payloads(jobs: Iterable[BatchJob]) -> Iterator[tuple[BatchJob, Any]]:
+    """
+    Pair each job with its JSON document (None for templates, which the
+    worker reads itself). Jobs of one file come in document order, so the
+    file is read once from the top, holding only the current document.
+    """
+    path, docs, pos = None, None, 0
+    try:
+        for job in jobs:
+            if job.error is not None or not _is_json(job.in_path):
+                yield job, None
+                continue
+            want = job.doc or 0
+            if docs is None or job.in_path != path or want < pos:
+                if docs is not None:
+                    docs.close()
+                path, docs, pos = job.in_path, iter_month_input_documents(job.in_path), 0
+            raw = None
+            try:
+                while pos <= want:
+                    raw = next(docs)
+                    pos += 1
+            except (StopIteration, MonthInputJsonError, OSError) as e:
+                # ジョブを作った後に入力が書き換えられた
+                path = None
+                yield replace(job, error=str(e) or "入力の件数が変わりました"), None
+                continue
+            yield job, raw
+    finally:
+        if docs is not None:
+            docs.close()
+
+
+def _load(job: BatchJob, raw: Any) -> MonthInput:
+    if not _is_json(job.in_path):
+        return import_from_template_xlsx(job.in_path)
+    return month_input_from_dict(raw, path="$" if job.doc is None else f"$[{job.doc}]")
+
+
+def _write(mi: MonthInput, result: SolveResult, job: BatchJob, fmt: str, snapshot: bool) -> None:
+    directory = os.path.dirname(job.out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    matrix = result.to_matrix(mi)
+    if fmt == FORMAT_XLSX:
+        export_xlsx(mi, matrix, job.out_path)
+    else:
+        export_schedule(mi, matrix, job.out_path, fmt)
+    if snapshot:
+        save_snapshot(_snapshot_path(job), mi, result)
+
+
+def _record(job: BatchJob, t0: float, status: str, snapshot: bool = False, **values: Any) -> JobRecord:
+    return JobRecord(
+        job=job.key,
+        name=job.name,
+        input=job.in_path,
+        output=job.out_path,
+        fingerprint=job.fingerprint,
+        status=status,
+        snapshot=snapshot,
+        seconds=round(time.perf_counter() - t0, 3),
+        finished_at=time.time(),
+        **values,
+    )
+
+
+def _run_job(job: BatchJob, raw: Any, fmt: str, snapshot: bool, workers: int) -> JobRecord:
+    """子プロセスで1ジョブを読み込み・求解・出力する。失敗は例外にせず記録で返す。"""
+    t0 = time.perf_counter()
+    if job.error is not None:
+        return _record(job, t0, STATUS_FAILED, error=job.error)
+    mi = None
+    try:
+        mi = _load(job, raw)
+        res = solve(mi, budget=CpuBudget(total=workers))
+        _write(mi, res, job, fmt, snapshot)
+    except (MonthInputJsonError, TemplateImportError) as e:
+        return _record(job, t0, STATUS_FAILED, error=str(e))
+    except Exception as e:  # 求解・出力の失敗も1件の失敗として続ける
+        return _record(
+            job,
+            t0,
+            STATUS_FAILED,
+            error=f"{type(e).__name__}: {e}",
+            month=mi.month if mi is not None else None,
+            staff=len(mi.staff) if mi is not None else None,
+        )
+    stats = res.stats
+    return _record(
+        job,
+        t0,
+        STATUS_PARTIAL if res.is_partial else STATUS_OK,
+        snapshot=snapshot,
+        month=mi.month,
+        staff=len(mi.staff),
+        phase=stats.phase if stats else None,
+        optimal=stats.optimal if stats else None,
+        objective=stats.objective if stats else None,
+        bound=stats.bound if stats else None,
+        solutions=stats.solutions if stats else None,
+        solve_seconds=round(stats.wall_time, 3) if stats else None,
+        workers=stats.workers if stats else None,
+    )
+
+
+def run_batch(
+    jobs: Sequence[BatchJob],
+    fmt: str,
+    journal_path: str | None = None,
+    resume: bool = True,
+    snapshot: bool = False,
+    budget: CpuBudget | None = None,
+    max_processes: int | None = None,
+    on_done: Callable[[JobRecord], None] | None = None,
+) -> BatchSummary:
+    """
+    Solve `jobs` in a process pool and write each output as it finishes.
+
+    Like compare_scenarios, the whole batch leases its CPUs from `budget`
+    and splits them between the worker processes, so ortools is imported
+    once per worker rather than once per input. Every finished job is
+    appended to the journal (flushed and fsynced); with `resume`, jobs the
+    journal already marks done for the same input and output are skipped
+    (with `snapshot`, only if that run saved a snapshot that still exists).
+    On KeyboardInterrupt the pending jobs are cancelled and the summary is
+    returned with `interrupted` set.
+    """
+    if budget is None:
+        budget = default_budget()
+    previous = read_journal(journal_path) if (journal_path and resume) else {}
+    done = {job.key for job in jobs if _is_done(job, previous.get(job.key), snapshot)}
+    todo = [job for job in jobs if job.key not in done]
+    skipped = tuple(job.key for job in jobs if job.key in done)
+    records: list[JobRecord] = []
+    if not todo:
+        return BatchSummary(skipped=skipped)
+
+    journal = None
+    if journal_path:
+        directory = os.path.dirname(journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        journal = open(journal_path, "a" if resume else "w", encoding="utf-8")
+
+    def finish(rec: JobRecord) -> None:
+        records.append(rec)
+        if journal is not None:
+            journal.write(rec.to_json() + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        if on_done is not None:
+            on_done(rec)
+
+    interrupted = False
+    try:
+        with budget.lease(budget.total) as cpus:
+            n_proc = max(1, min(len(todo), cpus, max_processes or cpus))
+            per_solve = max(1, cpus // n_proc)
+            pool = ProcessPoolExecutor(max_workers=n_proc)
+            # 入力はプロセス数の数倍だけ先に読んで渡す (全件を一度にメモリへ載せない)
+            payloads = _payloads(todo)
+            pending: dict[Any, BatchJob] = {}
+
+            def submit() -> None:
+                for job, raw in itertools.islice(payloads, n_proc * SUBMIT_AHEAD - len(pending)):
+                    pending[pool.submit(_run_job, job, raw, fmt, snapshot, per_solve)] = job
+
+            try:
+                submit()
+                while pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        job = pending.pop(fut)
+                        try:
+                            rec = fut.result()
+                        except Exception as e:  # 子プロセスの異常終了など
+                            rec = _record(job, time.perf_counter(), STATUS_FAILED, error=f"{type(e).__name__}: {e}")
+                        finish(rec)
+                    submit()
+            except KeyboardInterrupt:
+                interrupted = True
+                pool.shutdown(wait=False, cancel_futures=True)
+            else:
+                pool.shutdown()
+            finally:
+                payloads.close()
+    finally:
+        if journal is not None:
+            journal.close()
+    return BatchSummary(records=tuple(records), skipped=skipped, interrupted=interrupted)
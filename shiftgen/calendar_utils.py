@@ -1,7 +1,13 @@
 from __future__ import annotations
 
 import calendar
+from dataclasses import dataclass
 from datetime import date, timedelta
+from types import MappingProxyType
+from typing import Iterable, Mapping
+
+from .jp_holidays import holidays_in_range
+from .slots import DEFAULT_SLOT_TABLE, NO_DAY_TYPE, SlotTable
 
 
 def month_range(month: str) -> tuple[date, date]:
@@ -26,3 +32,84 @@ def is_sunday(d: date) -> bool:
 def is_saturday(d: date) -> bool:
     return d.weekday() == 5
 
+
+
+WEEKDAY_JA = "月火水木金土日"
+
+
+def add_months(month: str, n: int) -> str:
+    y, m = month.split("-")
+    idx = int(y) * 12 + int(m) - 1 + n
+    return f"{idx // 12:04d}-{idx % 12 + 1:02d}"
+
+
+@dataclass(frozen=True)
+class MonthCalendar:
+    """
+    Per-day classification tables for a month (or a span of whole months).
+
+    Every field is a tuple aligned with `dates`, so consumers index by day
+    position instead of re-deriving weekday, holiday and closed status per
+    call. Build it with `MonthCalendar.build()`; `MonthInput.calendar` caches
+    the one for an input.
+    """
+
+    dates: tuple[date, ...]
+    iso: tuple[str, ...]
+    weekdays: tuple[int, ...]  # Mon=0 ... Sun=6
+    weekday_ja: tuple[str, ...]
+    day_types: tuple[int, ...]  # slot_table の日種別 (NO_DAY_TYPE => 定休日)
+    holiday: tuple[bool, ...]  # 自動休業する祝日
+    closed: tuple[bool, ...]  # 臨時休業日
+    open: tuple[bool, ...]  # 営業日
+    holiday_names: Mapping[date, str]
+
+    @classmethod
+    def build(
+        cls,
+        month: str,
+        closed_dates: Iterable[date] = (),
+        auto_close_jp_holidays: bool = True,
+        slot_table: SlotTable = DEFAULT_SLOT_TABLE,
+        n_months: int = 1,
+    ) -> "MonthCalendar":
+        start = month_range(month)[0]
+        end = month_range(add_months(month, n_months - 1))[1]
+        dates = tuple(iter_dates(start, end))
+        names = holidays_in_range(start, end) if auto_close_jp_holidays else {}
+        closed_set = set(closed_dates)
+        weekdays = tuple(d.weekday() for d in dates)
+        day_types = tuple(slot_table.day_type_of_weekday[wd] for wd in weekdays)
+        holiday = tuple(d in names for d in dates)
+        closed = tuple(d in closed_set for d in dates)
+        return cls(
+            dates=dates,
+            iso=tuple(d.isoformat() for d in dates),
+            weekdays=weekdays,
+            weekday_ja=tuple(WEEKDAY_JA[wd] for wd in weekdays),
+            day_types=day_types,
+            holiday=holiday,
+            closed=closed,
+            open=tuple(dt != NO_DAY_TYPE and not h and not c for dt, h, c in zip(day_types, holiday, closed)),
+            holiday_names=MappingProxyType(names),
+        )
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def pos(self, d: date) -> int:
+        """日付の位置 (範囲外は -1)。"""
+        i = (d - self.dates[0]).days
+        return i if 0 <= i < len(self.dates) else -1
+
+    def positions(self, dates: Iterable[date]) -> list[int]:
+        out = []
+        for d in dates:
+            i = self.pos(d)
+            if i < 0:
+                raise ValueError(f"{d.isoformat()} はカレンダーの範囲外です。")
+            out.append(i)
+        return out
+
+    def open_days(self) -> list[date]:
+        return [d for d, o in zip(self.dates, self.open) if o]
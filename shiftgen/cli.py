@@ -1,25 +1,297 @@
 from __future__ import annotations
 
 import argparse
+import os
+import sys
+import time
+from dataclasses import replace
 
+from .batch import JOURNAL_NAME, STATUS_PARTIAL, BatchInputError, JobRecord, collect_jobs, run_batch
+from .domain import MonthInput
 from .excel import export_xlsx
-from .io import load_month_input_json
-from .solver import solve
-from .template_excel import import_from_template_xlsx
+from .export import (
+    FORMAT_XLSX,
+    FORMATS,
+    STDOUT,
+    atomic_path,
+    check_format_available,
+    export_hours,
+    export_schedule,
+    format_from_path,
+)
+from .history import DEFAULT_CARRY_MONTHS, ScheduleHistory
+from .io import MonthInputJsonError, load_month_input_json
+from .server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_QUEUE, DEFAULT_TIMEOUT, DEFAULT_WORKERS, RemoteSolveError, remote_solve
+from .snapshot import SnapshotError, is_snapshot_path, load_snapshot, save_snapshot
+from .solver import SolveError, SolveResult, solve
+from .template_excel import TemplateImportError, import_from_template_xlsx
+from .validate import validate_schedule
+from .watch import DEFAULT_INTERVAL, INPUT_ERRORS, InputReader, file_state, wait_for_change
+
+
+# batch の終了コード (0: すべて成功)
+EXIT_SOME_FAILED = 1
+EXIT_ALL_FAILED = 3
+EXIT_INTERRUPTED = 130
 
 
 def main(argv: list[str] | None = None) -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--in", dest="in_path", required=True, help="input JSON or template xlsx path")
-    ap.add_argument("--out", dest="out_path", required=True, help="output xlsx path")
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["batch"]:
+        return batch_main(argv[1:])
+    if argv[:1] == ["serve"]:
+        return serve_main(argv[1:])
+    ap = argparse.ArgumentParser(
+        epilog="複数の入力をまとめて解く: python -m shiftgen.cli batch --help / 常駐サーバー: python -m shiftgen.cli serve --help"
+    )
+    ap.add_argument("--in", dest="in_path", required=True, help="input JSON, template xlsx or snapshot (.sgsnap) path")
+    ap.add_argument("--out", dest="out_path", required=True, help="output path (xlsx/csv/jsonl/parquet/arrow, '-' for stdout)")
+    ap.add_argument("--format", choices=FORMATS, help="output format (default: from the --out extension)")
+    ap.add_argument("--hours-out", dest="hours_path", help="also write the hours summary here (csv/jsonl/parquet/arrow)")
+    ap.add_argument("--snapshot-out", dest="snapshot_path", help="also save input + result as a snapshot (.sgsnap)")
+    ap.add_argument(
+        "--history", dest="history_path", help="SQLite history: balance against past months and record this result"
+    )
+    ap.add_argument(
+        "--history-months", type=int, default=DEFAULT_CARRY_MONTHS, help="months of history to carry over (default: %(default)s)"
+    )
+    ap.add_argument("--store", default="", help="store name used in the history (default: none)")
+    ap.add_argument("--server", help="solve on a running `serve` daemon (http://host:port or unix:/path)")
+    ap.add_argument("--watch", action="store_true", help="keep running and re-solve whenever the input is saved")
+    ap.add_argument(
+        "--watch-interval", type=float, default=DEFAULT_INTERVAL, help="seconds between checks in --watch (default: %(default)s)"
+    )
     args = ap.parse_args(argv)
 
-    if args.in_path.lower().endswith(".xlsx"):
-        mi = import_from_template_xlsx(args.in_path)
+    try:
+        fmt = args.format or format_from_path(args.out_path, default=None if args.out_path != STDOUT else "csv")
+        hours_fmt = format_from_path(args.hours_path, default=fmt) if args.hours_path else None
+    except ValueError as e:
+        ap.error(str(e))
+    if fmt == FORMAT_XLSX and args.out_path == STDOUT:
+        ap.error("xlsx は標準出力に書けません。--format csv などを指定してください。")
+    if hours_fmt == FORMAT_XLSX:
+        ap.error("--hours-out は csv/jsonl/parquet/arrow で指定してください (xlsx は --out に集計シートが入ります)。")
+    try:
+        for f in (fmt, hours_fmt):
+            if f is not None:
+                check_format_available(f)
+    except RuntimeError as e:
+        ap.error(str(e))
+
+    if args.watch:
+        if is_snapshot_path(args.in_path):
+            ap.error("--watch は JSON かテンプレ xlsx の入力で使えます。")
+        if STDOUT in (args.out_path, args.hours_path):
+            ap.error("--watch では標準出力 (-) に書けません。")
+        return _watch(args, fmt, hours_fmt)
+
+    res = None
+    if is_snapshot_path(args.in_path):
+        # 保存済みの結果をそのまま使う (解き直さない)
+        try:
+            snap = load_snapshot(args.in_path)
+        except (OSError, SnapshotError) as e:
+            print(e, file=sys.stderr)
+            return 2
+        mi, res = snap.month_input, snap.result
+    elif args.in_path.lower().endswith(".xlsx"):
+        try:
+            mi = import_from_template_xlsx(args.in_path)
+        except TemplateImportError as e:
+            # シート名・行番号付きの問題一覧をそのまま出す
+            print(e, file=sys.stderr)
+            return 2
     else:
-        mi = load_month_input_json(args.in_path)
-    res = solve(mi)
-    export_xlsx(mi, res.assignments, args.out_path)
+        try:
+            mi = load_month_input_json(args.in_path)
+        except MonthInputJsonError as e:
+            # JSON パス ($.staff[3].id など) 付きの問題一覧をそのまま出す
+            print(e, file=sys.stderr)
+            return 2
+
+    try:
+        mi, res = _solve_and_record(args, mi, res)
+    except RemoteSolveError as e:
+        print(e, file=sys.stderr)
+        return 1
+    _write_outputs(args, mi, res, fmt, hours_fmt)
+    return 0
+
+
+def _solve_and_record(
+    args: argparse.Namespace, mi: MonthInput, res: SolveResult | None = None, hint: SolveResult | None = None
+) -> tuple[MonthInput, SolveResult]:
+    """履歴の繰越を反映して解き (res があれば解かない)、履歴に記録する。"""
+    history = ScheduleHistory(args.history_path) if args.history_path else None
+    try:
+        if res is None:
+            if history is not None:
+                # 入力に carry_over が書かれていればそちらを優先する
+                carry = {**history.carry_over(mi, args.history_months, args.store), **mi.carry_over}
+                mi = replace(mi, carry_over=carry)
+            if args.server:
+                res = remote_solve(args.server, mi).result
+            else:
+                res = solve(mi, hint=hint)
+        if history is not None:
+            history.record(mi, res, store=args.store)
+    finally:
+        if history is not None:
+            history.close()
+    return mi, res
+
+
+def _write_outputs(args: argparse.Namespace, mi: MonthInput, res: SolveResult, fmt: str, hours_fmt: str | None) -> None:
+    # 一時ファイルに書いてから置き換えるので、開いている人には書きかけが見えない
+    if args.snapshot_path:
+        with atomic_path(args.snapshot_path) as path:
+            save_snapshot(path, mi, res)
+    matrix = res.to_matrix(mi)
+    with atomic_path(args.out_path) as path:
+        if fmt == FORMAT_XLSX:
+            export_xlsx(mi, matrix, path)
+        else:
+            export_schedule(mi, matrix, path, fmt)
+    if args.hours_path:
+        with atomic_path(args.hours_path) as path:
+            export_hours(mi, matrix, path, hours_fmt)
+    if res.is_partial:
+        # 緩和モードの結果は満たせなかった制約を一覧表示する
+        for v in validate_schedule(mi, res.assignments).violations:
+            print(f"[{v.code}] {v.message}", file=sys.stderr)
+
+
+def _watch(args: argparse.Namespace, fmt: str, hours_fmt: str | None) -> int:
+    """
+    `--watch`: solve, then re-read and re-solve every time the input is
+    saved until Ctrl-C. Templates re-parse only the edited sheets, each
+    solve starts from the previous result, and outputs are replaced
+    atomically. Input and solve errors are reported and watching goes on.
+    """
+    reader = InputReader(args.in_path)
+    prev: SolveResult | None = None
+    state = file_state(args.in_path)
+    print(f"{args.in_path} の変更を監視します (Ctrl-C で終了)。", file=sys.stderr)
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                mi = reader.read()
+                mi, prev = _solve_and_record(args, mi, hint=prev)
+                _write_outputs(args, mi, prev, fmt, hours_fmt)
+            except (*INPUT_ERRORS, SolveError) as e:
+                print(e, file=sys.stderr)
+            else:
+                sheets = reader.last_parsed
+                note = "" if sheets is None else f" / 読み直したシート: {', '.join(sheets) or 'なし'}"
+                print(
+                    f"[{time.strftime('%H:%M:%S')}] {args.out_path} を更新しました"
+                    f" ({time.perf_counter() - t0:.1f}s{note})",
+                    file=sys.stderr,
+                )
+            state = wait_for_change(args.in_path, state, args.watch_interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+def _print_job(rec: JobRecord) -> None:
+    line = f"[{rec.status}] {rec.name} ({rec.seconds:.1f}s)"
+    if rec.error:
+        line += "\n    " + rec.error.replace("\n", "\n    ")
+    print(line, file=sys.stderr)
+
+
+def batch_main(argv: list[str]) -> int:
+    """
+    `batch` subcommand: solve many inputs in one process pool.
+
+    Exit codes: 0 when every job succeeded (relaxed results included),
+    1 when some failed, 3 when all failed (jobs skipped as already done
+    count as successes), 2 for usage errors and 130 when interrupted.
+    Rerunning the same command resumes from the journal.
+    """
+    ap = argparse.ArgumentParser(prog="shiftgen.cli batch", description="solve many inputs in parallel")
+    ap.add_argument("inputs", nargs="*", help="input JSON / JSON Lines / template xlsx files, directories or glob patterns")
+    ap.add_argument("--manifest", action="append", default=[], help="file listing one input per line (path or JSON object)")
+    ap.add_argument("--out-dir", required=True, help="output directory")
+    ap.add_argument("--format", choices=FORMATS, default=FORMAT_XLSX, help="output format (default: %(default)s)")
+    ap.add_argument("--snapshot", action="store_true", help="also save each input + result as a snapshot (.sgsnap)")
+    ap.add_argument("--journal", help=f"completion journal / per-job stats (default: OUT_DIR/{JOURNAL_NAME})")
+    ap.add_argument("--restart", action="store_true", help="ignore the journal and solve every input again")
+    ap.add_argument("--jobs", type=int, help="max worker processes (default: within the CPU budget)")
+    args = ap.parse_args(argv)
+
+    if not args.inputs and not args.manifest:
+        ap.error("入力 (ファイル・ディレクトリ・glob) か --manifest を指定してください。")
+    if args.jobs is not None and args.jobs < 1:
+        ap.error("--jobs は1以上で指定してください。")
+    try:
+        check_format_available(args.format)
+    except RuntimeError as e:
+        ap.error(str(e))
+    try:
+        jobs = collect_jobs(args.inputs, args.out_dir, args.format, manifests=args.manifest)
+    except (OSError, BatchInputError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not jobs:
+        print("入力が見つかりません。", file=sys.stderr)
+        return 2
+
+    summary = run_batch(
+        jobs,
+        args.format,
+        journal_path=args.journal or os.path.join(args.out_dir, JOURNAL_NAME),
+        resume=not args.restart,
+        snapshot=args.snapshot,
+        max_processes=args.jobs,
+        on_done=_print_job,
+    )
+    failed = summary.failed
+    print(
+        f"完了 {len(summary.records) - failed} 件 (うち緩和 {summary.count(STATUS_PARTIAL)} 件) / 失敗 {failed} 件"
+        f" / 完了済みのためスキップ {len(summary.skipped)} 件",
+        file=sys.stderr,
+    )
+    if summary.interrupted:
+        print("中断しました。同じコマンドを再実行すると続きから再開します。", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    if failed == 0:
+        return 0
+    # 再開でスキップしたジョブも完了済みなので、それも無いときだけ全滅とする
+    if failed == len(summary.records) and not summary.skipped:
+        return EXIT_ALL_FAILED
+    return EXIT_SOME_FAILED
+
+
+def serve_main(argv: list[str]) -> int:
+    """`serve` subcommand: keep ortools warm and solve over a local JSON API."""
+    import logging
+
+    from .server import serve
+
+    ap = argparse.ArgumentParser(prog="shiftgen.cli serve", description="run the local solve daemon")
+    ap.add_argument("--host", default=DEFAULT_HOST, help="listen address (default: %(default)s)")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT, help="listen port (default: %(default)s)")
+    ap.add_argument("--socket", dest="socket_path", help="listen on this Unix socket instead of TCP")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent solves (default: %(default)s)")
+    ap.add_argument("--queue", type=int, default=DEFAULT_QUEUE, help="max queued requests (default: %(default)s)")
+    ap.add_argument(
+        "--timeout", type=float, default=DEFAULT_TIMEOUT, help="max seconds per request, queue included (default: %(default)s)"
+    )
+    ap.add_argument("--no-warm-up", dest="warm", action="store_false", help="skip the warm-up solve at startup")
+    args = ap.parse_args(argv)
+    if args.workers < 1 or args.queue < 1 or args.timeout <= 0:
+        ap.error("--workers / --queue / --timeout は正の値で指定してください。")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    try:
+        serve(args.host, args.port, args.socket_path, args.workers, args.queue, args.timeout, warm=args.warm)
+    except OSError as e:  # 待ち受けできない (使用中のポート・ソケットなど)
+        print(e, file=sys.stderr)
+        return 1
     return 0
 
 
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Iterable, Sequence
+
+from .cpu_budget import CpuBudget, default_budget
+from .domain import Assignment, MonthInput
+from .excel import (
+    STYLE_HEADER,
+    STYLE_SUMMARY,
+    STYLE_TOTAL,
+    SheetData,
+    _as_matrix,
+    _set_widths,
+    _styled,
+    hours_sheet_data,
+    new_workbook,
+    schedule_sheet_data,
+    write_sheet,
+)
+from .scenarios import KPI_LABELS, ScenarioKpis, evaluate
+from .schedule import ScheduleMatrix
+from .solver import SolveResult
+
+INDEX_SHEET_TITLE = "一覧"
+MAX_SHEET_TITLE = 31  # Excel のシート名の上限
+_BAD_TITLE_CHARS = str.maketrans({c: "_" for c in "[]:*?/\\"})
+_SPREAD_KPIS = ("workday_spread", "hours_spread")  # 一覧の合計行では最大値を出す
+
+
+@dataclass(frozen=True)
+class ExportUnit:
+    """統合ブックの1単位 (店舗×月など)。name はシート名と一覧の見出しに使う。"""
+
+    name: str
+    month_input: MonthInput
+    result: SolveResult | ScheduleMatrix | tuple[Assignment, ...]
+
+
+@dataclass(frozen=True)
+class _UnitPayload:
+    schedule: SheetData
+    hours: SheetData
+    kpis: ScenarioKpis
+    n_staff: int
+    n_open_days: int
+    is_partial: bool
+
+
+def _unit_matrix(u: ExportUnit) -> tuple[ScheduleMatrix, bool]:
+    r = u.result
+    if isinstance(r, SolveResult):
+        return r.to_matrix(u.month_input), r.is_partial
+    return _as_matrix(u.month_input, r), False
+
+
+def _prepare(mi: MonthInput, m: ScheduleMatrix, is_partial: bool) -> _UnitPayload:
+    """1単位分のシート内容と KPI を作る (ワーカープロセスで実行)。"""
+    schedule = schedule_sheet_data(mi, m)
+    return _UnitPayload(
+        schedule=replace(schedule, rows=list(schedule.rows)),  # プロセス間で送るため実体化する
+        hours=hours_sheet_data(mi, m),
+        kpis=evaluate(mi, SolveResult(assignments=m.to_assignments(), matrix=m)),
+        n_staff=len(mi.staff),
+        n_open_days=len(m),
+        is_partial=is_partial,
+    )
+
+
+def _prepare_job(args: tuple[MonthInput, ScheduleMatrix, bool]) -> _UnitPayload:
+    return _prepare(*args)
+
+
+def _sheet_titles(names: Sequence[str]) -> list[tuple[str, str]]:
+    """(勤務表, 集計) のシート名を、Excel の制約 (31文字・禁止文字・重複不可) に合わせて決める。"""
+    used = {INDEX_SHEET_TITLE}
+
+    def unique(base: str) -> str:
+        base = base.translate(_BAD_TITLE_CHARS)[:MAX_SHEET_TITLE]
+        title, n = base, 2
+        while title in used:
+            suffix = f"~{n}"
+            title = base[: MAX_SHEET_TITLE - len(suffix)] + suffix
+            n += 1
+        used.add(title)
+        return title
+
+    out = []
+    for name in names:
+        summary_suffix = " 集計"
+        out.append((unique(name), unique(name[: MAX_SHEET_TITLE - len(summary_suffix)] + summary_suffix)))
+    return out
+
+
+def export_consolidated_xlsx(
+    units: Iterable[ExportUnit],
+    out_path: str,
+    budget: CpuBudget | None = None,
+    max_processes: int | None = None,
+) -> None:
+    """
+    Write many units into one workbook: an index sheet with cross-unit KPIs
+    followed by a schedule sheet and an hours sheet per unit.
+
+    Sheet contents are prepared in worker processes (within `budget`) and
+    streamed, in unit order, into a single write-only workbook.
+    """
+    units = list(units)
+    jobs = [(u.month_input, *_unit_matrix(u)) for u in units]
+    titles = _sheet_titles([u.name for u in units])
+
+    wb = new_workbook()
+    index_ws = wb.create_sheet(title=INDEX_SHEET_TITLE)  # 一覧を先頭に置き、行は最後に書く
+    payloads: list[_UnitPayload] = []
+    if budget is None:
+        budget = default_budget()
+    with budget.lease(budget.total) as cpus:
+        n_proc = max(1, min(len(jobs), cpus, max_processes or cpus))
+        if n_proc == 1:
+            results = map(_prepare_job, jobs)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=n_proc)
+            results = pool.map(_prepare_job, jobs, chunksize=max(1, len(jobs) // (n_proc * 4)))
+        try:
+            for (schedule_title, hours_title), payload in zip(titles, results):
+                write_sheet(wb, schedule_title, payload.schedule)
+                write_sheet(wb, hours_title, payload.hours)
+                payloads.append(payload)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    _write_index(index_ws, units, titles, payloads)
+    wb.save(out_path)
+
+
+def _write_index(ws, units: Sequence[ExportUnit], titles, payloads: Sequence[_UnitPayload]) -> None:
+    header = ["ユニット", "対象月", "スタッフ数", "営業日数", *[label for _name, label in KPI_LABELS], "制約緩和", "勤務表シート"]
+    _set_widths(ws, (20, 10, 10, 10, *[12] * len(KPI_LABELS), 10, 24))
+    ws.freeze_panes = "A2"
+    ws.append(_styled(ws, header, STYLE_HEADER))
+    for u, (schedule_title, _hours_title), p in zip(units, titles, payloads):
+        row = [u.name, u.month_input.month, p.n_staff, p.n_open_days]
+        row += [getattr(p.kpis, name) for name, _label in KPI_LABELS]
+        row += ["○" if p.is_partial else "", schedule_title]
+        ws.append(_styled(ws, row, STYLE_SUMMARY))
+    if payloads:
+        total = ["合計", "", sum(p.n_staff for p in payloads), sum(p.n_open_days for p in payloads)]
+        for name, _label in KPI_LABELS:
+            values = [getattr(p.kpis, name) for p in payloads]
+            total.append(max(values) if name in _SPREAD_KPIS else sum(values))
+        total += [sum(1 for p in payloads if p.is_partial), ""]
+        ws.append(_styled(ws, total, STYLE_TOTAL))
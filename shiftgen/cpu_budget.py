@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+ENV_BUDGET = "SHIFTGEN_CPU_BUDGET"  # 合計ワーカー数の上限 (未指定なら CPU 数)
+ENV_BUDGET_DIR = "SHIFTGEN_CPU_BUDGET_DIR"  # 指定するとホスト全体で予算を共有する
+
+
+def _default_total() -> int:
+    raw = os.environ.get(ENV_BUDGET, "").strip()
+    if raw:
+        try:
+            return max(1, int(raw))
+        except ValueError:
+            pass
+    return max(1, os.cpu_count() or 1)
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class _HostLedger:
+    """
+    Host-wide lease ledger shared through a directory of small lease files.
+
+    Each lease is a file `<pid>-<token>.lease` containing its worker count.
+    Leases of dead processes are ignored (and cleaned up) when counting, so a
+    crashed solve never leaks budget. Access is serialized with `fcntl.flock`
+    on a lock file; on platforms without `fcntl` the ledger is disabled and
+    only the in-process budget applies.
+    """
+
+    def __init__(self, directory: str | os.PathLike[str]):
+        import fcntl  # noqa: F401  (raises ImportError on Windows)
+
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.dir / "budget.lock"
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        import fcntl
+
+        with open(self._lock_path, "a+") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _in_use_locked(self) -> int:
+        used = 0
+        for p in self.dir.glob("*.lease"):
+            try:
+                pid = int(p.stem.split("-", 1)[0])
+                n = int(p.read_text(encoding="ascii").strip() or "0")
+            except (OSError, ValueError):
+                continue
+            if not _pid_alive(pid):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+                continue
+            used += n
+        return used
+
+    def try_acquire(self, token: str, want: int, total: int) -> int:
+        """空きがあれば最大 `want` まで確保して確保数を返す。空きがなければ 0。"""
+        with self._locked():
+            free = total - self._in_use_locked()
+            if free <= 0:
+                return 0
+            n = min(want, free)
+            (self.dir / f"{os.getpid()}-{token}.lease").write_text(str(n), encoding="ascii")
+            return n
+
+    def release(self, token: str) -> None:
+        with self._locked():
+            try:
+                (self.dir / f"{os.getpid()}-{token}.lease").unlink()
+            except FileNotFoundError:
+                pass
+
+
+class CpuBudget:
+    """
+    Budget of CP-SAT search workers shared by concurrent solves.
+
+    Solves lease worker counts with `lease()`; each grant is capped by both the
+    free capacity and a fair share of the total among active and waiting
+    solves, so the first solve cannot starve the others. When a lease is
+    returned, waiting solves are woken and recompute their share, which
+    rebalances capacity as solves finish. When `host_dir` is set the same
+    budget is also enforced across processes on the host.
+    """
+
+    def __init__(self, total: int | None = None, host_dir: str | os.PathLike[str] | None = None):
+        self.total = max(1, int(total)) if total is not None else _default_total()
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._active = 0
+        self._waiting = 0
+        self._seq = 0
+        self._host: _HostLedger | None = None
+        if host_dir is not None:
+            try:
+                self._host = _HostLedger(host_dir)
+            except ImportError:
+                self._host = None
+
+    @property
+    def in_use(self) -> int:
+        with self._cond:
+            return self._in_use
+
+    def _fair_share(self) -> int:
+        contenders = self._active + self._waiting
+        return max(1, -(-self.total // max(1, contenders)))  # ceil
+
+    def acquire(self, want: int, timeout: float | None = None) -> tuple[int, str]:
+        """最大 `want` ワーカーを確保する。最低1ワーカー確保できるまで待つ。"""
+        want = max(1, int(want))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    free = self.total - self._in_use
+                    if free > 0:
+                        n = min(want, free, self._fair_share())
+                        self._seq += 1
+                        token = f"{threading.get_ident()}-{self._seq}"
+                        if self._host is not None:
+                            n = self._host.try_acquire(token, n, self.total)
+                        if n > 0:
+                            self._in_use += n
+                            self._active += 1
+                            return n, token
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("CPU 予算の確保がタイムアウトしました。")
+                    # ホスト側の解放は通知されないため、その場合は定期的に再確認する
+                    wait = 0.2 if self._host is not None else remaining
+                    if remaining is not None and wait is not None:
+                        wait = min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting -= 1
+
+    def release(self, n: int, token: str) -> None:
+        if self._host is not None:
+            self._host.release(token)
+        with self._cond:
+            self._in_use -= n
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, want: int, timeout: float | None = None) -> Iterator[int]:
+        n, token = self.acquire(want, timeout=timeout)
+        try:
+            yield n
+        finally:
+            self.release(n, token)
+
+
+_default_budget: CpuBudget | None = None
+_default_lock = threading.Lock()
+
+
+def default_budget() -> CpuBudget:
+    """プロセス共通の予算。環境変数 SHIFTGEN_CPU_BUDGET(_DIR) で調整できる。"""
+    global _default_budget
+    with _default_lock:
+        if _default_budget is None:
+            _default_budget = CpuBudget(host_dir=os.environ.get(ENV_BUDGET_DIR) or None)
+        return _default_budget
+
+
+def set_default_budget(budget: CpuBudget) -> None:
+    global _default_budget
+    with _default_lock:
+        _default_budget = budget
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import date
+from functools import cached_property
 from typing import Iterable, Mapping
 
+from .availability import Availability
+from .calendar_utils import MonthCalendar
+from .month_index import MonthIndex, build_month_index
+from .slots import DEFAULT_SLOT_TABLE, SlotTable
+
 KIND_WD_EARLY = "wd_early"
 KIND_WD_A = "wd_a"
 KIND_WD_B = "wd_b"
@@ -26,49 +32,14 @@ SLOT_SAT_A3 = "sat_a3"  # optional
 SLOT_SAT_B1 = "sat_b1"
 SLOT_SAT_B2 = "sat_b2"
 
-SLOT_ORDER = (
-    SLOT_WD_EARLY,
-    SLOT_WD_A1,
-    SLOT_WD_A2,
-    SLOT_WD_B1,
-    SLOT_WD_B2,
-    SLOT_WD_BPLUS,
-    SLOT_SAT_EARLY,
-    SLOT_SAT_A1,
-    SLOT_SAT_A2,
-    SLOT_SAT_A3,
-    SLOT_SAT_B1,
-    SLOT_SAT_B2,
-)
-
-SLOT_LABEL_JA = {
-    SLOT_WD_EARLY: "平日早番",
-    SLOT_WD_A1: "平日A(1)",
-    SLOT_WD_A2: "平日A(2)",
-    SLOT_WD_B1: "平日B(1)",
-    SLOT_WD_B2: "平日B(2)",
-    SLOT_WD_BPLUS: "平日B+",
-    SLOT_SAT_EARLY: "土曜早番",
-    SLOT_SAT_A1: "土曜A(1)",
-    SLOT_SAT_A2: "土曜A(2)",
-    SLOT_SAT_A3: "土曜A(3)",
-    SLOT_SAT_B1: "土曜B(1)",
-    SLOT_SAT_B2: "土曜B(2)",
-}
+# 枠の定義本体は slots.DEFAULT_SLOT_TEMPLATES (データ)。以下はその既定テーブルの別名。
+SLOT_ORDER = DEFAULT_SLOT_TABLE.slot_names
+
+SLOT_LABEL_JA = dict(zip(DEFAULT_SLOT_TABLE.slot_names, DEFAULT_SLOT_TABLE.slot_labels))
 
 SLOT_TO_KIND = {
-    SLOT_WD_EARLY: KIND_WD_EARLY,
-    SLOT_WD_A1: KIND_WD_A,
-    SLOT_WD_A2: KIND_WD_A,
-    SLOT_WD_B1: KIND_WD_B,
-    SLOT_WD_B2: KIND_WD_B,
-    SLOT_WD_BPLUS: KIND_WD_BPLUS,
-    SLOT_SAT_EARLY: KIND_SAT_EARLY,
-    SLOT_SAT_A1: KIND_SAT_A,
-    SLOT_SAT_A2: KIND_SAT_A,
-    SLOT_SAT_A3: KIND_SAT_A,
-    SLOT_SAT_B1: KIND_SAT_B,
-    SLOT_SAT_B2: KIND_SAT_B,
+    name: DEFAULT_SLOT_TABLE.kind_names[ki]
+    for name, ki in zip(DEFAULT_SLOT_TABLE.slot_names, DEFAULT_SLOT_TABLE.slot_kind)
 }
 
 
@@ -86,6 +57,20 @@ class Requirements:
     prefer_max_headcount: bool = True
 
 
+@dataclass(frozen=True)
+class CarryOver:
+    """
+    How far a staff member ran above (+) or below (-) the team in the
+    preceding months, per month on average (see history.ScheduleHistory).
+    The solver adds `workdays` to the member's total when balancing work
+    days, and `saturdays` to their Saturday count against the cap (as a soft
+    term; the monthly cap itself stays as configured).
+    """
+
+    workdays: int = 0
+    saturdays: int = 0
+
+
 @dataclass(frozen=True)
 class MonthInput:
     month: str  # "YYYY-MM"
@@ -94,9 +79,36 @@ class MonthInput:
     requests_off: Mapping[str, tuple[date, ...]]  # staff_id -> dates
     requirements: Requirements = Requirements()
     auto_close_jp_holidays: bool = True
-
-    def staff_by_id(self) -> dict[str, Staff]:
-        return {s.id: s for s in self.staff}
+    slot_table: SlotTable = DEFAULT_SLOT_TABLE
+    # staff_id -> 定期的な勤務不可ルール (requests_off と合わせて希望休として扱う)
+    availability: Mapping[str, Availability] = field(default_factory=dict)
+    # staff_id -> 前月までの偏り (履歴が無いスタッフは省略 = 0)
+    carry_over: Mapping[str, CarryOver] = field(default_factory=dict)
+
+    @cached_property
+    def calendar(self) -> MonthCalendar:
+        """日付ごとの曜日・日種別・祝日・休業・営業日の表 (初回アクセス時に1度だけ構築)。"""
+        return MonthCalendar.build(
+            self.month,
+            closed_dates=self.closed_dates,
+            auto_close_jp_holidays=self.auto_close_jp_holidays,
+            slot_table=self.slot_table,
+        )
+
+    @cached_property
+    def index(self) -> MonthIndex:
+        """スタッフ位置・希望休・勤務可能種別・営業日のビット表 (初回アクセス時に1度だけ構築)。"""
+        return build_month_index(self)
+
+    def staff_by_id(self) -> Mapping[str, Staff]:
+        return self.index.staff_by_id
+
+    def __getstate__(self) -> dict:
+        # 派生キャッシュ (calendar / index) は pickle せず、受け取った側で作り直す
+        state = dict(self.__dict__)
+        state.pop("calendar", None)
+        state.pop("index", None)
+        return state
 
 
 @dataclass(frozen=True)
@@ -1,137 +1,220 @@
 from __future__ import annotations
 
-from .calendar_utils import is_saturday
-from .domain import Assignment, MonthInput, SLOT_LABEL_JA, SLOT_ORDER
+from dataclasses import dataclass
+from typing import Iterable, Iterator
 
-HOURS_WEEKDAY = 8.5
-HOURS_SATURDAY = 4.5
+from .domain import Assignment, MonthInput
+from .schedule import EMPTY, ScheduleMatrix
+from .slots import DEFAULT_SLOT_TABLE, NO_DAY_TYPE
+
+# 1回あたりの勤務時間は slots.DEFAULT_SLOT_TEMPLATES の "hours" で定義する。
+HOURS_WEEKDAY = DEFAULT_SLOT_TABLE.hours_for(saturday=False)
+HOURS_SATURDAY = DEFAULT_SLOT_TABLE.hours_for(saturday=True)
+
+
+def _as_matrix(mi: MonthInput, assignments: tuple[Assignment, ...] | ScheduleMatrix) -> ScheduleMatrix:
+    if isinstance(assignments, ScheduleMatrix):
+        return assignments
+    return ScheduleMatrix.for_month_input(mi, assignments)
 
 
 def compute_hours(
-    mi: MonthInput, assignments: tuple[Assignment, ...]
-) -> list[tuple[str, str, bool, int, int, float]]:
-    """スタッフごとの勤務回数・合計時間を返す。
+    mi: MonthInput, assignments: tuple[Assignment, ...] | ScheduleMatrix
+) -> list[tuple[str, str, bool, int, int, float, float, float]]:
+    """スタッフごとの勤務回数・勤務時間を返す。
 
     Returns:
-        list of (staff_id, name, is_manager, wd_count, sat_count, total_hours)
+        list of (staff_id, name, is_manager, wd_count, sat_count, wd_hours,
+        sat_hours, total_hours)。時間は日種別ごとの hours で数えるので、
+        平日扱いの日種別が複数あっても回数×1つの時間にはならない。
         スタッフ登録順に並ぶ。
     """
-    wd_count: dict[str, int] = {s.id: 0 for s in mi.staff}
-    sat_count: dict[str, int] = {s.id: 0 for s in mi.staff}
-
-    for a in assignments:
-        sat = is_saturday(a.day)
-        for sid in a.slots.values():
-            if sat:
-                sat_count[sid] += 1
-            else:
-                wd_count[sid] += 1
-
-    result = []
-    for s in mi.staff:
-        wd = wd_count[s.id]
-        sat = sat_count[s.id]
-        total = wd * HOURS_WEEKDAY + sat * HOURS_SATURDAY
-        result.append((s.id, s.name, s.is_manager, wd, sat, total))
-    return result
-
-
-def export_xlsx(mi: MonthInput, assignments: tuple[Assignment, ...], out_path: str) -> None:
+    table = mi.slot_table
+    m = _as_matrix(mi, assignments)
+    cal = mi.calendar
+    day_types = [cal.day_types[i] for i in cal.positions(m.days)]
+
+    n = len(mi.staff)
+    wd_count = [0] * n
+    sat_count = [0] * n
+    wd_hours = [0.0] * n
+    sat_hours = [0.0] * n
+    for dt in set(day_types):
+        if dt == NO_DAY_TYPE:
+            continue
+        counts = m.counts_per_staff([x == dt for x in day_types])
+        is_sat = table.day_type_is_saturday[dt]
+        target, target_hours = (sat_count, sat_hours) if is_sat else (wd_count, wd_hours)
+        h = table.day_type_hours[dt]
+        for p, c in enumerate(counts):
+            target[p] += c
+            target_hours[p] += c * h
+
+    return [
+        (s.id, s.name, s.is_manager, wd_count[p], sat_count[p], wd_hours[p], sat_hours[p], wd_hours[p] + sat_hours[p])
+        for p, s in enumerate(mi.staff)
+    ]
+
+
+# 共有の名前付きスタイル。セルごとに Alignment などを作らず、名前で参照する。
+STYLE_HEADER = "shiftgen_header"
+STYLE_CELL = "shiftgen_cell"  # 勤務表の本体 (折り返しあり)
+STYLE_SUMMARY = "shiftgen_summary"
+STYLE_TOTAL = "shiftgen_total"
+
+SCHEDULE_FIXED_WIDTHS = (12, 6, 8)  # 日付, 曜日, 種別
+SLOT_COLUMN_WIDTH = 12
+MANAGER_COLUMN_WIDTH = 16
+SUMMARY_WIDTHS = (14, 14, 14, 20, 14, 20, 14)
+
+
+def _openpyxl():
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Alignment, Font, PatternFill
+        import openpyxl
     except ModuleNotFoundError as e:
         raise RuntimeError(
             "openpyxl が見つかりません。`pip install -r requirements.txt` を実行してください。"
         ) from e
-
-    staff_by_id = mi.staff_by_id()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = mi.month
-
-    header = ["日付", "曜日", "種別"] + [SLOT_LABEL_JA[s] for s in SLOT_ORDER] + ["マネージャー有"]
-    ws.append(header)
-
-    fill_header = PatternFill("solid", fgColor="1F2937")
-    font_header = Font(color="FFFFFF", bold=True)
-    for col in range(1, len(header) + 1):
-        cell = ws.cell(row=1, column=col)
-        cell.fill = fill_header
-        cell.font = font_header
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    weekdays = "月火水木金土日"
-    for a in assignments:
-        d = a.day
-        has_mgr = any(staff_by_id[sid].is_manager for sid in a.slots.values())
-        kind = "土曜" if d.weekday() == 5 else "平日"
-
-        row = [d.isoformat(), weekdays[d.weekday()], kind]
-        for slot_name in SLOT_ORDER:
-            sid = a.slots.get(slot_name)
-            row.append(staff_by_id[sid].name if sid else "")
-        row.append("OK" if has_mgr else "NG")
-        ws.append(row)
-
-    ws.freeze_panes = "A2"
-    widths = [12, 6, 8] + [12] * len(SLOT_ORDER) + [16]
+    return openpyxl
+
+
+def register_styles(wb) -> None:
+    """ブックに shiftgen の名前付きスタイルを登録する (登録済みなら何もしない)。"""
+    from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+    from openpyxl.styles.fonts import DEFAULT_FONT
+
+    if STYLE_HEADER in wb.named_styles:
+        return
+    centered = dict(horizontal="center", vertical="center")
+    wb.add_named_style(
+        NamedStyle(
+            name=STYLE_HEADER,
+            font=Font(color="FFFFFF", bold=True),
+            fill=PatternFill("solid", fgColor="1F2937"),
+            alignment=Alignment(**centered),
+        )
+    )
+    wb.add_named_style(NamedStyle(name=STYLE_CELL, font=DEFAULT_FONT, alignment=Alignment(wrap_text=True, **centered)))
+    wb.add_named_style(NamedStyle(name=STYLE_SUMMARY, font=DEFAULT_FONT, alignment=Alignment(**centered)))
+    wb.add_named_style(NamedStyle(name=STYLE_TOTAL, font=Font(bold=True), alignment=Alignment(**centered)))
+
+
+def _styled(ws, values, style: str) -> list:
+    from openpyxl.cell import WriteOnlyCell
+
+    out = []
+    for v in values:
+        cell = WriteOnlyCell(ws, value=v)
+        cell.style = style
+        out.append(cell)
+    return out
+
+
+def _set_widths(ws, widths) -> None:
     from openpyxl.utils import get_column_letter
 
     for i, w in enumerate(widths, start=1):
         ws.column_dimensions[get_column_letter(i)].width = w
 
-    for r in range(2, len(assignments) + 2):
-        for c in range(1, len(header) + 1):
-            ws.cell(row=r, column=c).alignment = Alignment(
-                horizontal="center", vertical="center", wrap_text=True
-            )
-
-    # --- 2枚目: 勤務時間集計シート ---
-    ws2 = wb.create_sheet(title="勤務時間集計")
-    summary_header = ["名前", "マネージャー", "平日勤務回数", f"平日時間(×{HOURS_WEEKDAY}h)", "土曜勤務回数", f"土曜時間(×{HOURS_SATURDAY}h)", "合計時間(h)"]
-    ws2.append(summary_header)
-    for col in range(1, len(summary_header) + 1):
-        cell = ws2.cell(row=1, column=col)
-        cell.fill = fill_header
-        cell.font = font_header
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    hours_data = compute_hours(mi, assignments)
-    for _sid, name, is_mgr, wd, sat, total in hours_data:
-        ws2.append([
-            name,
-            "○" if is_mgr else "",
-            wd,
-            wd * HOURS_WEEKDAY,
-            sat,
-            sat * HOURS_SATURDAY,
-            total,
-        ])
 
+def schedule_rows(mi: MonthInput, m: ScheduleMatrix) -> Iterator[list]:
+    """勤務表シートのデータ行 (日付, 曜日, 種別, 各枠の氏名..., マネージャー有) を順に返す。"""
+    table = mi.slot_table
+    names = [s.name for s in mi.staff]
+    manager_mask = mi.index.manager_mask
+    cal = mi.calendar
+    for di, ci in enumerate(cal.positions(m.days)):
+        dt = cal.day_types[ci]
+        if dt == NO_DAY_TYPE:  # 定休日の曜日 (勤務表とテンプレが食い違っている)。集計と同じく飛ばす
+            continue
+        cells = m.day_row(di)
+        has_mgr = any(p != EMPTY and (manager_mask >> p) & 1 for p in cells)
+        row = [cal.iso[ci], cal.weekday_ja[ci], table.day_type_labels[dt]]
+        row.extend(names[p] if p != EMPTY else "" for p in cells)
+        row.append("OK" if has_mgr else "NG")
+        yield row
+
+
+@dataclass(frozen=True)
+class SheetData:
+    """
+    Contents of one sheet as plain values. `rows` may be a generator (streamed
+    straight into the sheet) or a list, e.g. when prepared in another process.
+    """
+
+    header: list
+    rows: Iterable[list]
+    row_style: str
+    widths: tuple
+    freeze: str | None = None
+    total: list | None = None  # 太字の合計行
+
+
+def schedule_sheet_data(mi: MonthInput, m: ScheduleMatrix) -> SheetData:
+    return SheetData(
+        header=["日付", "曜日", "種別", *mi.slot_table.slot_labels, "マネージャー有"],
+        rows=schedule_rows(mi, m),
+        row_style=STYLE_CELL,
+        widths=(*SCHEDULE_FIXED_WIDTHS, *[SLOT_COLUMN_WIDTH] * len(m.slot_names), MANAGER_COLUMN_WIDTH),
+        freeze="A2",
+    )
+
+
+def hours_sheet_data(mi: MonthInput, m: ScheduleMatrix) -> SheetData:
+    # 日種別ごとに時間が違ってよいので、「回数×1つの時間」ではなく compute_hours の時間をそのまま出す
+    header = ["名前", "マネージャー", "平日勤務回数", "平日時間(h)", "土曜勤務回数", "土曜時間(h)", "合計時間(h)"]
+    hours_data = compute_hours(mi, m)
+    rows = [
+        [name, "○" if is_mgr else "", wd, wd_h, sat, sat_h, total]
+        for _sid, name, is_mgr, wd, sat, wd_h, sat_h, total in hours_data
+    ]
     # 合計行
-    n = len(hours_data)
-    if n > 0:
-        ws2.append([
-            "合計",
-            "",
-            sum(r[3] for r in hours_data),
-            sum(r[3] * HOURS_WEEKDAY for r in hours_data),
-            sum(r[4] for r in hours_data),
-            sum(r[4] * HOURS_SATURDAY for r in hours_data),
-            sum(r[5] for r in hours_data),
-        ])
-        total_row = n + 2
-        font_total = Font(bold=True)
-        for col in range(1, len(summary_header) + 1):
-            ws2.cell(row=total_row, column=col).font = font_total
-
-    summary_widths = [14, 14, 14, 20, 14, 20, 14]
-    for i, w in enumerate(summary_widths, start=1):
-        ws2.column_dimensions[get_column_letter(i)].width = w
-    for r in range(2, len(hours_data) + 3):
-        for c in range(1, len(summary_header) + 1):
-            ws2.cell(row=r, column=c).alignment = Alignment(horizontal="center", vertical="center")
+    total_row = None
+    if hours_data:
+        total_row = ["合計", "", *(sum(r[i] for r in rows) for i in range(2, 7))]
+    return SheetData(header=header, rows=rows, row_style=STYLE_SUMMARY, widths=SUMMARY_WIDTHS, total=total_row)
 
-    wb.save(out_path)
 
+def write_sheet(wb, title: str, data: SheetData):
+    """write-only ブックにシートを追加し、data の行を順に書き出す。"""
+    ws = wb.create_sheet(title=title)
+    if data.freeze:
+        ws.freeze_panes = data.freeze
+    _set_widths(ws, data.widths)
+    ws.append(_styled(ws, data.header, STYLE_HEADER))
+    for row in data.rows:
+        ws.append(_styled(ws, row, data.row_style))
+    if data.total is not None:
+        ws.append(_styled(ws, data.total, STYLE_TOTAL))
+    return ws
+
+
+def write_schedule_sheet(wb, mi: MonthInput, m: ScheduleMatrix, title: str | None = None):
+    """write-only ブックに勤務表シートを追加し、行を作りながら書き出す。"""
+    return write_sheet(wb, title or mi.month, schedule_sheet_data(mi, m))
+
+
+def write_hours_sheet(wb, mi: MonthInput, m: ScheduleMatrix, title: str = "勤務時間集計"):
+    """write-only ブックに勤務時間集計シートを追加する。"""
+    return write_sheet(wb, title, hours_sheet_data(mi, m))
+
+
+def new_workbook():
+    """名前付きスタイルを登録済みの write-only ブックを作る。"""
+    openpyxl = _openpyxl()
+    wb = openpyxl.Workbook(write_only=True)
+    register_styles(wb)
+    return wb
+
+
+def export_xlsx(mi: MonthInput, assignments: tuple[Assignment, ...] | ScheduleMatrix, out_path: str) -> None:
+    """勤務表と勤務時間集計の2シートを書き出す。
+
+    write-only モードで行を作りながら書き出すため、ブック全体をメモリに持たない。
+    書式はセルごとに作らず、ブックに1度だけ登録した名前付きスタイルを共有する。
+    """
+    m = _as_matrix(mi, assignments)
+    wb = new_workbook()
+    write_schedule_sheet(wb, mi, m)
+    write_hours_sheet(wb, mi, m)
+    wb.save(out_path)
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Any, Iterable, Iterator, Sequence
+
+from .domain import Assignment, MonthInput
+from .excel import _as_matrix, compute_hours
+from .schedule import EMPTY, ScheduleMatrix
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"  # Arrow IPC (Feather v2)
+FORMAT_XLSX = "xlsx"
+
+FORMATS = (FORMAT_XLSX, FORMAT_CSV, FORMAT_JSONL, FORMAT_PARQUET, FORMAT_ARROW)
+STDOUT = "-"
+
+_EXTENSIONS = {
+    ".xlsx": FORMAT_XLSX,
+    ".csv": FORMAT_CSV,
+    ".jsonl": FORMAT_JSONL,
+    ".ndjson": FORMAT_JSONL,
+    ".parquet": FORMAT_PARQUET,
+    ".arrow": FORMAT_ARROW,
+    ".feather": FORMAT_ARROW,
+}
+
+SCHEDULE_COLUMNS = ("date", "weekday", "day_type", "slot", "slot_label", "kind", "staff_id", "staff_name", "is_manager")
+HOURS_COLUMNS = ("staff_id", "name", "is_manager", "weekday_count", "saturday_count", "total_hours")
+
+# 列指向フォーマットで一度に書き出す行数
+BATCH_ROWS = 8192
+
+
+def format_from_path(path: str, default: str | None = None) -> str:
+    """拡張子から出力形式を決める。判断できなければ default、それも無ければ ValueError。"""
+    if path != STDOUT:
+        fmt = _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if fmt is not None:
+            return fmt
+    if default is not None:
+        return default
+    raise ValueError(f"出力形式を拡張子から判断できません: {path} (--format で指定してください)")
+
+
+# --- 行の生成 (すべてジェネレータで、1行ずつ作る) ---
+
+
+def schedule_records(mi: MonthInput, m: ScheduleMatrix) -> Iterator[tuple]:
+    """営業日の各枠を (SCHEDULE_COLUMNS の順) 1行ずつ返す。未割当の枠は staff が空。"""
+    table = mi.slot_table
+    cal = mi.calendar
+    staff = mi.staff
+    manager_mask = mi.index.manager_mask
+    for di, ci in enumerate(cal.positions(m.days)):
+        dt = cal.day_types[ci]
+        row = m.day_row(di)
+        for si in table.day_type_slots[dt]:
+            p = row[si]
+            if p == EMPTY:
+                sid, name, is_mgr = "", "", False
+            else:
+                sid, name, is_mgr = staff[p].id, staff[p].name, bool((manager_mask >> p) & 1)
+            yield (
+                cal.iso[ci],
+                cal.weekday_ja[ci],
+                table.day_type_names[dt],
+                table.slot_names[si],
+                table.slot_labels[si],
+                table.kind_names[table.slot_kind[si]],
+                sid,
+                name,
+                is_mgr,
+            )
+
+
+def hours_records(mi: MonthInput, m: ScheduleMatrix) -> Iterator[tuple]:
+    """compute_hours の結果を HOURS_COLUMNS の順で返す。"""
+    for sid, name, is_mgr, wd, sat, _wd_h, _sat_h, total in compute_hours(mi, m):
+        yield (sid, name, is_mgr, wd, sat, total)
+
+
+# --- 書き出し ---
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """
+    Yield a temporary path next to `path` and move it into place with
+    os.replace once the block succeeds, so readers (and Excel) never see a
+    half-written file. On failure the temporary file is removed. The
+    standard-output marker "-" is passed through unchanged.
+    """
+    if path == STDOUT:
+        yield path
+        return
+    directory, base = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=f".{base}.", suffix=os.path.splitext(base)[1], dir=directory)
+    os.close(fd)
+    try:
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        else:
+            mask = os.umask(0)
+            os.umask(mask)
+            os.chmod(tmp, 0o666 & ~mask)  # mkstemp は 0600 で作るため、通常の新規ファイルと同じ権限にする
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def _open_text(path: str) -> Iterator[IO[str]]:
+    if path == STDOUT:
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        yield f
+
+
+@contextmanager
+def _open_binary(path: str) -> Iterator[IO[bytes]]:
+    if path == STDOUT:
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+        return
+    with open(path, "wb") as f:
+        yield f
+
+
+def write_csv(records: Iterable[Sequence[Any]], columns: Sequence[str], path: str) -> int:
+    n = 0
+    with _open_text(path) as f:
+        w = csv.writer(f, lineterminator="\n")
+        w.writerow(columns)
+        for rec in records:
+            w.writerow(rec)
+            n += 1
+    return n
+
+
+def write_jsonl(records: Iterable[Sequence[Any]], columns: Sequence[str], path: str) -> int:
+    n = 0
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    with _open_text(path) as f:
+        for rec in records:
+            f.write(dumps(dict(zip(columns, rec))))
+            f.write("\n")
+            n += 1
+    return n
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ModuleNotFoundError as e:
+        raise RuntimeError("pyarrow が見つかりません。Parquet/Arrow 出力には `pip install pyarrow` を実行してください。") from e
+    return pyarrow
+
+
+def check_format_available(fmt: str) -> None:
+    """fmt の出力に必要なライブラリが無ければ RuntimeError (生成前の確認用)。"""
+    if fmt in (FORMAT_PARQUET, FORMAT_ARROW):
+        _pyarrow()
+
+
+def _batches(pa, records: Iterable[Sequence[Any]], columns: Sequence[str]) -> Iterator[Any]:
+    buf: list[list[Any]] = [[] for _ in columns]
+    for rec in records:
+        for col, v in zip(buf, rec):
+            col.append(v)
+        if len(buf[0]) >= BATCH_ROWS:
+            yield pa.RecordBatch.from_arrays([pa.array(c) for c in buf], names=list(columns))
+            buf = [[] for _ in columns]
+    if buf[0]:
+        yield pa.RecordBatch.from_arrays([pa.array(c) for c in buf], names=list(columns))
+
+
+def write_columnar(records: Iterable[Sequence[Any]], columns: Sequence[str], path: str, fmt: str) -> int:
+    """Parquet / Arrow IPC を BATCH_ROWS 行ずつのバッチで書き出す。"""
+    pa = _pyarrow()
+    n = 0
+    writer = None
+    with _open_binary(path) as f:
+        try:
+            for batch in _batches(pa, records, columns):
+                if writer is None:
+                    if fmt == FORMAT_PARQUET:
+                        import pyarrow.parquet as pq
+
+                        writer = pq.ParquetWriter(f, batch.schema)
+                    else:
+                        import pyarrow.ipc as ipc
+
+                        writer = ipc.new_file(f, batch.schema)
+                if fmt == FORMAT_PARQUET:
+                    writer.write_batch(batch)
+                else:
+                    writer.write(batch)
+                n += batch.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+    return n
+
+
+def write_records(records: Iterable[Sequence[Any]], columns: Sequence[str], path: str, fmt: str) -> int:
+    """records を fmt 形式で path (STDOUT なら標準出力) に書き出し、行数を返す。"""
+    if fmt == FORMAT_CSV:
+        return write_csv(records, columns, path)
+    if fmt == FORMAT_JSONL:
+        return write_jsonl(records, columns, path)
+    if fmt in (FORMAT_PARQUET, FORMAT_ARROW):
+        return write_columnar(records, columns, path, fmt)
+    raise ValueError(f"この形式は行データの出力に使えません: {fmt}")
+
+
+def export_schedule(
+    mi: MonthInput, assignments: tuple[Assignment, ...] | ScheduleMatrix, path: str, fmt: str | None = None
+) -> int:
+    """勤務表を (日付, 枠, スタッフ) の縦持ちで書き出す。"""
+    fmt = fmt or format_from_path(path)
+    return write_records(schedule_records(mi, _as_matrix(mi, assignments)), SCHEDULE_COLUMNS, path, fmt)
+
+
+def export_hours(
+    mi: MonthInput, assignments: tuple[Assignment, ...] | ScheduleMatrix, path: str, fmt: str | None = None
+) -> int:
+    """勤務時間集計 (compute_hours) を書き出す。"""
+    fmt = fmt or format_from_path(path)
+    return write_records(hours_records(mi, _as_matrix(mi, assignments)), HOURS_COLUMNS, path, fmt)
@@ -1,19 +1,32 @@
 from __future__ import annotations
 
 import json
+import logging
+import os
 import threading
+import time
 import tkinter as tk
+from collections import deque
 from dataclasses import dataclass
 from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
 from tkinter import filedialog, messagebox, ttk
 
 from .app_paths import app_base_dir, find_runtime_file
-from .calendar_utils import iter_dates, month_range
-from .domain import KIND_SAT_B, KIND_WD_A, MonthInput, Requirements, SLOT_LABEL_JA, SLOT_ORDER, Staff
+from .availability import Availability, availability_from_raw, availability_to_raw
+from .calendar_utils import MonthCalendar
+from .domain import KIND_SAT_B, KIND_WD_A, MonthInput, Requirements, Staff
 from .excel import compute_hours, export_xlsx
-from .jp_holidays import jp_holidays_in_month
-from .solver import SolveError, solve
+from .io import month_input_to_dict, read_json
+from .scenarios import BASELINE, KPI_LABELS, Scenario, ScenarioOutcome, compare_scenarios
+from .schedule import EMPTY
+from .slots import DEFAULT_SLOT_TABLE, NO_DAY_TYPE, SlotTable, compile_slot_templates
+from .snapshot import SNAPSHOT_SUFFIX, Snapshot, load_snapshot, save_snapshot
+from .solver import SolveCancelled, SolveError, SolveProgress, SolveResult, solve
 from .template_excel import export_template_xlsx, import_from_template_xlsx
+from .validate import validate_schedule
+from .warmup import start_warm_up
 
 
 def _parse_date(s: str) -> date:
@@ -21,10 +34,6 @@ def _parse_date(s: str) -> date:
     return date(int(y), int(m), int(d))
 
 
-def _weekday_jp(d: date) -> str:
-    return "月火水木金土日"[d.weekday()]
-
-
 COL_BG = "#FFF7ED"
 COL_PANEL = "#FFFFFF"
 COL_TEXT = "#111827"
@@ -35,27 +44,237 @@ COL_SAT = "#E0F2FE"
 COL_HOLIDAY = "#FFE4E6"
 COL_CLOSED = "#FEE2E2"
 COL_REQUEST_OFF = "#DBEAFE"
+COL_UNAVAILABLE = "#E5E7EB"
 COL_TODAY = "#DCFCE7"
 
+COL_CHANGED = "#FEF3C7"
+CHANGED_MARK = "＊"
+PREVIEW_PAGE_SIZE = 62  # プレビューに同時に載せる最大行数 (約2ヶ月分)
+PROGRESS_REFRESH_MS = 250  # 生成中の進捗表示・途中解プレビューの更新間隔
+
+# カレンダーの日の状態 -> (背景色, 文字色)
+DAY_STATE_COLORS = {
+    "sun": (COL_SUN, "#9D174D"),
+    "holiday": (COL_HOLIDAY, "#991B1B"),
+    "closed": (COL_CLOSED, COL_TEXT),
+    "off": (COL_REQUEST_OFF, COL_TEXT),
+    "unavailable": (COL_UNAVAILABLE, COL_TEXT),
+    "today": (COL_TODAY, COL_TEXT),
+    "sat": (COL_SAT, COL_TEXT),
+    "normal": (COL_PANEL, COL_TEXT),
+}
+
+
+class StaffStore:
+    """
+    Ordered staff roster indexed by staff id.
+
+    Keeps registration order (the order used by the solver and the Excel
+    output) while lookups, updates and membership tests by id are O(1).
+    Each member also gets a lower-cased search key so the GUI filter is a
+    few substring tests per member.
+    """
+
+    def __init__(self, staff: Iterable[Staff] = ()):
+        self._items: list[Staff] = []
+        self._pos: dict[str, int] = {}
+        self._keys: dict[str, str] = {}
+        for s in staff:
+            self.upsert(s)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Staff]:
+        return iter(self._items)
+
+    def __contains__(self, staff_id: object) -> bool:
+        return staff_id in self._pos
+
+    def get(self, staff_id: str) -> Staff | None:
+        i = self._pos.get(staff_id)
+        return self._items[i] if i is not None else None
+
+    def ids(self) -> list[str]:
+        return [s.id for s in self._items]
+
+    def position(self, staff_id: str) -> int | None:
+        """登録順での位置 (0始まり)。"""
+        return self._pos.get(staff_id)
+
+    def upsert(self, s: Staff) -> bool:
+        """追加なら True、既存 id の更新なら False。更新時は並び順を保つ。"""
+        self._keys[s.id] = _staff_search_key(s)
+        i = self._pos.get(s.id)
+        if i is None:
+            self._pos[s.id] = len(self._items)
+            self._items.append(s)
+            return True
+        self._items[i] = s
+        return False
+
+    def remove(self, staff_id: str) -> Staff | None:
+        i = self._pos.pop(staff_id, None)
+        if i is None:
+            return None
+        del self._keys[staff_id]
+        s = self._items.pop(i)
+        for j in range(i, len(self._items)):
+            self._pos[self._items[j].id] = j
+        return s
+
+    def matching(self, query: str) -> list[Staff]:
+        """空白区切りの語をすべて含むスタッフ (ID・名前・MGR・LIMIT・種別名で検索)。"""
+        terms = query.lower().split()
+        if not terms:
+            return list(self._items)
+        keys = self._keys
+        return [s for s in self._items if all(t in keys[s.id] for t in terms)]
+
+    def matches(self, staff_id: str, query: str) -> bool:
+        key = self._keys.get(staff_id)
+        return key is not None and all(t in key for t in query.lower().split())
+
+
+def _staff_search_key(s: Staff) -> str:
+    parts = [s.id, s.name]
+    if s.is_manager:
+        parts += ["mgr", "マネージャー"]
+    if s.allowed_kinds:
+        parts += ["limit", "制限", *s.allowed_kinds]
+    return "\t".join(parts).lower()
+
+
+def _staff_line(s: Staff) -> str:
+    tag = "MGR" if s.is_manager else "-"
+    lim = "LIMIT" if s.allowed_kinds else "-"
+    return f"{s.id} | {s.name} | {tag} | {lim}"
+
 
 @dataclass
 class UiState:
     month: str = "2026-02"
     requirements: Requirements = Requirements()
-    staff: list[Staff] = None  # type: ignore[assignment]
+    staff: StaffStore = None  # type: ignore[assignment]
     closed_dates: set[date] = None  # type: ignore[assignment]
     requests_off: dict[str, set[date]] = None  # type: ignore[assignment]
     auto_close_jp_holidays: bool = True
+    slot_table: SlotTable = DEFAULT_SLOT_TABLE
+    availability: dict[str, Availability] = None  # type: ignore[assignment]
 
     def __post_init__(self):
         if self.staff is None:
-            self.staff = []
+            self.staff = StaffStore()
+        elif not isinstance(self.staff, StaffStore):
+            self.staff = StaffStore(self.staff)
+        if self.availability is None:
+            self.availability = {}
         if self.closed_dates is None:
             self.closed_dates = set()
         if self.requests_off is None:
             self.requests_off = {}
 
 
+@dataclass
+class _Task:
+    label: str
+    group: str
+    work: Callable[[], Any]
+    done: Callable[[Any], None]
+    failed: Callable[[Exception], None]
+
+
+class TaskRunner:
+    """
+    Runs GUI I/O jobs (load / save / export) on worker threads.
+
+    `work()` runs on a worker thread and must not touch Tk; `done(result)` or
+    `failed(error)` is then called on the Tk thread through `after()`. Tasks
+    that share a `group` (the same file, or the UI inputs) run one at a time
+    in submission order; tasks in different groups run concurrently.
+    `on_change(running, pending)` is called on the Tk thread whenever the set
+    of tasks changes, with the labels of running and waiting tasks.
+    """
+
+    def __init__(self, root: tk.Misc, on_change: Callable[[list[str], list[str]], None] | None = None):
+        self._root = root
+        self._on_change = on_change
+        self._queues: dict[str, deque[_Task]] = {}
+        self._running: dict[str, _Task] = {}
+
+    def submit(
+        self,
+        label: str,
+        group: str,
+        work: Callable[[], Any],
+        done: Callable[[Any], None],
+        failed: Callable[[Exception], None],
+    ) -> None:
+        self._queues.setdefault(group, deque()).append(_Task(label, group, work, done, failed))
+        self._start_next(group)
+        self._notify()
+
+    def busy(self, group: str | None = None) -> bool:
+        if group is None:
+            return bool(self._running)
+        return group in self._running or bool(self._queues.get(group))
+
+    def _start_next(self, group: str) -> None:
+        if group in self._running:
+            return
+        queue = self._queues.get(group)
+        if not queue:
+            self._queues.pop(group, None)
+            return
+        task = queue.popleft()
+        self._running[group] = task
+
+        def run():
+            try:
+                result = task.work()
+            except Exception as e:
+                self._root.after(0, lambda err=e: self._finish(task, None, err))
+            else:
+                self._root.after(0, lambda: self._finish(task, result, None))
+
+        threading.Thread(target=run, name=f"shiftgen-task-{task.label}", daemon=True).start()
+
+    def _finish(self, task: _Task, result: Any, error: Exception | None) -> None:
+        del self._running[task.group]
+        try:
+            if error is not None:
+                task.failed(error)
+            else:
+                task.done(result)
+        finally:
+            self._start_next(task.group)
+            self._notify()
+
+    def _notify(self) -> None:
+        if self._on_change is None:
+            return
+        running = [t.label for t in self._running.values()]
+        pending = [t.label for q in self._queues.values() for t in q]
+        self._on_change(running, pending)
+
+
+# TaskRunner のグループ: 画面の入力を書き換える読込は1本ずつ、ファイル書き出しはパスごとに直列化する
+GROUP_INPUT = "input"
+
+
+def _file_group(path: str | os.PathLike[str]) -> str:
+    return "file:" + str(Path(path).resolve())
+
+
+def _read_json(path: str | os.PathLike[str]) -> dict:
+    return read_json(str(path))
+
+
+def _write_json(path: str | os.PathLike[str], raw: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(raw, f, ensure_ascii=False, indent=2)
+
+
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -63,9 +282,15 @@ class App(tk.Tk):
         self.geometry("1100x700")
 
         self.state = UiState()
-        self._jp_holidays: dict[date, str] = {}
+        self._cal: MonthCalendar | None = None
+        self._cal_key = None
+        self._day_buttons: list[tk.Button] = []
+        self._day_styles: list[str | None] = []
+        self._sel_requests_off: set[date] = set()
+        self._sel_unavailable = 0
         self._apply_style()
         self._build_ui()
+        self.tasks = TaskRunner(self, self._on_tasks_changed)
 
     def _apply_style(self):
         self.configure(bg=COL_BG)
@@ -123,9 +348,24 @@ class App(tk.Tk):
         bottom.pack(fill="x", padx=10, pady=10)
         self.gen_btn = ttk.Button(bottom, text="生成", command=self._generate)
         self.gen_btn.pack(side="left")
+        self.stop_btn = ttk.Button(bottom, text="ここで確定", command=self._stop_generate, state="disabled")
+        self.stop_btn.pack(side="left", padx=(10, 0))
         ttk.Button(bottom, text="Excel出力", command=self._export).pack(side="left", padx=10)
+        ttk.Button(bottom, text="スナップショット保存", command=self._save_snapshot).pack(side="left")
+        ttk.Button(bottom, text="スナップショット読込", command=self._load_snapshot).pack(side="left", padx=10)
+        ttk.Button(bottom, text="シナリオ比較", command=self._open_scenarios).pack(side="left")
         self.status_var = tk.StringVar(value="入力して「生成」を押してください。")
         ttk.Label(bottom, textvariable=self.status_var).pack(side="left", padx=10)
+        self.progress_var = tk.StringVar(value="")
+        ttk.Label(bottom, textvariable=self.progress_var).pack(side="right")
+        self.tasks_var = tk.StringVar(value="")
+        ttk.Label(bottom, textvariable=self.tasks_var).pack(side="right", padx=10)
+
+        # 生成中の状態。進捗はソルバーのスレッドが最新値を置くだけで、表示は定期更新で拾う
+        self._cancel_event: threading.Event | None = None
+        self._gen_started = 0.0
+        self._latest_progress: SolveProgress | None = None
+        self._shown_progress: SolveProgress | None = None
 
     def _build_staff_panel(self, parent: ttk.Frame):
         box = ttk.Labelframe(parent, text="スタッフ (8人想定 / 追加・編集可)")
@@ -146,9 +386,18 @@ class App(tk.Tk):
         ttk.Button(row, text="追加/更新", command=self._upsert_staff).pack(side="left", padx=6)
         ttk.Button(row, text="削除", command=self._delete_staff).pack(side="left", padx=6)
 
-        self.staff_list = tk.Listbox(box, height=6)
+        search = ttk.Frame(box)
+        search.pack(fill="x", padx=8)
+        ttk.Label(search, text="絞り込み").pack(side="left")
+        self.staff_filter_var = tk.StringVar()
+        ttk.Entry(search, textvariable=self.staff_filter_var, width=24).pack(side="left", padx=6)
+        ttk.Label(search, text="(ID・名前・MGR・LIMIT)").pack(side="left")
+        self.staff_filter_var.trace_add("write", lambda *_a: self._refresh_staff_list())
+
+        self.staff_list = tk.Listbox(box, height=6, exportselection=False)
         self.staff_list.pack(fill="x", padx=8, pady=6)
         self.staff_list.bind("<<ListboxSelect>>", lambda _e: self._on_staff_select())
+        self._list_ids: list[str] = []  # Listbox の各行に表示中のスタッフ id
 
     def _build_calendar_panel(self, parent: ttk.Frame):
         box = ttk.Labelframe(parent, text="休業日(祝日等) と 希望休")
@@ -175,6 +424,7 @@ class App(tk.Tk):
         legend = ttk.Frame(box)
         legend.pack(fill="x", padx=8, pady=(0, 6))
         self._legend_chip(legend, COL_REQUEST_OFF, "希望休")
+        self._legend_chip(legend, COL_UNAVAILABLE, "定期休")
         self._legend_chip(legend, COL_CLOSED, "臨時休業")
         self._legend_chip(legend, COL_HOLIDAY, "祝日(自動)")
         self._legend_chip(legend, COL_SAT, "土曜")
@@ -191,17 +441,9 @@ class App(tk.Tk):
         box = ttk.Labelframe(parent, text="生成結果プレビュー")
         box.pack(fill="both", expand=True, pady=6)
 
-        cols = ("date", "dow", "type") + tuple(SLOT_ORDER)
-        self.preview = ttk.Treeview(box, columns=cols, show="headings", height=20)
-        self.preview.heading("date", text="日付")
-        self.preview.heading("dow", text="曜")
-        self.preview.heading("type", text="種別")
-        self.preview.column("date", width=100, anchor="center")
-        self.preview.column("dow", width=40, anchor="center")
-        self.preview.column("type", width=60, anchor="center")
-        for s in SLOT_ORDER:
-            self.preview.heading(s, text=SLOT_LABEL_JA[s])
-            self.preview.column(s, width=110, anchor="center")
+        self.preview = ttk.Treeview(box, show="headings", height=20)
+        self._preview_table: SlotTable | None = None
+        self._configure_preview_columns(self.state.slot_table)
 
         ysb = ttk.Scrollbar(box, orient="vertical", command=self.preview.yview)
         xsb = ttk.Scrollbar(box, orient="horizontal", command=self.preview.xview)
@@ -212,23 +454,177 @@ class App(tk.Tk):
         box.rowconfigure(0, weight=1)
         box.columnconfigure(0, weight=1)
 
+        # Treeview のタグは先に作ったものほど優先されるため、変更強調を最初に作る
+        self.preview.tag_configure("changed", background=COL_CHANGED)
+        self.preview.tag_configure("even", background="#FFFFFF")
+        self.preview.tag_configure("odd", background="#FFFBEB")
+        self.preview.tag_configure("sat", background=COL_SAT)
+
+        pager = ttk.Frame(box)
+        pager.grid(row=2, column=0, columnspan=2, sticky="ew", padx=8)
+        self.prev_page_btn = ttk.Button(pager, text="◀ 前", command=lambda: self._goto_preview_page(-1))
+        self.prev_page_btn.pack(side="left")
+        self.next_page_btn = ttk.Button(pager, text="次 ▶", command=lambda: self._goto_preview_page(+1))
+        self.next_page_btn.pack(side="left", padx=6)
+        self.page_var = tk.StringVar(value="")
+        ttk.Label(pager, textvariable=self.page_var).pack(side="left", padx=6)
+
         self.summary_text = tk.Text(
             box, height=6, state="disabled",
             font=("Courier New", 9), bg=COL_PANEL, relief="flat",
         )
-        self.summary_text.grid(row=2, column=0, columnspan=2, sticky="ew", padx=8, pady=(0, 6))
+        self.summary_text.grid(row=3, column=0, columnspan=2, sticky="ew", padx=8, pady=(0, 6))
 
         self._assignments = None
         self._month_input = None
+        self._result: SolveResult | None = None
+        # プレビューは全行のデータを保持し、表示中のページ分だけ Treeview に載せる
+        self._preview_rows: list[tuple[str, tuple, tuple]] = []  # (iid, values, tags)
+        self._preview_values: dict[str, tuple] = {}
+        self._preview_changed: dict[str, frozenset[int]] = {}
+        self._preview_shown: dict[str, tuple[tuple, tuple]] = {}  # iid -> (表示値, tags)
+        self._preview_page = 0
+        self._summary_lines: list[str] = []
+        self._update_pager()
+
+    def _show_preview(self, mi: MonthInput, matrix, commit: bool = True) -> int:
+        """前回の結果との差分だけプレビューに反映する。変更セル数を返す。
+
+        commit=False は生成途中の解の表示用で、差分の基準 (前回の結果) を更新しない。
+        """
+        table = mi.slot_table
+        if self._configure_preview_columns(table):
+            self.preview.delete(*self.preview.get_children())
+            self._preview_shown = {}
+            self._preview_values = {}
+
+        names = [s.name for s in mi.staff]
+        cal = mi.calendar
+        rows: list[tuple[str, tuple, tuple]] = []
+        for idx, ci in enumerate(cal.positions(matrix.days)):
+            dt = cal.day_types[ci]
+            if dt == NO_DAY_TYPE:  # 定休日の曜日 (結果と日種別の設定が食い違っている)
+                continue
+            tags = ["odd" if len(rows) % 2 else "even"]
+            if table.day_type_is_saturday[dt]:
+                tags.append("sat")
+            values = (
+                cal.iso[ci],
+                cal.weekday_ja[ci],
+                table.day_type_labels[dt],
+                *[(names[p] if p != EMPTY else "") for p in matrix.day_row(idx)],
+            )
+            rows.append((cal.iso[ci], values, tuple(tags)))
+
+        # 同じ日が前回の結果にあるときだけ差分を強調する (初回・別の月は強調しない)
+        prev = self._preview_values
+        changed: dict[str, frozenset[int]] = {}
+        if any(iid in prev for iid, _v, _t in rows):
+            for iid, values, _t in rows:
+                old = prev.get(iid)
+                if old is None:
+                    changed[iid] = frozenset(range(3, len(values)))
+                elif old != values:
+                    changed[iid] = frozenset(c for c, (a, b) in enumerate(zip(old, values)) if a != b)
+        else:
+            self._preview_page = 0
+
+        self._preview_rows = rows
+        if commit:
+            self._preview_values = {iid: values for iid, values, _t in rows}
+        self._preview_changed = changed
+        self._render_preview_page()
+
+        # 勤務時間サマリー表示
+        hours_data = compute_hours(mi, matrix)
+        header_line = f"{'名前':<10}  {'平日':>12}  {'土曜':>12}  合計"
+        lines = [header_line, "-" * len(header_line)]
+        for _sid, name, _is_mgr, wd, sat, wd_h, sat_h, total in hours_data:
+            lines.append(f"{name:<10}  {wd:>3}回 {wd_h:>5.1f}h  {sat:>3}回 {sat_h:>5.1f}h  {total:>5.1f}h")
+        if lines != self._summary_lines:
+            self._summary_lines = lines
+            self.summary_text.configure(state="normal")
+            self.summary_text.delete("1.0", "end")
+            self.summary_text.insert("end", "\n".join(lines))
+            self.summary_text.configure(state="disabled")
+        return sum(len(cols) for cols in changed.values())
+
+    def _render_preview_page(self):
+        """表示中のページについて、Treeview の行を追加・更新・削除の差分だけで合わせる。"""
+        n_pages = max(1, -(-len(self._preview_rows) // PREVIEW_PAGE_SIZE))
+        self._preview_page = min(self._preview_page, n_pages - 1)
+        lo = self._preview_page * PREVIEW_PAGE_SIZE
+        page = self._preview_rows[lo : lo + PREVIEW_PAGE_SIZE]
+
+        wanted = {iid for iid, _v, _t in page}
+        stale = [iid for iid in self._preview_shown if iid not in wanted]
+        if stale:
+            self.preview.delete(*stale)
+            for iid in stale:
+                del self._preview_shown[iid]
+
+        for pos, (iid, values, tags) in enumerate(page):
+            cols = self._preview_changed.get(iid)
+            if cols:
+                values = tuple(f"{v}{CHANGED_MARK}" if c in cols and v else v for c, v in enumerate(values))
+                tags = tags + ("changed",)
+            shown = self._preview_shown.get(iid)
+            if shown is None:
+                self.preview.insert("", pos, iid=iid, values=values, tags=tags)
+            elif shown != (values, tags):
+                self.preview.item(iid, values=values, tags=tags)
+            self._preview_shown[iid] = (values, tags)
+        self._update_pager()
+
+    def _goto_preview_page(self, delta: int):
+        self._preview_page = max(0, self._preview_page + delta)
+        self._render_preview_page()
+
+    def _update_pager(self):
+        n_pages = max(1, -(-len(self._preview_rows) // PREVIEW_PAGE_SIZE))
+        self.page_var.set(f"{self._preview_page + 1} / {n_pages} ページ" if n_pages > 1 else "")
+        self.prev_page_btn.configure(state="normal" if self._preview_page > 0 else "disabled")
+        self.next_page_btn.configure(state="normal" if self._preview_page < n_pages - 1 else "disabled")
+
+    def _configure_preview_columns(self, table: SlotTable) -> bool:
+        """列構成を table に合わせる。列を作り直したとき True。"""
+        if table is self._preview_table:
+            return False
+        self._preview_table = table
+        cols = ("date", "dow", "type") + table.slot_names
+        self.preview.configure(columns=cols)
+        self.preview.heading("date", text="日付")
+        self.preview.heading("dow", text="曜")
+        self.preview.heading("type", text="種別")
+        self.preview.column("date", width=100, anchor="center")
+        self.preview.column("dow", width=40, anchor="center")
+        self.preview.column("type", width=60, anchor="center")
+        for name, label in zip(table.slot_names, table.slot_labels):
+            self.preview.heading(name, text=label)
+            self.preview.column(name, width=110, anchor="center")
+        return True
 
     def _rebuild_calendar(self):
+        """月・祝日設定が変わったときだけボタンを作り直し、それ以外は色だけ塗り直す。"""
+        self.state.month = self.month_var.get().strip()
+        self.state.auto_close_jp_holidays = bool(self.auto_holiday_var.get())
+        key = (self.state.month, self.state.auto_close_jp_holidays, self.state.slot_table)
+        if key != self._cal_key:
+            self._build_calendar_grid()
+            self._cal_key = key
+        self._restyle_all_days()
+
+    def _build_calendar_grid(self):
         for w in self.cal_frame.winfo_children():
             w.destroy()
 
-        self.state.month = self.month_var.get().strip()
-        start, end = month_range(self.state.month)
-        self.state.auto_close_jp_holidays = bool(self.auto_holiday_var.get())
-        self._jp_holidays = jp_holidays_in_month(self.state.month) if self.state.auto_close_jp_holidays else {}
+        # 臨時休業・希望休はクリックで変わるため、ここでは曜日と祝日だけで構造を作る
+        self._cal = MonthCalendar.build(
+            self.state.month,
+            auto_close_jp_holidays=self.state.auto_close_jp_holidays,
+            slot_table=self.state.slot_table,
+        )
+        start = self._cal.dates[0]
 
         for i, w in enumerate(["日", "月", "火", "水", "木", "金", "土"]):
             ttk.Label(self.cal_frame, text=w).grid(row=0, column=i, padx=2, pady=2)
@@ -236,7 +632,8 @@ class App(tk.Tk):
         r = 1
         c = (start.weekday() + 1) % 7  # Sunday-first
 
-        for d in iter_dates(start, end):
+        self._day_buttons = []
+        for d in self._cal.dates:
             btn = tk.Button(
                 self.cal_frame,
                 text=str(d.day),
@@ -249,41 +646,55 @@ class App(tk.Tk):
             )
             btn.grid(row=r, column=c, padx=2, pady=2)
             btn.configure(command=lambda dd=d: self._on_day_click(dd))
-            self._style_day_button(btn, d)
+            self._day_buttons.append(btn)
 
             c += 1
             if c >= 7:
                 c = 0
                 r += 1
-
-    def _style_day_button(self, btn: tk.Button, d: date):
-        if d == date.today():
-            btn.configure(bg=COL_TODAY, fg=COL_TEXT)
-
-        if d.weekday() == 6:
-            btn.configure(bg=COL_SUN, fg="#9D174D")
-            return
-        if d in self._jp_holidays:
-            btn.configure(bg=COL_HOLIDAY, fg="#991B1B")
-            return
+        self._day_styles = [None] * len(self._day_buttons)
+
+    def _day_state(self, i: int) -> str:
+        cal = self._cal
+        if cal.day_types[i] == NO_DAY_TYPE:
+            return "sun"
+        if cal.holiday[i]:
+            return "holiday"
+        d = cal.dates[i]
         if d in self.state.closed_dates:
-            btn.configure(bg=COL_CLOSED, fg=COL_TEXT)
-            return
+            return "closed"
+        if d in self._sel_requests_off:
+            return "off"
+        if (self._sel_unavailable >> i) & 1:
+            return "unavailable"
+        if d == date.today():
+            return "today"
+        if self.state.slot_table.day_type_is_saturday[cal.day_types[i]]:
+            return "sat"
+        return "normal"
+
+    def _restyle_days(self, indices):
+        for i in indices:
+            st = self._day_state(i)
+            if st != self._day_styles[i]:
+                bg, fg = DAY_STATE_COLORS[st]
+                self._day_buttons[i].configure(bg=bg, fg=fg)
+                self._day_styles[i] = st
+
+    def _restyle_all_days(self):
+        """選択スタッフの希望休・定期休を引き直して全日を塗り直す (ウィジェットは再生成しない)。"""
         sid = self._selected_staff_id()
-        if sid and d in self.state.requests_off.get(sid, set()):
-            btn.configure(bg=COL_REQUEST_OFF, fg=COL_TEXT)
-            return
-        if d.weekday() == 5:
-            btn.configure(bg=COL_SAT, fg=COL_TEXT)
-            return
-        btn.configure(bg=COL_PANEL, fg=COL_TEXT)
+        self._sel_requests_off = self.state.requests_off.get(sid, set()) if sid else set()
+        av = self.state.availability.get(sid) if sid else None
+        cal = self._cal
+        self._sel_unavailable = av.unavailable_bits(cal.dates[0], len(cal)) if av else 0
+        self._restyle_days(range(len(self._day_buttons)))
 
     def _selected_staff_id(self) -> str | None:
         sel = self.staff_list.curselection()
         if not sel:
             return None
-        line = self.staff_list.get(sel[0])
-        return line.split("|", 1)[0].strip()
+        return self._list_ids[sel[0]]
 
     def _on_staff_select(self):
         sid = self._selected_staff_id()
@@ -294,21 +705,22 @@ class App(tk.Tk):
             self.is_mgr_var.set(False)
             self.restricted_var.set(False)
         else:
-            s = next((x for x in self.state.staff if x.id == sid), None)
+            s = self.state.staff.get(sid)
             self.sel_staff_var.set(f"{s.id} {s.name}" if s else sid)
             if s:
                 self.staff_id_var.set(s.id)
                 self.staff_name_var.set(s.name)
                 self.is_mgr_var.set(bool(s.is_manager))
                 self.restricted_var.set(bool(s.allowed_kinds))
-        self._rebuild_calendar()
+        self._restyle_all_days()
 
     def _on_day_click(self, d: date):
-        if d.weekday() == 6:
+        i = self._cal.pos(d)
+        if self._cal.day_types[i] == NO_DAY_TYPE:
             return
         sid = self._selected_staff_id()
         if sid is None:
-            if d in self._jp_holidays:
+            if self._cal.holiday[i]:
                 self.status_var.set(f"{d.isoformat()} は祝日のため自動休業です。")
                 return
             if d in self.state.closed_dates:
@@ -321,7 +733,8 @@ class App(tk.Tk):
                 sset.remove(d)
             else:
                 sset.add(d)
-        self._rebuild_calendar()
+            self._sel_requests_off = sset
+        self._restyle_days((i,))
 
     def _upsert_staff(self):
         sid = self.staff_id_var.get().strip()
@@ -331,30 +744,56 @@ class App(tk.Tk):
             return
         is_mgr = bool(self.is_mgr_var.get())
         restricted = bool(self.restricted_var.get())
-        existing = next((i for i, s in enumerate(self.state.staff) if s.id == sid), None)
         allowed = (KIND_WD_A, KIND_SAT_B) if restricted else None
         s = Staff(id=sid, name=name, is_manager=is_mgr, allowed_kinds=allowed)
-        if existing is None:
-            self.state.staff.append(s)
-        else:
-            self.state.staff[existing] = s
-        self._refresh_staff_list()
+        self.state.staff.upsert(s)
+        self._update_staff_row(s)
 
     def _delete_staff(self):
         sid = self._selected_staff_id()
         if not sid:
             return
-        self.state.staff = [s for s in self.state.staff if s.id != sid]
+        self.state.staff.remove(sid)
         self.state.requests_off.pop(sid, None)
-        self._refresh_staff_list()
-        self._rebuild_calendar()
+        self.state.availability.pop(sid, None)
+        i = self._list_ids.index(sid)
+        del self._list_ids[i]
+        self.staff_list.delete(i)
+        self._on_staff_select()
+
+    def _update_staff_row(self, s: Staff):
+        """1人分の行だけ Listbox に反映する (絞り込みに合わなくなった行は消す)。"""
+        visible = self.state.staff.matches(s.id, self.staff_filter_var.get())
+        i = self._list_ids.index(s.id) if s.id in self._list_ids else None
+        if i is not None:
+            selected = i in self.staff_list.curselection()
+            self.staff_list.delete(i)
+            if not visible:
+                del self._list_ids[i]
+                if selected:
+                    self._on_staff_select()
+                return
+            self.staff_list.insert(i, _staff_line(s))
+            if selected:
+                self.staff_list.selection_set(i)
+        elif visible:
+            # 新規なら末尾、絞り込みで隠れていた既存のスタッフなら登録順での位置に入れる
+            position = self.state.staff.position
+            pos = position(s.id)
+            i = next((j for j, sid in enumerate(self._list_ids) if position(sid) > pos), len(self._list_ids))
+            self._list_ids.insert(i, s.id)
+            self.staff_list.insert(i, _staff_line(s))
 
     def _refresh_staff_list(self):
+        """絞り込み条件で一覧を作り直す。選択中のスタッフは見えていれば選択を保つ。"""
+        selected = self._selected_staff_id()
+        shown = self.state.staff.matching(self.staff_filter_var.get())
+        self._list_ids = [s.id for s in shown]
         self.staff_list.delete(0, "end")
-        for s in self.state.staff:
-            tag = "MGR" if s.is_manager else "-"
-            lim = "LIMIT" if s.allowed_kinds else "-"
-            self.staff_list.insert("end", f"{s.id} | {s.name} | {tag} | {lim}")
+        if shown:
+            self.staff_list.insert("end", *[_staff_line(s) for s in shown])  # 1回の呼び出しでまとめて追加
+        if selected is not None and selected in self.state.staff and selected in self._list_ids:
+            self.staff_list.selection_set(self._list_ids.index(selected))
 
     def _load_staff_master(self):
         base = app_base_dir()
@@ -372,15 +811,16 @@ class App(tk.Tk):
                 return
             path = picked
 
-        try:
-            self.status_var.set(f"スタッフ読込中: {path}")
-            with open(path, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-        except Exception as e:
-            messagebox.showerror("読込エラー", f"{path}\n\n{e}")
-            self.status_var.set("スタッフ読込に失敗しました。")
-            return
+        self.status_var.set(f"スタッフ読込中: {path}")
+        self.tasks.submit(
+            "スタッフ読込",
+            GROUP_INPUT,
+            lambda: _read_json(path),
+            lambda raw: self._apply_staff_master(path, raw),
+            lambda e: self._task_failed("スタッフ読込", f"{path}\n\n{e}"),
+        )
 
+    def _apply_staff_master(self, path, raw: dict):
         staff_raw = raw.get("staff")
         if not isinstance(staff_raw, list) or not staff_raw:
             messagebox.showerror("読込エラー", "staff_master.json の staff が不正です。")
@@ -388,7 +828,7 @@ class App(tk.Tk):
             return
 
         try:
-            self.state.staff = [
+            self.state.staff = StaffStore(
                 Staff(
                     id=s["id"],
                     name=s["name"],
@@ -396,9 +836,10 @@ class App(tk.Tk):
                     allowed_kinds=tuple(s["allowed_kinds"]) if s.get("allowed_kinds") else None,
                 )
                 for s in staff_raw
-            ]
-            valid_ids = {s.id for s in self.state.staff}
-            self.state.requests_off = {sid: ds for sid, ds in self.state.requests_off.items() if sid in valid_ids}
+            )
+            staff = self.state.staff
+            self.state.requests_off = {sid: ds for sid, ds in self.state.requests_off.items() if sid in staff}
+            self.state.availability = {sid: av for sid, av in self.state.availability.items() if sid in staff}
             self._refresh_staff_list()
             self._rebuild_calendar()
             self.status_var.set(f"スタッフを読み込みました({len(self.state.staff)}人): {path}")
@@ -410,38 +851,49 @@ class App(tk.Tk):
         path = filedialog.askopenfilename(parent=self, filetypes=[("JSON", "*.json")])
         if not path:
             return
-        with open(path, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-        self._load_from_raw(raw)
+        self.status_var.set(f"JSON読込中: {path}")
+        self.tasks.submit(
+            "JSON読込",
+            GROUP_INPUT,
+            lambda: _read_json(path),
+            self._load_from_raw,
+            lambda e: self._task_failed("JSON読込", f"{path}\n\n{e}"),
+        )
 
     def _load_template(self):
         path = filedialog.askopenfilename(parent=self, filetypes=[("Excel", "*.xlsx")])
         if not path:
             return
-        try:
-            mi = import_from_template_xlsx(path)
-        except Exception as e:
-            messagebox.showerror("読込エラー", str(e))
-            return
-        raw = {
-            "month": mi.month,
-            "auto_close_jp_holidays": mi.auto_close_jp_holidays,
-            "closed_dates": [d.isoformat() for d in mi.closed_dates],
-            "staff": [
-                {"id": s.id, "name": s.name, "is_manager": s.is_manager, "allowed_kinds": list(s.allowed_kinds) if s.allowed_kinds else None}
-                for s in mi.staff
-            ],
-            "requests_off": {sid: [d.isoformat() for d in ds] for sid, ds in mi.requests_off.items()},
-        }
-        self._load_from_raw(raw)
-        self.status_var.set("テンプレから読み込みました。")
+
+        def done(raw: dict):
+            self._load_from_raw(raw)
+            self.status_var.set("テンプレから読み込みました。")
+
+        self.status_var.set(f"テンプレ読込中: {path}")
+        self.tasks.submit(
+            "テンプレ読込",
+            GROUP_INPUT,
+            lambda: month_input_to_dict(import_from_template_xlsx(path)),
+            done,
+            lambda e: self._task_failed("テンプレ読込", str(e)),
+        )
+
+    def _task_failed(self, label: str, message: str):
+        messagebox.showerror("読込エラー" if label.endswith("読込") else "出力エラー", message)
+        self.status_var.set(f"{label}に失敗しました。")
+
+    def _on_tasks_changed(self, running: list[str], pending: list[str]):
+        text = f"処理中: {' / '.join(running)}" if running else ""
+        if pending:
+            text += f" (待機 {len(pending)}件)"
+        self.tasks_var.set(text)
 
     def _load_from_raw(self, raw: dict):
         self.month_var.set(str(raw.get("month", self.month_var.get())))
         self.state.month = self.month_var.get().strip()
         self.state.auto_close_jp_holidays = bool(raw.get("auto_close_jp_holidays", True))
         self.auto_holiday_var.set(self.state.auto_close_jp_holidays)
-        self.state.staff = [
+        self.state.staff = StaffStore(
             Staff(
                 id=s["id"],
                 name=s["name"],
@@ -449,9 +901,12 @@ class App(tk.Tk):
                 allowed_kinds=tuple(s["allowed_kinds"]) if s.get("allowed_kinds") else None,
             )
             for s in raw.get("staff", [])
-        ]
+        )
         self.state.closed_dates = {_parse_date(d) for d in raw.get("closed_dates", [])}
         self.state.requests_off = {sid: {_parse_date(d) for d in ds} for sid, ds in raw.get("requests_off", {}).items()}
+        self.state.availability = {sid: availability_from_raw(a) for sid, a in (raw.get("availability") or {}).items()}
+        slot_raw = raw.get("slot_templates")
+        self.state.slot_table = compile_slot_templates(slot_raw) if slot_raw else DEFAULT_SLOT_TABLE
         self._refresh_staff_list()
         self._rebuild_calendar()
         self.status_var.set("読み込みました。")
@@ -470,9 +925,19 @@ class App(tk.Tk):
             ],
             "requests_off": {sid: sorted(d.isoformat() for d in ds) for sid, ds in self.state.requests_off.items()},
         }
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(raw, f, ensure_ascii=False, indent=2)
-        self.status_var.set("JSONを保存しました。")
+        if self.state.availability:
+            raw["availability"] = {sid: availability_to_raw(av) for sid, av in self.state.availability.items()}
+        if self.state.slot_table is not DEFAULT_SLOT_TABLE:
+            raw["slot_templates"] = self.state.slot_table.to_raw()
+        # 書き出す内容はここで確定させ、書き込みだけを裏で行う
+        self.status_var.set(f"JSON保存中: {path}")
+        self.tasks.submit(
+            "JSON保存",
+            _file_group(path),
+            lambda: _write_json(path, raw),
+            lambda _r: self.status_var.set("JSONを保存しました。"),
+            lambda e: self._task_failed("JSON保存", f"{path}\n\n{e}"),
+        )
 
     def _save_template(self):
         path = filedialog.asksaveasfilename(parent=self, defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")])
@@ -483,8 +948,14 @@ class App(tk.Tk):
         except Exception as e:
             messagebox.showerror("出力エラー", str(e))
             return
-        export_template_xlsx(mi, path)
-        self.status_var.set("テンプレを出力しました。")
+        self.status_var.set(f"テンプレ出力中: {path}")
+        self.tasks.submit(
+            "テンプレ出力",
+            _file_group(path),
+            lambda: export_template_xlsx(mi, path),
+            lambda _r: self.status_var.set("テンプレを出力しました。"),
+            lambda e: self._task_failed("テンプレ出力", f"{path}\n\n{e}"),
+        )
 
     def _make_month_input(self) -> MonthInput:
         month = self.month_var.get().strip()
@@ -500,6 +971,8 @@ class App(tk.Tk):
             requests_off=reqs_off,
             requirements=self.state.requirements,
             auto_close_jp_holidays=bool(self.auto_holiday_var.get()),
+            slot_table=self.state.slot_table,
+            availability=dict(self.state.availability),
         )
 
     def _generate(self):
@@ -510,72 +983,118 @@ class App(tk.Tk):
             return
 
         self.gen_btn.configure(state="disabled")
+        self.stop_btn.configure(state="normal")
         self.status_var.set("生成中...")
+        cancel = threading.Event()
+        self._cancel_event = cancel
+        self._gen_started = time.monotonic()
+        self._latest_progress = None
+        self._shown_progress = None
+
+        def on_progress(p: SolveProgress):
+            # ソルバーのスレッドから呼ばれる。Tk には触らず最新値を置くだけ。
+            self._latest_progress = p
 
         def run():
             try:
-                res = solve(mi)
+                res = solve(mi, progress=on_progress, cancel=cancel)
                 self.after(0, lambda: self._on_generate_done(mi, res, None))
             except SolveError as e:
                 self.after(0, lambda err=e: self._on_generate_done(mi, None, err))
 
         threading.Thread(target=run, daemon=True).start()
+        self.after(PROGRESS_REFRESH_MS, lambda: self._tick_progress(mi, cancel))
+
+    def _stop_generate(self):
+        """探索を打ち切り、その時点の最良解で確定する。"""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+            self.stop_btn.configure(state="disabled")
+            self.status_var.set("確定しています...")
+
+    def _tick_progress(self, mi: MonthInput, cancel: threading.Event):
+        if self._cancel_event is not cancel:
+            return  # 生成は終了済み
+        p = self._latest_progress
+        elapsed = time.monotonic() - self._gen_started
+        if p is None:
+            self.progress_var.set(f"経過 {elapsed:.1f}秒 / 解を探索中")
+        else:
+            phase = "制約緩和" if p.phase == "relaxed" else "厳格"
+            self.progress_var.set(
+                f"経過 {elapsed:.1f}秒 / {phase} / 解 {p.solutions}個 / 目的値 {p.objective:,.0f} (下界 {p.bound:,.0f})"
+            )
+            if p is not self._shown_progress:
+                self._shown_progress = p
+                self._show_preview(mi, p.result.to_matrix(mi), commit=False)
+        self.after(PROGRESS_REFRESH_MS, lambda: self._tick_progress(mi, cancel))
 
     def _on_generate_done(self, mi: MonthInput, res, error: SolveError | None):
         self.gen_btn.configure(state="normal")
+        self.stop_btn.configure(state="disabled")
+        self._cancel_event = None
+        p = self._latest_progress
+        elapsed = time.monotonic() - self._gen_started
+        self.progress_var.set(
+            f"{elapsed:.1f}秒 / 目的値 {p.objective:,.0f} (下界 {p.bound:,.0f})" if p is not None else f"{elapsed:.1f}秒"
+        )
+        if isinstance(error, SolveCancelled):
+            self.status_var.set("生成を中止しました。(解が見つかる前に確定されました)")
+            if self._month_input is not None and self._assignments is not None:
+                self._show_preview(self._month_input, self._assignments, commit=False)
+            return
         if error is not None:
             messagebox.showerror("生成エラー", str(error))
             self.status_var.set("生成に失敗しました。")
             return
+        self._show_result(mi, res)
 
-        self._assignments = res.assignments
+    def _show_result(self, mi: MonthInput, res, note: str = ""):
+        """生成結果を現在の結果として採用し、プレビューとステータスに出す。"""
+        matrix = res.to_matrix(mi)
+        self._assignments = matrix
         self._month_input = mi
-        self.preview.delete(*self.preview.get_children())
-        staff_by_id = mi.staff_by_id()
-        for idx, a in enumerate(res.assignments):
-            d = a.day
-            kind = "土曜" if d.weekday() == 5 else "平日"
-            tags = ["odd" if idx % 2 else "even"]
-            if d.weekday() == 5:
-                tags.append("sat")
-            self.preview.insert(
-                "",
-                "end",
-                values=(
-                    d.isoformat(),
-                    _weekday_jp(d),
-                    kind,
-                    *[(staff_by_id[sid].name if (sid := a.slots.get(slot_name)) else "") for slot_name in SLOT_ORDER],
-                ),
-                tags=tuple(tags),
-            )
-        self.preview.tag_configure("even", background="#FFFFFF")
-        self.preview.tag_configure("odd", background="#FFFBEB")
-        self.preview.tag_configure("sat", background=COL_SAT)
-        # 勤務時間サマリー表示
-        hours_data = compute_hours(mi, res.assignments)
-        header_line = f"{'名前':<10}  {'平日':>3}回×8.5h  {'土曜':>3}回×4.5h  合計"
-        lines = [header_line, "-" * len(header_line)]
-        for _sid, name, _is_mgr, wd, sat, total in hours_data:
-            lines.append(f"{name:<10}  {wd:>3}回       {sat:>3}回      {total:>5.1f}h")
-        self.summary_text.configure(state="normal")
-        self.summary_text.delete("1.0", "end")
-        self.summary_text.insert("end", "\n".join(lines))
-        self.summary_text.configure(state="disabled")
+        self._result = res
+        n_changed = self._show_preview(mi, matrix)
+        changed_note = f" / 前回から {n_changed}セル変更 ({CHANGED_MARK}印)" if n_changed else ""
+        if res.stopped_early:
+            changed_note += " / 途中の最良解で確定"
+        changed_note += note
 
         if res.is_partial:
+            violations = validate_schedule(mi, res.assignments).violations
             self.status_var.set(
-                f"生成完了(制約緩和): {len(res.assignments)}日"
+                f"生成完了(制約緩和): {len(res.assignments)}日 / 違反 {len(violations)}件{changed_note}"
                 " ※土曜上限やマネージャー配置を一部緩和しました。空きスロットは手動で調整してください。"
             )
+            detail = "\n".join(f"・{v.message}" for v in violations[:10])
+            if len(violations) > 10:
+                detail += f"\n…ほか {len(violations) - 10}件"
             messagebox.showwarning(
                 "制約緩和モードで生成",
                 "土曜出勤上限またはマネージャー配置の条件を満たせなかったため、\n"
                 "制約を緩和してシフト表を生成しました。\n\n"
-                "空きになっているスロットは手動で調整してください。",
+                "空きになっているスロットは手動で調整してください。\n\n" + detail,
             )
         else:
-            self.status_var.set(f"生成完了: {len(res.assignments)}日")
+            self.status_var.set(f"生成完了: {len(res.assignments)}日{changed_note}")
+
+    def _open_scenarios(self):
+        try:
+            mi = self._make_month_input()
+        except ValueError as e:
+            messagebox.showerror("シナリオ比較", str(e))
+            return
+        ScenarioDialog(self, mi)
+
+    def _adopt_scenario(self, outcome: ScenarioOutcome):
+        """シナリオの入力を画面の入力に反映し、その結果を生成結果として採用する。"""
+        mi = outcome.month_input
+        self.state.requirements = mi.requirements
+        self.state.closed_dates = set(mi.closed_dates)
+        self.state.requests_off = {sid: set(ds) for sid, ds in mi.requests_off.items() if ds}
+        self._restyle_all_days()
+        self._show_result(mi, outcome.result, note=f" / シナリオ「{outcome.scenario.name}」を採用")
 
     def _export(self):
         if not self._assignments:
@@ -584,11 +1103,253 @@ class App(tk.Tk):
         path = filedialog.asksaveasfilename(parent=self, defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")])
         if not path:
             return
-        mi = self._make_month_input()
-        export_xlsx(mi, self._assignments, path)
-        self.status_var.set("Excelに出力しました。")
+        # 行列はスタッフ番号で保持しているため、生成時の入力と組で出力する
+        mi, matrix = self._month_input, self._assignments
+        self.status_var.set(f"Excel出力中: {path}")
+        self.tasks.submit(
+            "Excel出力",
+            _file_group(path),
+            lambda: export_xlsx(mi, matrix, path),
+            lambda _r: self.status_var.set("Excelに出力しました。"),
+            lambda e: self._task_failed("Excel出力", f"{path}\n\n{e}"),
+        )
+
+    def _save_snapshot(self):
+        if self._result is None:
+            messagebox.showerror("出力エラー", "先に「生成」を実行してください。")
+            return
+        path = filedialog.asksaveasfilename(
+            parent=self, defaultextension=SNAPSHOT_SUFFIX, filetypes=[("shiftgen スナップショット", "*" + SNAPSHOT_SUFFIX)]
+        )
+        if not path:
+            return
+        mi, res = self._month_input, self._result
+        self.status_var.set(f"スナップショット保存中: {path}")
+        self.tasks.submit(
+            "スナップショット保存",
+            _file_group(path),
+            lambda: save_snapshot(path, mi, res),
+            lambda _r: self.status_var.set("スナップショットを保存しました。"),
+            lambda e: self._task_failed("スナップショット保存", f"{path}\n\n{e}"),
+        )
+
+    def _load_snapshot(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=[("shiftgen スナップショット", "*" + SNAPSHOT_SUFFIX)])
+        if not path:
+            return
+
+        def done(snap: Snapshot):
+            # 入力を画面に戻し、保存されていた結果をそのまま生成結果として表示する (解き直さない)
+            mi = snap.month_input
+            self._load_from_raw(month_input_to_dict(mi))
+            self.state.requirements = mi.requirements
+            saved = time.strftime("%Y-%m-%d %H:%M", time.localtime(snap.saved_at))
+            self._show_result(mi, snap.result, note=f" / スナップショット ({saved} 保存) から復元")
+
+        self.status_var.set(f"スナップショット読込中: {path}")
+        self.tasks.submit(
+            "スナップショット読込",
+            GROUP_INPUT,
+            lambda: load_snapshot(path),
+            done,
+            lambda e: self._task_failed("スナップショット読込", f"{path}\n\n{e}"),
+        )
+
+
+def _parse_dates(text: str) -> tuple[date, ...]:
+    """"2026-02-14, 2026-02-21" のような日付の並びを読む。"""
+    return tuple(sorted({_parse_date(t) for t in text.replace(",", " ").split()}))
+
+
+def _parse_requests(text: str) -> dict[str, tuple[date, ...]]:
+    """"S3=2026-02-20,2026-02-21; S4=2026-02-05" のような希望休の指定を読む。"""
+    out: dict[str, tuple[date, ...]] = {}
+    for part in text.split(";"):
+        if not part.strip():
+            continue
+        sid, sep, dates = part.partition("=")
+        if not sep or not sid.strip():
+            raise ValueError(f"希望休は ID=日付,日付 の形式で入力してください: {part.strip()}")
+        out[sid.strip()] = _parse_dates(dates)
+    return out
+
+
+class ScenarioDialog(tk.Toplevel):
+    """現在の入力を元に what-if シナリオを並列に解き、KPI を横並びで比較する。"""
+
+    def __init__(self, app: App, base: MonthInput):
+        super().__init__(app)
+        self.app = app
+        self.base = base
+        self.title(f"シナリオ比較 - {base.month}")
+        self.geometry("980x460")
+        self.configure(bg=COL_BG)
+
+        self._scenarios: list[Scenario] = [BASELINE]
+        self._outcomes: dict[int, ScenarioOutcome] = {}
+        self._running = False
+        self._cancel = threading.Event()  # 閉じたら未着手のシナリオを取りやめる
+        self._closed = False
+
+        form = ttk.Frame(self)
+        form.pack(fill="x", padx=10, pady=(10, 4))
+        self.name_var = tk.StringVar()
+        self.sat_max_var = tk.StringVar()
+        self.close_var = tk.StringVar()
+        self.reopen_var = tk.StringVar()
+        self.requests_var = tk.StringVar()
+        fields = (
+            ("名前", self.name_var, 12),
+            ("土曜上限", self.sat_max_var, 4),
+            ("休業追加", self.close_var, 22),
+            ("休業解除", self.reopen_var, 22),
+            ("希望休追加 (ID=日付,…; …)", self.requests_var, 28),
+        )
+        for col, (label, var, width) in enumerate(fields):
+            ttk.Label(form, text=label).grid(row=0, column=col, sticky="w", padx=(0, 6))
+            ttk.Entry(form, textvariable=var, width=width).grid(row=1, column=col, sticky="w", padx=(0, 6))
+
+        buttons = ttk.Frame(self)
+        buttons.pack(fill="x", padx=10, pady=4)
+        ttk.Button(buttons, text="シナリオ追加", command=self._add_scenario).pack(side="left")
+        ttk.Button(buttons, text="削除", command=self._remove_scenario).pack(side="left", padx=6)
+        self.run_btn = ttk.Button(buttons, text="比較実行", command=self._run)
+        self.run_btn.pack(side="left", padx=6)
+        self.adopt_btn = ttk.Button(buttons, text="選択したシナリオを採用", command=self._adopt)
+        self.adopt_btn.pack(side="left", padx=6)
+        self.status_var = tk.StringVar(value="シナリオを追加して「比較実行」を押してください。")
+        ttk.Label(buttons, textvariable=self.status_var).pack(side="left", padx=10)
+
+        columns = ("name", *[name for name, _label in KPI_LABELS])
+        self.table = ttk.Treeview(self, columns=columns, show="headings", height=10, selectmode="browse")
+        self.table.heading("name", text="シナリオ")
+        self.table.column("name", width=200, anchor="w")
+        for name, label in KPI_LABELS:
+            self.table.heading(name, text=label)
+            self.table.column(name, width=100, anchor="center")
+        self.table.pack(fill="both", expand=True, padx=10, pady=(4, 10))
+        self._render_rows()
+
+    def _add_scenario(self):
+        try:
+            sat_max = self.sat_max_var.get().strip()
+            sc = Scenario(
+                name=self.name_var.get().strip() or f"シナリオ{len(self._scenarios)}",
+                saturday_max_per_person=int(sat_max) if sat_max else None,
+                close_dates=_parse_dates(self.close_var.get()),
+                reopen_dates=_parse_dates(self.reopen_var.get()),
+                requests_off=_parse_requests(self.requests_var.get()),
+            )
+        except ValueError as e:
+            messagebox.showerror("シナリオ追加", str(e), parent=self)
+            return
+        self._scenarios.append(sc)
+        for var in (self.name_var, self.sat_max_var, self.close_var, self.reopen_var, self.requests_var):
+            var.set("")
+        self._render_rows()
+
+    def _remove_scenario(self):
+        i = self._selected_index()
+        if i is None or i == 0 or self._running:
+            return  # 「現在」は比較の基準なので消さない
+        del self._scenarios[i]
+        self._outcomes = {}
+        self._render_rows()
+
+    def _selected_index(self) -> int | None:
+        sel = self.table.selection()
+        return int(sel[0]) if sel else None
+
+    def _run(self):
+        if self._running:
+            return
+        self._running = True
+        self._outcomes = {}
+        self.run_btn.configure(state="disabled")
+        self.status_var.set(f"{len(self._scenarios)}件を並列に生成中...")
+        self._render_rows()
+        scenarios = list(self._scenarios)
+        cancel = self._cancel
+        # 閉じた後も届くので、ダイアログではなくアプリの after で戻し、コールバック側で閉じたか確かめる
+        app = self.app
+
+        def run():
+            try:
+                compare_scenarios(
+                    self.base,
+                    scenarios,
+                    on_done=lambda i, out: app.after(0, lambda: self._on_outcome(i, out)),
+                    cancel=cancel,
+                )
+                app.after(0, lambda: self._on_finished(None))
+            except Exception as e:
+                app.after(0, lambda err=e: self._on_finished(err))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def destroy(self):
+        self._closed = True
+        self._cancel.set()
+        super().destroy()
+
+    def _on_outcome(self, i: int, outcome: ScenarioOutcome):
+        if self._closed:
+            return
+        self._outcomes[i] = outcome
+        self.status_var.set(f"生成中... {len(self._outcomes)} / {len(self._scenarios)}")
+        self._render_rows()
+
+    def _on_finished(self, error: Exception | None):
+        if self._closed:
+            return
+        self._running = False
+        self.run_btn.configure(state="normal")
+        if error is not None:
+            messagebox.showerror("シナリオ比較", str(error), parent=self)
+            self.status_var.set("比較に失敗しました。")
+            return
+        failed = sum(1 for o in self._outcomes.values() if not o.ok)
+        self.status_var.set("比較完了" + (f" (失敗 {failed}件)" if failed else "") + "。括弧内は「現在」との差です。")
+
+    def _render_rows(self):
+        base = self._outcomes.get(0)
+        base_kpis = base.kpis if base is not None else None
+        self.table.delete(*self.table.get_children())
+        for i, sc in enumerate(self._scenarios):
+            out = self._outcomes.get(i)
+            if out is None:
+                cells = ["生成中..." if self._running else "-"] * len(KPI_LABELS)
+            elif not out.ok:
+                cells = [f"失敗: {out.error}"] + [""] * (len(KPI_LABELS) - 1)
+            else:
+                delta = out.kpis.delta(base_kpis) if base_kpis is not None and i else {}
+                cells = [_format_kpi(getattr(out.kpis, name), delta.get(name)) for name, _label in KPI_LABELS]
+            self.table.insert("", "end", iid=str(i), values=(sc.name, *cells))
+
+    def _adopt(self):
+        i = self._selected_index()
+        out = self._outcomes.get(i) if i is not None else None
+        if out is None or not out.ok:
+            messagebox.showerror("シナリオ採用", "生成済みのシナリオを選択してください。", parent=self)
+            return
+        self.app._adopt_scenario(out)
+        self.destroy()
+
+
+def _format_kpi(value: float, delta: float | None) -> str:
+    text = f"{value:.1f}" if isinstance(value, float) else str(value)
+    if not delta:
+        return text
+    return f"{text} ({delta:+.1f})" if isinstance(delta, float) else f"{text} ({delta:+d})"
+
+
+ENV_DEBUG = "SHIFTGEN_DEBUG"  # 1 にすると起動時の読み込み時間などをデバッグログに出す
 
 
 def run_app():
+    if os.environ.get(ENV_DEBUG, "").strip() not in ("", "0"):
+        logging.basicConfig(level=logging.DEBUG, format="%(asctime)s %(name)s: %(message)s")
     app = App()
+    # 画面を出してから、重いモジュール (ortools / openpyxl) を裏で読み込んでおく
+    app.after_idle(start_warm_up)
     app.mainloop()
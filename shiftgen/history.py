@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from .domain import CarryOver, MonthInput
+from .schedule import EMPTY
+from .slots import NO_DAY_TYPE
+from .solver import SolveResult
+
+# 前月までの偏りを何か月分見るか (既定)
+DEFAULT_CARRY_MONTHS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    store TEXT NOT NULL,
+    month TEXT NOT NULL,
+    committed_at REAL NOT NULL,
+    is_partial INTEGER NOT NULL,
+    objective REAL,
+    UNIQUE (store, month)
+);
+CREATE TABLE IF NOT EXISTS shifts (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    staff_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    month TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    saturday INTEGER NOT NULL,
+    hours REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shifts_staff ON shifts (staff_id, day);
+CREATE INDEX IF NOT EXISTS shifts_day ON shifts (day);
+CREATE INDEX IF NOT EXISTS shifts_month ON shifts (month, staff_id);
+CREATE INDEX IF NOT EXISTS shifts_run ON shifts (run_id);
+-- 月×スタッフの集計 (繰越の計算はここだけを読む)
+CREATE TABLE IF NOT EXISTS staff_months (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    store TEXT NOT NULL,
+    month TEXT NOT NULL,
+    staff_id TEXT NOT NULL,
+    workdays INTEGER NOT NULL,
+    saturdays INTEGER NOT NULL,
+    hours REAL NOT NULL,
+    PRIMARY KEY (store, month, staff_id)
+);
+CREATE INDEX IF NOT EXISTS staff_months_staff ON staff_months (staff_id, store, month);
+"""
+
+
+@dataclass(frozen=True)
+class StaffTotals:
+    staff_id: str
+    months: int  # 記録のある月数
+    workdays: int
+    saturdays: int
+    hours: float
+
+
+def _month_add(month: str, n: int) -> str:
+    y, m = (int(v) for v in month.split("-"))
+    k = y * 12 + (m - 1) + n
+    return f"{k // 12:04d}-{k % 12 + 1:02d}"
+
+
+class ScheduleHistory:
+    """
+    SQLite store of committed schedules, one run per (store, month).
+
+    Every assigned cell is kept in `shifts` (indexed by staff, day and
+    month) and a per-staff monthly summary in `staff_months`, so trailing
+    totals and carry-over offsets are a single indexed query. Recording a
+    month again replaces the earlier run for that store and month.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "ScheduleHistory":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --- 記録 ---
+
+    def record(self, mi: MonthInput, result: SolveResult, store: str = "") -> int:
+        """確定した結果を記録し、run id を返す。"""
+        matrix = result.to_matrix(mi)
+        cal = mi.calendar
+        table = mi.slot_table
+        staff_ids = matrix.staff_ids
+        n_staff = len(staff_ids)
+        workdays = [0] * n_staff
+        saturdays = [0] * n_staff
+        hours = [0.0] * n_staff
+        rows = []
+        for di, ci in enumerate(cal.positions(matrix.days)):
+            dt = cal.day_types[ci]
+            if dt == NO_DAY_TYPE:  # 定休日の曜日 (結果とテンプレが食い違っている)。集計と同じく飛ばす
+                continue
+            is_sat = table.day_type_is_saturday[dt]
+            h = table.day_type_hours[dt]
+            iso = cal.iso[ci]
+            for si, p in enumerate(matrix.day_row(di)):
+                if p == EMPTY:
+                    continue
+                workdays[p] += 1
+                saturdays[p] += is_sat
+                hours[p] += h
+                rows.append(
+                    (staff_ids[p], iso, mi.month, table.slot_names[si], table.kind_names[table.slot_kind[si]], is_sat, h)
+                )
+
+        stats = result.stats
+        with self._conn:
+            self._conn.execute("DELETE FROM runs WHERE store = ? AND month = ?", (store, mi.month))
+            run_id = self._conn.execute(
+                "INSERT INTO runs (store, month, committed_at, is_partial, objective) VALUES (?, ?, ?, ?, ?)",
+                (store, mi.month, time.time(), result.is_partial, stats.objective if stats is not None else None),
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO shifts (run_id, staff_id, day, month, slot, kind, saturday, hours)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((run_id, *r) for r in rows),
+            )
+            self._conn.executemany(
+                "INSERT INTO staff_months (run_id, store, month, staff_id, workdays, saturdays, hours)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((run_id, store, mi.month, sid, workdays[p], saturdays[p], hours[p]) for p, sid in enumerate(staff_ids)),
+            )
+        return run_id
+
+    # --- 参照 ---
+
+    def months(self, store: str = "") -> list[str]:
+        rows = self._conn.execute("SELECT month FROM runs WHERE store = ? ORDER BY month", (store,))
+        return [m for (m,) in rows]
+
+    def trailing_totals(
+        self, month: str, months: int = DEFAULT_CARRY_MONTHS, store: str = "", staff_ids: Iterable[str] | None = None
+    ) -> dict[str, StaffTotals]:
+        """month の直前 months か月 (month 自体は含まない) のスタッフ別合計。"""
+        first = _month_add(month, -months)
+        rows = self._conn.execute(
+            "SELECT staff_id, COUNT(*), SUM(workdays), SUM(saturdays), SUM(hours) FROM staff_months"
+            " WHERE store = ? AND month >= ? AND month < ? GROUP BY staff_id",
+            (store, first, month),
+        )
+        wanted = set(staff_ids) if staff_ids is not None else None
+        return {
+            sid: StaffTotals(sid, n, w, s, h) for sid, n, w, s, h in rows if wanted is None or sid in wanted
+        }
+
+    def saturday_counts(self, month: str, months: int = DEFAULT_CARRY_MONTHS, store: str = "") -> dict[str, list[int]]:
+        """直前 months か月の土曜勤務回数を、スタッフ別に古い月から並べて返す (記録の無い月は0)。"""
+        first = _month_add(month, -months)
+        order = [_month_add(first, i) for i in range(months)]
+        pos = {m: i for i, m in enumerate(order)}
+        out: dict[str, list[int]] = {}
+        rows = self._conn.execute(
+            "SELECT staff_id, month, saturdays FROM staff_months WHERE store = ? AND month >= ? AND month < ?",
+            (store, first, month),
+        )
+        for sid, m, n in rows:
+            out.setdefault(sid, [0] * months)[pos[m]] = n
+        return out
+
+    def shifts(self, staff_id: str, first_day: str | None = None, last_day: str | None = None) -> Iterator[tuple]:
+        """1人分の勤務 (day, store, slot, kind, hours) を日付順に返す。"""
+        sql = (
+            "SELECT s.day, r.store, s.slot, s.kind, s.hours FROM shifts s JOIN runs r ON r.id = s.run_id"
+            " WHERE s.staff_id = ? AND s.day >= ? AND s.day <= ? ORDER BY s.day"
+        )
+        yield from self._conn.execute(sql, (staff_id, first_day or "", last_day or "9999"))
+
+    def carry_over(self, mi: MonthInput, months: int = DEFAULT_CARRY_MONTHS, store: str = "") -> dict[str, CarryOver]:
+        """
+        Carry-over offsets for mi's staff from the `months` months before
+        mi.month: each member's monthly average of work days and Saturdays
+        minus the team's, rounded. Staff without history are left out (0).
+        """
+        totals = self.trailing_totals(mi.month, months, store, staff_ids=[s.id for s in mi.staff])
+        return carry_over_from_totals(totals.values())
+
+
+def carry_over_from_totals(totals: Iterable[StaffTotals]) -> dict[str, CarryOver]:
+    totals = [t for t in totals if t.months]
+    if not totals:
+        return {}
+    per_days = {t.staff_id: t.workdays / t.months for t in totals}
+    per_sat = {t.staff_id: t.saturdays / t.months for t in totals}
+    mean_days = sum(per_days.values()) / len(totals)
+    mean_sat = sum(per_sat.values()) / len(totals)
+    out = {}
+    for t in totals:
+        c = CarryOver(
+            workdays=round(per_days[t.staff_id] - mean_days), saturdays=round(per_sat[t.staff_id] - mean_sat)
+        )
+        if c != CarryOver():
+            out[t.staff_id] = c
+    return out
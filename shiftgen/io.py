@@ -1,48 +1,442 @@
 from __future__ import annotations
 
 import json
+import re
+from dataclasses import dataclass
 from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Iterator, Mapping
 
-from .domain import MonthInput, Requirements, Staff
+from .availability import availability_from_raw, availability_to_raw
+from .domain import CarryOver, MonthInput, Requirements, Staff
+from .slots import DEFAULT_SLOT_TABLE, compile_slot_templates
 
+try:  # 入っていれば速い方を使う (無くても動く)
+    import orjson as _orjson
+except ModuleNotFoundError:
+    _orjson = None
 
-def _parse_date(d: str) -> date:
-    y, m, dd = d.split("-")
-    return date(int(y), int(m), int(dd))
+# 公開スキーマ (JSON Schema draft 2020-12 の一部のキーワードだけを使う)
+SCHEMA_PATH = Path(__file__).resolve().parent / "month_input.schema.json"
 
+_BOM = b"\xef\xbb\xbf"
+# 複数件のファイルを読むときの1回の読込量 (1件がこれより大きければ読み足す)
+READ_CHUNK = 1 << 20
 
-def load_month_input_json(path: str) -> MonthInput:
-    with open(path, "r", encoding="utf-8") as f:
-        raw = json.load(f)
-
-    staff = tuple(
-        Staff(
-            id=s["id"],
-            name=s["name"],
-            is_manager=bool(s.get("is_manager", False)),
-            allowed_kinds=tuple(s["allowed_kinds"]) if s.get("allowed_kinds") else None,
+
+@dataclass(frozen=True)
+class JsonIssue:
+    path: str  # "$.staff[3].id" の形式。複数件のファイルでは "$[2].staff[3].id"
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.path}: {self.message}"
+
+
+class MonthInputJsonError(ValueError):
+    """入力 JSON の問題を、場所 (JSON パス) 付きですべてまとめて送出する。"""
+
+    MAX_LISTED = 20
+
+    def __init__(self, issues: Iterable[JsonIssue]):
+        self.issues = tuple(issues)
+        lines = [f"入力 JSON に {len(self.issues)} 件の問題があります。"]
+        lines += [f"・{i}" for i in self.issues[: self.MAX_LISTED]]
+        if len(self.issues) > self.MAX_LISTED:
+            lines.append(f"…ほか {len(self.issues) - self.MAX_LISTED}件")
+        super().__init__("\n".join(lines))
+
+
+# --- JSON の読込 ---
+
+
+def loads(data: bytes | str) -> Any:
+    """orjson があればそれで、無ければ標準の json で解析する。"""
+    if isinstance(data, bytes) and data.startswith(_BOM):
+        data = data[len(_BOM) :]
+    if _orjson is not None:
+        return _orjson.loads(data)
+    return json.loads(data)
+
+
+def read_json(path: str) -> Any:
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+# --- スキーマ検証 ---
+
+
+@lru_cache(maxsize=1)
+def month_input_schema() -> dict[str, Any]:
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+_TYPE_NAMES = {
+    "object": "オブジェクト",
+    "array": "配列",
+    "string": "文字列",
+    "integer": "整数",
+    "number": "数値",
+    "boolean": "true/false",
+    "null": "null",
+}
+
+
+# デコード済みの JSON の値は正確にこれらの型になる (type() で引くので bool が int と混ざらない)
+_JSON_TYPES = {dict: "object", list: "array", str: "string", int: "integer", float: "number", bool: "boolean", type(None): "null"}
+
+
+def _type_of(v: Any) -> str:
+    return _JSON_TYPES.get(type(v), "object")
+
+
+def _key_path(base: str, key: str) -> str:
+    return f"{base}.{key}" if key.isidentifier() else f"{base}[{json.dumps(key, ensure_ascii=False)}]"
+
+
+_Checker = Callable[[Any, str, list], None]
+
+
+def _compile(schema: Mapping[str, Any], root: Mapping[str, Any], refs: dict[str, _Checker]) -> _Checker:
+    """
+    Turn a schema node into a checking function, once. Validating then costs
+    one closure call per JSON value instead of re-reading the schema dicts.
+    """
+    ref = schema.get("$ref")
+    if ref is not None:
+        if ref not in refs:
+            node: Any = root
+            for part in ref.removeprefix("#/").split("/"):
+                node = node[part]
+            refs[ref] = _compile(node, root, refs)
+        return refs[ref]
+
+    allowed = schema.get("type")
+    if allowed is not None:
+        allowed = (allowed,) if isinstance(allowed, str) else tuple(allowed)
+        ok_types = set(allowed) | ({"integer"} if "number" in allowed else set())
+        want = " / ".join(_TYPE_NAMES[a] for a in allowed)
+    else:
+        ok_types = None
+        want = ""
+
+    min_length = schema.get("minLength", 0)
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+    minimum = schema.get("minimum")
+    maximum = schema.get("maximum")
+    min_items = schema.get("minItems", 0)
+    items = _compile(schema["items"], root, refs) if "items" in schema else None
+    required = tuple(schema.get("required", ()))
+    props = {k: _compile(v, root, refs) for k, v in schema.get("properties", {}).items()}
+    extra = schema.get("additionalProperties", True)
+    extra_check = _compile(extra, root, refs) if isinstance(extra, Mapping) else None
+
+    def check(value: Any, path: str, issues: list[JsonIssue]) -> None:
+        t = _type_of(value)
+        if ok_types is not None and t not in ok_types:
+            issues.append(JsonIssue(path, f"{want}で指定してください (実際は{_TYPE_NAMES[t]})。"))
+            return
+        if t == "string":
+            if len(value) < min_length:
+                issues.append(JsonIssue(path, "空にできません。"))
+            if pattern is not None and not pattern.search(value):
+                issues.append(JsonIssue(path, f"形式が不正です: {value!r}"))
+        elif t == "integer" or t == "number":
+            if minimum is not None and value < minimum:
+                issues.append(JsonIssue(path, f"{minimum} 以上で指定してください: {value}"))
+            if maximum is not None and value > maximum:
+                issues.append(JsonIssue(path, f"{maximum} 以下で指定してください: {value}"))
+        elif t == "array":
+            if len(value) < min_items:
+                issues.append(JsonIssue(path, f"{min_items} 件以上必要です。"))
+            if items is not None:
+                for i, v in enumerate(value):
+                    items(v, f"{path}[{i}]", issues)
+        elif t == "object":
+            for key in required:
+                if key not in value:
+                    issues.append(JsonIssue(_key_path(path, key), "必須の項目がありません。"))
+            for key, v in value.items():
+                sub = props.get(key)
+                if sub is None:
+                    if extra is False:
+                        issues.append(JsonIssue(_key_path(path, key), "未知の項目です。"))
+                        continue
+                    sub = extra_check
+                    if sub is None:
+                        continue
+                sub(v, _key_path(path, key), issues)
+
+    return check
+
+
+@lru_cache(maxsize=1)
+def _month_input_checker() -> _Checker:
+    schema = month_input_schema()
+    return _compile(schema, schema, {})
+
+
+def validate_month_input_raw(raw: Any, path: str = "$") -> list[JsonIssue]:
+    """raw を公開スキーマで検証し、問題の一覧を返す (問題が無ければ空)。"""
+    issues: list[JsonIssue] = []
+    _month_input_checker()(raw, path, issues)
+    return issues
+
+
+# --- MonthInput との変換 ---
+
+
+def _dates(values: list[str], path: str, issues: list[JsonIssue]) -> tuple[date, ...]:
+    """日付文字列の並びをまとめて変換する。失敗したときだけ1件ずつ見て場所を特定する。"""
+    try:
+        return tuple(map(date.fromisoformat, values))
+    except ValueError:
+        pass
+    out = []
+    for i, s in enumerate(values):
+        try:
+            out.append(date.fromisoformat(s))
+        except ValueError:
+            issues.append(JsonIssue(f"{path}[{i}]", f"存在しない日付です: {s}"))
+    return tuple(out)
+
+
+def month_input_from_dict(raw: Any, path: str = "$") -> MonthInput:
+    """
+    Build a MonthInput from a decoded JSON document. The document is checked
+    against the published schema first, then for the cross-field rules the
+    schema cannot express (unknown staff ids, unknown shift kinds, invalid
+    dates, slot template errors). Every problem found is reported at once as
+    a MonthInputJsonError whose issues carry JSON paths under `path`.
+    """
+    issues = validate_month_input_raw(raw, path)
+    if issues:
+        raise MonthInputJsonError(issues)
+
+    slot_table = DEFAULT_SLOT_TABLE
+    slots_ok = True  # 枠定義が壊れているときは allowed_kinds を照合しない
+    if raw.get("slot_templates"):
+        try:
+            slot_table = compile_slot_templates(raw["slot_templates"])
+        except ValueError as e:
+            issues.append(JsonIssue(f"{path}.slot_templates", str(e)))
+            slots_ok = False
+
+    staff: list[Staff] = []
+    seen: set[str] = set()
+    for i, s in enumerate(raw["staff"]):
+        if s["id"] in seen:
+            issues.append(JsonIssue(f"{path}.staff[{i}].id", f"staff id が重複しています: {s['id']}"))
+        seen.add(s["id"])
+        kinds = s.get("allowed_kinds")
+        for j, k in enumerate(kinds or ()):
+            if slots_ok and k not in slot_table.kind_index:
+                issues.append(JsonIssue(f"{path}.staff[{i}].allowed_kinds[{j}]", f"未知のシフト種別です: {k}"))
+        staff.append(
+            Staff(id=s["id"], name=s["name"], is_manager=s.get("is_manager", False), allowed_kinds=tuple(kinds) if kinds else None)
         )
-        for s in raw["staff"]
-    )
-    closed_dates = tuple(_parse_date(d) for d in raw.get("closed_dates", []))
 
-    requests_off_raw = raw.get("requests_off", {})
+    closed_dates = _dates(raw.get("closed_dates", []), f"{path}.closed_dates", issues)
+
     requests_off: dict[str, tuple[date, ...]] = {}
-    for staff_id, dates in requests_off_raw.items():
-        requests_off[staff_id] = tuple(_parse_date(d) for d in dates)
+    for sid, ds in raw.get("requests_off", {}).items():
+        at = _key_path(f"{path}.requests_off", sid)
+        if sid not in seen:
+            issues.append(JsonIssue(at, f"未知の staff id です: {sid}"))
+        requests_off[sid] = _dates(ds, at, issues)
 
-    req_raw = raw.get("requirements") or {}
-    requirements = Requirements(
-        saturday_max_per_person=int(req_raw.get("saturday_max_per_person", 3)),
-        prefer_max_headcount=bool(req_raw.get("prefer_max_headcount", True)),
-    )
+    availability = {}
+    for sid, a in (raw.get("availability") or {}).items():
+        at = _key_path(f"{path}.availability", sid)
+        if sid not in seen:
+            issues.append(JsonIssue(at, f"未知の staff id です: {sid}"))
+        try:
+            availability[sid] = availability_from_raw(a)
+        except ValueError as e:
+            issues.append(JsonIssue(at, str(e)))
+
+    carry_over = {}
+    for sid, c in (raw.get("carry_over") or {}).items():
+        if sid not in seen:
+            issues.append(JsonIssue(_key_path(f"{path}.carry_over", sid), f"未知の staff id です: {sid}"))
+        carry_over[sid] = CarryOver(**c)
 
+    if issues:
+        raise MonthInputJsonError(issues)
+
+    req_raw = raw.get("requirements") or {}
     return MonthInput(
-        month=str(raw["month"]),
-        staff=staff,
+        month=raw["month"],
+        staff=tuple(staff),
         closed_dates=closed_dates,
         requests_off=requests_off,
-        requirements=requirements,
-        auto_close_jp_holidays=bool(raw.get("auto_close_jp_holidays", True)),
+        requirements=Requirements(
+            saturday_max_per_person=req_raw.get("saturday_max_per_person", 3),
+            prefer_max_headcount=req_raw.get("prefer_max_headcount", True),
+        ),
+        auto_close_jp_holidays=raw.get("auto_close_jp_holidays", True),
+        slot_table=slot_table,
+        availability=availability,
+        carry_over=carry_over,
     )
 
+
+def month_input_to_dict(mi: MonthInput) -> dict[str, Any]:
+    """MonthInput を load_month_input_json で読み戻せる形式にする。"""
+    raw: dict[str, Any] = {
+        "month": mi.month,
+        "auto_close_jp_holidays": mi.auto_close_jp_holidays,
+        "closed_dates": [d.isoformat() for d in mi.closed_dates],
+        "staff": [
+            {"id": s.id, "name": s.name, "is_manager": s.is_manager, "allowed_kinds": list(s.allowed_kinds) if s.allowed_kinds else None}
+            for s in mi.staff
+        ],
+        "requests_off": {sid: [d.isoformat() for d in ds] for sid, ds in mi.requests_off.items()},
+        "availability": {sid: availability_to_raw(av) for sid, av in mi.availability.items()},
+        "requirements": {
+            "saturday_max_per_person": mi.requirements.saturday_max_per_person,
+            "prefer_max_headcount": mi.requirements.prefer_max_headcount,
+        },
+    }
+    if mi.slot_table is not DEFAULT_SLOT_TABLE:
+        raw["slot_templates"] = mi.slot_table.to_raw()
+    if mi.carry_over:
+        raw["carry_over"] = {sid: {"workdays": c.workdays, "saturdays": c.saturdays} for sid, c in mi.carry_over.items()}
+    return raw
+
+
+def load_month_input_json(path: str) -> MonthInput:
+    try:
+        raw = read_json(path)
+    except ValueError as e:  # json / orjson の JSONDecodeError
+        raise MonthInputJsonError([JsonIssue("$", f"JSON として読めません: {e}")]) from e
+    return month_input_from_dict(raw)
+
+
+# --- 複数件のファイル ---
+
+
+_decoder = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+class _TextStream:
+    """raw_decode で値を1つずつ取り出すための、読み足し可能なバッファ。"""
+
+    def __init__(self, f: IO[str]):
+        self._f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """バッファを読み足す。ファイル末尾なら False。"""
+        if self.eof:
+            return False
+        chunk = self._f.read(max(READ_CHUNK, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """空白を読み飛ばし、次の文字を返す (末尾なら "")。"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def value(self) -> Any:
+        self.peek()  # raw_decode は先頭の空白を読み飛ばさない
+        while True:
+            try:
+                v, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():  # 値の途中で切れているだけなら読み足して再試行
+                    continue
+                raise
+            self.pos = end
+            return v
+
+
+def _iter_json_lines(f: IO[str]) -> Iterator[tuple[int, Any]] | None:
+    """1行1件の形式なら行ごとに解析して返す。1行目が単独で読めなければ None。"""
+    first = ""
+    first_no = 0
+    for first_no, line in enumerate(f, start=1):
+        if line.strip():
+            first = line
+            break
+    try:
+        head = loads(first.encode("utf-8"))
+    except ValueError:
+        return None
+
+    def gen() -> Iterator[tuple[int, Any]]:
+        yield first_no, head
+        for no, line in enumerate(f, start=first_no + 1):
+            if not line.strip():
+                continue
+            try:
+                yield no, loads(line.encode("utf-8"))
+            except ValueError as e:
+                raise MonthInputJsonError([JsonIssue("$", f"{no}行目を JSON として読めません: {e}")]) from e
+
+    return gen()
+
+
+def iter_month_input_documents(path: str) -> Iterator[Any]:
+    """
+    Yield the raw documents of a multi-input file one at a time: a JSON
+    array of objects, JSON Lines (one object per line), or one or more
+    concatenated objects. Only the current document is held in memory.
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        stream = _TextStream(f)
+        c = stream.peek()
+        if c == "":
+            return
+        try:
+            if c == "[":
+                stream.pos += 1
+                if stream.peek() == "]":
+                    return
+                while True:
+                    yield stream.value()
+                    c = stream.peek()
+                    if c == "]":
+                        return
+                    if c != ",":
+                        raise json.JSONDecodeError("',' か ']' が必要です", stream.buf, stream.pos)
+                    stream.pos += 1
+            # 1行目が単独で読めれば JSON Lines (1行だけのオブジェクトも含む)、読めなければ整形済みの JSON とみなす
+            f.seek(0)
+            lines = _iter_json_lines(f)
+            if lines is not None:
+                for _no, raw in lines:
+                    yield raw
+                return
+            f.seek(0)
+            stream = _TextStream(f)
+            while stream.peek():
+                yield stream.value()
+        except json.JSONDecodeError as e:
+            raise MonthInputJsonError([JsonIssue("$", f"JSON として読めません: {e}")]) from e
+
+
+def iter_month_inputs_json(path: str) -> Iterator[MonthInput]:
+    """
+    Lazily load many MonthInputs from one file (JSON array, JSON Lines or a
+    single object). Each document is validated as it is reached; a bad one
+    raises MonthInputJsonError with paths prefixed by its position ("$[2]").
+    """
+    for i, raw in enumerate(iter_month_input_documents(path)):
+        yield month_input_from_dict(raw, path=f"$[{i}]")
@@ -1,35 +1,59 @@
 from __future__ import annotations
 
-from datetime import date
+import json
+import threading
+from datetime import date, timedelta
+from pathlib import Path
 
+# 事前計算済みの祝日表 (python -m shiftgen.jp_holidays で再生成)
+TABLE_PATH = Path(__file__).resolve().parent / "jp_holidays_table.json"
 
-def jp_holidays_in_month(month: str) -> dict[date, str]:
+_cache: dict[int, dict[date, str]] = {}
+_cache_lock = threading.Lock()
+_table: dict[int, dict[date, str]] | None = None
+
+
+def _load_table() -> dict[int, dict[date, str]]:
+    """Bundled table as {year: {date: name}}; empty if the file is missing or broken."""
+    global _table
+    if _table is None:
+        table: dict[int, dict[date, str]] = {}
+        try:
+            with open(TABLE_PATH, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            first, last = raw["years"]
+            for y in range(int(first), int(last) + 1):
+                table[y] = {}
+            for iso, name in raw["holidays"].items():
+                d = date.fromisoformat(iso)
+                table.setdefault(d.year, {})[d] = str(name)
+        except Exception:
+            table = {}
+        _table = table
+    return _table
+
+
+def _holidays_from_library(year: int) -> dict[date, str]:
     """
-    Returns {holiday_date: holiday_name} for Japan public holidays in the given YYYY-MM.
+    Returns {holiday_date: holiday_name} for the given year.
     Prefers `jpholiday` if installed; falls back to `holidays` if available.
     """
-    year_s, mon_s = month.split("-")
-    year = int(year_s)
-    mon = int(mon_s)
-
     try:
         import jpholiday  # type: ignore
 
         out: dict[date, str] = {}
-        mh = getattr(jpholiday, "month_holidays", None)
-        if callable(mh):
-            for d, name in mh(year, mon):
+        yh = getattr(jpholiday, "year_holidays", None)
+        if callable(yh):
+            for d, name in yh(year):
                 out[d] = str(name)
             return out
 
-        from calendar import monthrange
-
-        last = monthrange(year, mon)[1]
-        for day in range(1, last + 1):
-            d = date(year, mon, day)
+        d = date(year, 1, 1)
+        while d.year == year:
             name = jpholiday.is_holiday_name(d)
             if name:
                 out[d] = str(name)
+            d += timedelta(days=1)
         return out
     except Exception:
         pass
@@ -38,11 +62,63 @@ def jp_holidays_in_month(month: str) -> dict[date, str]:
         import holidays  # type: ignore
 
         jp = holidays.JP(years=[year])
-        out = {}
-        for d, name in jp.items():
-            if isinstance(d, date) and d.year == year and d.month == mon:
-                out[d] = str(name)
-        return out
+        return {d: str(name) for d, name in jp.items() if isinstance(d, date) and d.year == year}
     except Exception:
         return {}
 
+
+def holidays_in_year(year: int) -> dict[date, str]:
+    """
+    Returns {holiday_date: holiday_name} for Japan public holidays in `year`.
+
+    Looked up once per year and cached in-process. Years covered by the
+    bundled table never touch the third-party libraries.
+    """
+    hit = _cache.get(year)
+    if hit is not None:
+        return hit
+    with _cache_lock:
+        hit = _cache.get(year)
+        if hit is None:
+            table = _load_table()
+            hit = table[year] if year in table else _holidays_from_library(year)
+            _cache[year] = hit
+    return hit
+
+
+def holidays_in_range(start: date, end_inclusive: date) -> dict[date, str]:
+    out: dict[date, str] = {}
+    for year in range(start.year, end_inclusive.year + 1):
+        for d, name in holidays_in_year(year).items():
+            if start <= d <= end_inclusive:
+                out[d] = name
+    return out
+
+
+def jp_holidays_in_month(month: str) -> dict[date, str]:
+    """
+    Returns {holiday_date: holiday_name} for Japan public holidays in the given YYYY-MM.
+    """
+    year_s, mon_s = month.split("-")
+    year = int(year_s)
+    mon = int(mon_s)
+    return {d: name for d, name in holidays_in_year(year).items() if d.month == mon}
+
+
+def build_holiday_table(path: str | Path = TABLE_PATH, first_year: int = 2000, last_year: int = 2050) -> int:
+    """祝日ライブラリから祝日表を生成して書き出す。書き出した祝日の件数を返す。"""
+    holidays: dict[str, str] = {}
+    for y in range(first_year, last_year + 1):
+        got = _holidays_from_library(y)
+        if not got:
+            raise RuntimeError("jpholiday / holidays が見つかりません。祝日表を生成できません。")
+        for d in sorted(got):
+            holidays[d.isoformat()] = got[d]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"years": [first_year, last_year], "holidays": holidays}, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+    return len(holidays)
+
+
+if __name__ == "__main__":
+    print(f"{build_holiday_table()} holidays -> {TABLE_PATH}")
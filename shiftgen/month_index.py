@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Mapping
+
+
+if TYPE_CHECKING:
+    from .domain import MonthInput, Staff
+
+
+@dataclass(frozen=True)
+class MonthIndex:
+    """
+    Immutable lookup tables derived once from a MonthInput.
+
+    Day sets are int bitsets over the days of the month (bit `day - 1`), and
+    staff sets are bitsets over staff positions, so eligibility checks are a
+    shift and a mask instead of set/dict construction. Obtain it through
+    `MonthInput.index`, which caches it on the input.
+    """
+
+    first_day: date
+    n_days: int
+    staff_ids: tuple[str, ...]
+    staff_pos: Mapping[str, int]
+    staff_by_id: Mapping[str, "Staff"]
+    off_bits: tuple[int, ...]  # スタッフごとの希望休 + 定期的な勤務不可日 (日ビット)
+    kind_masks: tuple[int, ...]  # スタッフごとの勤務可能な kind (slot_table.kind_index のビット)
+    manager_mask: int  # マネージャーのスタッフ位置ビット
+    holiday_mask: int
+    closed_mask: int
+    open_mask: int  # 営業日 (日種別あり・祝日休業でない・臨時休業でない)
+    unknown_request_ids: tuple[str, ...]  # requests_off / availability に現れた未登録の staff id
+    invalid_kinds: tuple[tuple[str, str], ...]  # (staff_id, kind) 未知のシフト種別
+
+    @staticmethod
+    def day_bit(d: date) -> int:
+        return 1 << (d.day - 1)
+
+    def date_of(self, day_no: int) -> date:
+        return self.first_day + timedelta(days=day_no - 1)
+
+    def is_open(self, d: date) -> bool:
+        return bool(self.open_mask & self.day_bit(d))
+
+    def is_off(self, p: int, d: date) -> bool:
+        return bool(self.off_bits[p] & self.day_bit(d))
+
+    def allows_kind(self, p: int, kind_id: int) -> bool:
+        return bool((self.kind_masks[p] >> kind_id) & 1)
+
+    def is_manager(self, p: int) -> bool:
+        return bool((self.manager_mask >> p) & 1)
+
+    def open_days(self) -> list[date]:
+        return [self.date_of(i + 1) for i in range(self.n_days) if (self.open_mask >> i) & 1]
+
+
+def _mask_bits(flags) -> int:
+    mask = 0
+    for i, f in enumerate(flags):
+        if f:
+            mask |= 1 << i
+    return mask
+
+
+def _bits_of(dates, first_day: date, n_days: int) -> int:
+    mask = 0
+    for d in dates:
+        off = (d - first_day).days
+        if 0 <= off < n_days:
+            mask |= 1 << off
+    return mask
+
+
+def build_month_index(mi: "MonthInput") -> MonthIndex:
+    cal = mi.calendar
+    start = cal.dates[0]
+    n_days = len(cal)
+    table = mi.slot_table
+
+    staff_ids = tuple(s.id for s in mi.staff)
+    staff_pos = {sid: p for p, sid in enumerate(staff_ids)}
+
+    off_bits = [0] * len(staff_ids)
+    unknown: list[str] = []
+    for sid, offs in mi.requests_off.items():
+        p = staff_pos.get(sid)
+        if p is None:
+            unknown.append(sid)
+            continue
+        off_bits[p] |= _bits_of(offs, start, n_days)
+    for sid, av in mi.availability.items():
+        p = staff_pos.get(sid)
+        if p is None:
+            unknown.append(sid)
+            continue
+        off_bits[p] |= av.unavailable_bits(start, n_days)
+
+    all_kinds = (1 << len(table.kind_names)) - 1
+    kind_masks: list[int] = []
+    invalid: list[tuple[str, str]] = []
+    manager_mask = 0
+    for p, s in enumerate(mi.staff):
+        if s.is_manager:
+            manager_mask |= 1 << p
+        if not s.allowed_kinds:
+            kind_masks.append(all_kinds)
+            continue
+        mask = 0
+        for k in s.allowed_kinds:
+            ki = table.kind_index.get(k)
+            if ki is None:
+                invalid.append((s.id, k))
+            else:
+                mask |= 1 << ki
+        kind_masks.append(mask)
+
+    holiday_mask = _mask_bits(cal.holiday)
+    closed_mask = _mask_bits(cal.closed)
+    open_mask = _mask_bits(cal.open)
+
+    return MonthIndex(
+        first_day=start,
+        n_days=n_days,
+        staff_ids=staff_ids,
+        staff_pos=MappingProxyType(staff_pos),
+        staff_by_id=MappingProxyType({s.id: s for s in mi.staff}),
+        off_bits=tuple(off_bits),
+        kind_masks=tuple(kind_masks),
+        manager_mask=manager_mask,
+        holiday_mask=holiday_mask,
+        closed_mask=closed_mask,
+        open_mask=open_mask,
+        unknown_request_ids=tuple(unknown),
+        invalid_kinds=tuple(invalid),
+    )
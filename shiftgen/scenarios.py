@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from datetime import date
+from typing import Callable, Mapping, Sequence
+
+from .cpu_budget import CpuBudget, default_budget
+from .domain import MonthInput
+from .excel import compute_hours
+from .solver import SolveError, SolveResult, solve
+from .validate import validate_schedule
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    A what-if variant of a MonthInput. Fields left at None / empty keep the
+    base input's value; dates and requests are added on top of the base.
+    """
+
+    name: str
+    saturday_max_per_person: int | None = None
+    close_dates: tuple[date, ...] = ()  # 臨時休業を追加
+    reopen_dates: tuple[date, ...] = ()  # 臨時休業を取り消す (祝日の自動休業は対象外)
+    requests_off: Mapping[str, tuple[date, ...]] = field(default_factory=dict)  # 追加の希望休
+
+    def apply(self, base: MonthInput) -> MonthInput:
+        requirements = base.requirements
+        if self.saturday_max_per_person is not None:
+            requirements = replace(requirements, saturday_max_per_person=self.saturday_max_per_person)
+        closed = (set(base.closed_dates) | set(self.close_dates)) - set(self.reopen_dates)
+        requests_off = {sid: tuple(ds) for sid, ds in base.requests_off.items()}
+        for sid, ds in self.requests_off.items():
+            requests_off[sid] = tuple(sorted(set(requests_off.get(sid, ())) | set(ds)))
+        # replace() で作り直すため、calendar / index のキャッシュは引き継がれない
+        return replace(base, requirements=requirements, closed_dates=tuple(sorted(closed)), requests_off=requests_off)
+
+
+BASELINE = Scenario(name="現在")
+
+
+@dataclass(frozen=True)
+class ScenarioKpis:
+    unfilled_mandatory: int
+    unfilled_optional: int
+    no_manager_days: int
+    saturday_excess: int
+    workday_spread: int  # 勤務日数の最大 - 最小
+    total_hours: float
+    hours_spread: float  # 勤務時間の最大 - 最小
+
+    def delta(self, base: "ScenarioKpis") -> dict[str, float]:
+        return {name: getattr(self, name) - getattr(base, name) for name, _label in KPI_LABELS}
+
+
+# 比較表に出す順 (field, 表示名)
+KPI_LABELS = (
+    ("unfilled_mandatory", "必須空き"),
+    ("unfilled_optional", "任意空き"),
+    ("no_manager_days", "マネージャー不在日"),
+    ("saturday_excess", "土曜超過"),
+    ("workday_spread", "勤務日数差"),
+    ("total_hours", "合計時間"),
+    ("hours_spread", "時間差"),
+)
+
+
+def evaluate(mi: MonthInput, result: SolveResult) -> ScenarioKpis:
+    matrix = result.to_matrix(mi)
+    terms = validate_schedule(mi, result.assignments).terms
+    hours = [h for *_rest, h in compute_hours(mi, matrix)]
+    return ScenarioKpis(
+        unfilled_mandatory=terms.unfilled_mandatory,
+        unfilled_optional=terms.unfilled_optional,
+        no_manager_days=terms.no_manager_days,
+        saturday_excess=terms.saturday_excess,
+        workday_spread=terms.workday_spread,
+        total_hours=sum(hours),
+        hours_spread=(max(hours) - min(hours)) if hours else 0.0,
+    )
+
+
+@dataclass(frozen=True)
+class ScenarioOutcome:
+    scenario: Scenario
+    month_input: MonthInput
+    result: SolveResult | None = None
+    kpis: ScenarioKpis | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.result is not None
+
+
+def _solve_job(mi: MonthInput, workers: int) -> tuple[SolveResult | None, ScenarioKpis | None, str | None]:
+    """子プロセスで1シナリオを解く。例外は文字列にして返す。"""
+    try:
+        res = solve(mi, budget=CpuBudget(total=workers))
+    except SolveError as e:
+        return None, None, str(e)
+    return res, evaluate(mi, res), None
+
+
+def compare_scenarios(
+    base: MonthInput,
+    scenarios: Sequence[Scenario],
+    budget: CpuBudget | None = None,
+    max_processes: int | None = None,
+    on_done: Callable[[int, ScenarioOutcome], None] | None = None,
+    cancel: threading.Event | None = None,
+) -> list[ScenarioOutcome]:
+    """
+    Solve every scenario applied to `base` concurrently in a process pool.
+
+    The whole comparison leases its CPUs from `budget` (default: the process
+    budget) and splits them between the worker processes, so it never uses
+    more search threads than a single solve would be allowed. `on_done(i,
+    outcome)` is called in the calling thread as each scenario finishes.
+    Outcomes are returned in the order of `scenarios`.
+
+    When `cancel` is set, scenarios not yet started are dropped and only the
+    finished ones are returned. Solves already running in a worker cannot be
+    interrupted; they end within the solver's time limit, and the CPUs stay
+    leased until then.
+    """
+    if budget is None:
+        budget = default_budget()
+    inputs = [sc.apply(base) for sc in scenarios]
+    outcomes: list[ScenarioOutcome | None] = [None] * len(inputs)
+    if not inputs:
+        return []
+
+    with budget.lease(budget.total) as cpus:
+        n_proc = max(1, min(len(inputs), cpus, max_processes or cpus))
+        per_solve = max(1, cpus // n_proc)
+        with ProcessPoolExecutor(max_workers=n_proc) as pool:
+            futures = {pool.submit(_solve_job, mi, per_solve): i for i, mi in enumerate(inputs)}
+            pending = set(futures)
+            while pending:
+                if cancel is not None and cancel.is_set():
+                    pool.shutdown(cancel_futures=True)  # 実行中の分だけ終わるのを待つ
+                    break
+                finished, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    i = futures[fut]
+                    try:
+                        res, kpis, error = fut.result()
+                    except Exception as e:  # 子プロセスの異常終了など
+                        res, kpis, error = None, None, f"{type(e).__name__}: {e}"
+                    out = ScenarioOutcome(scenarios[i], inputs[i], res, kpis, error)
+                    outcomes[i] = out
+                    if on_done is not None:
+                        on_done(i, out)
+    return [o for o in outcomes if o is not None]
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from array import array
+from datetime import date
+from typing import Iterable, Iterator, Sequence
+
+from .domain import Assignment, MonthInput
+
+EMPTY = -1  # 未割当セル
+
+
+class ScheduleMatrix:
+    """
+    Compact days x slots matrix of staff indices.
+
+    Cells hold the position of the assigned staff member in `staff_ids`
+    (EMPTY for unused/unassigned slots) in a flat row-major `array('i')`.
+    Per-day rows and per-slot columns are exposed as memoryview slices of the
+    same buffer, and `view()` / `__array__` give a 2-D view that NumPy can
+    wrap without copying (`numpy.asarray(matrix)`).
+    """
+
+    __slots__ = ("days", "slot_names", "staff_ids", "_data", "_slot_pos")
+
+    def __init__(
+        self,
+        days: Sequence[date],
+        slot_names: Sequence[str],
+        staff_ids: Sequence[str],
+        data: array | None = None,
+    ):
+        self.days = tuple(days)
+        self.slot_names = tuple(slot_names)
+        self.staff_ids = tuple(staff_ids)
+        n = len(self.days) * len(self.slot_names)
+        if data is None:
+            data = array("i", [EMPTY]) * n
+        elif data.typecode != "i" or len(data) != n:
+            raise ValueError("ScheduleMatrix のデータ長が日数×枠数と一致しません。")
+        self._data = data
+        self._slot_pos = {name: i for i, name in enumerate(self.slot_names)}
+
+    # --- 変換 ---
+
+    @classmethod
+    def from_assignments(
+        cls,
+        assignments: Iterable[Assignment],
+        staff_ids: Sequence[str],
+        slot_names: Sequence[str],
+    ) -> "ScheduleMatrix":
+        assignments = tuple(assignments)
+        m = cls([a.day for a in assignments], slot_names, staff_ids)
+        staff_pos = {sid: i for i, sid in enumerate(m.staff_ids)}
+        width = len(m.slot_names)
+        data = m._data
+        for di, a in enumerate(assignments):
+            base = di * width
+            for slot_name, sid in a.slots.items():
+                si = m._slot_pos.get(slot_name)
+                if si is None:
+                    raise ValueError(f"未知の slot_name です: {slot_name}")
+                p = staff_pos.get(sid)
+                if p is None:
+                    raise ValueError(f"未知の staff id です: {sid}")
+                data[base + si] = p
+        return m
+
+    @classmethod
+    def for_month_input(cls, mi: MonthInput, assignments: Iterable[Assignment]) -> "ScheduleMatrix":
+        return cls.from_assignments(assignments, [s.id for s in mi.staff], mi.slot_table.slot_names)
+
+    def to_assignments(self) -> tuple[Assignment, ...]:
+        out: list[Assignment] = []
+        width = len(self.slot_names)
+        data = self._data
+        for di, d in enumerate(self.days):
+            base = di * width
+            slots: dict[str, str] = {}
+            for si, name in enumerate(self.slot_names):
+                p = data[base + si]
+                if p != EMPTY:
+                    slots[name] = self.staff_ids[p]
+            out.append(Assignment(day=d, slots=slots))
+        return tuple(out)
+
+    # --- アクセス ---
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self.days), len(self.slot_names)
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def __getitem__(self, key: tuple[int, int]) -> int:
+        di, si = key
+        return self._data[di * len(self.slot_names) + si]
+
+    def __setitem__(self, key: tuple[int, int], staff_pos: int) -> None:
+        di, si = key
+        if not (staff_pos == EMPTY or 0 <= staff_pos < len(self.staff_ids)):
+            raise IndexError(f"staff index が範囲外です: {staff_pos}")
+        self._data[di * len(self.slot_names) + si] = staff_pos
+
+    def slot_pos(self, slot_name: str) -> int:
+        return self._slot_pos[slot_name]
+
+    def view(self) -> memoryview:
+        """日数×枠数の2次元 memoryview (コピーなし)。"""
+        return memoryview(self._data).cast("B").cast("i", list(self.shape))
+
+    def tobytes(self) -> bytes:
+        """セルのバッファ (int32、ネイティブのバイト順) をそのまま返す。"""
+        return self._data.tobytes()
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+
+        arr = np.frombuffer(self._data, dtype=np.intc).reshape(self.shape)
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+    def day_row(self, di: int) -> memoryview:
+        """1日分の行 (コピーなし)。"""
+        width = len(self.slot_names)
+        return memoryview(self._data)[di * width : (di + 1) * width]
+
+    def slot_column(self, si: int) -> memoryview:
+        """1枠分の列 (ストライド付き memoryview、コピーなし)。"""
+        return memoryview(self._data)[si :: len(self.slot_names)]
+
+    def staff_cells(self, p: int) -> Iterator[tuple[int, int]]:
+        """スタッフ p が入っている (day_index, slot_index) を順に返す。"""
+        width = len(self.slot_names)
+        for i, v in enumerate(self._data):
+            if v == p:
+                yield divmod(i, width)
+
+    def day_staff(self, di: int) -> list[int]:
+        return [p for p in self.day_row(di) if p != EMPTY]
+
+    # --- 集計 ---
+
+    def counts_per_staff(self, day_mask: Sequence[bool] | None = None) -> list[int]:
+        """スタッフごとの勤務枠数。`day_mask` を渡すと True の日だけ数える。"""
+        counts = [0] * len(self.staff_ids)
+        width = len(self.slot_names)
+        data = self._data
+        for di in range(len(self.days)):
+            if day_mask is not None and not day_mask[di]:
+                continue
+            for p in data[di * width : (di + 1) * width]:
+                if p != EMPTY:
+                    counts[p] += 1
+        return counts
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ScheduleMatrix):
+            return NotImplemented
+        return (
+            self.days == other.days
+            and self.slot_names == other.slot_names
+            and self.staff_ids == other.staff_ids
+            and self._data == other._data
+        )
+
+    def __repr__(self) -> str:
+        d, s = self.shape
+        return f"ScheduleMatrix(days={d}, slots={s}, staff={len(self.staff_ids)})"
@@ -0,0 +1,554 @@
+from __future__ import annotations
+
+import errno
+import http.client
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+import time
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, quote, urlsplit
+
+from .cpu_budget import CpuBudget
+from .domain import MonthInput
+from .excel import export_xlsx
+from .export import FORMAT_XLSX, FORMATS, check_format_available, export_schedule
+from .io import MonthInputJsonError, loads, month_input_from_dict, month_input_to_dict
+from .snapshot import Snapshot, SnapshotError, snapshot_from_bytes, snapshot_to_bytes
+from .solver import SolveCancelled, SolveError, SolveResult, solve
+from .validate import validate_schedule
+
+log = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2  # 同時に解く数 (探索スレッドは CPU 予算から分け合う)
+DEFAULT_QUEUE = 16  # 待ち行列の長さ。あふれた依頼は 503 で断る
+DEFAULT_TIMEOUT = 60.0  # 1依頼の上限秒数 (待ち時間を含む)
+MAX_BODY = 16 << 20
+
+FORMAT_JSON = "json"
+FORMAT_SNAPSHOT = "sgsnap"
+RESPONSE_FORMATS = (FORMAT_JSON, FORMAT_SNAPSHOT, *FORMATS)
+_CONTENT_TYPES = {
+    FORMAT_JSON: "application/json; charset=utf-8",
+    FORMAT_SNAPSHOT: "application/octet-stream",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+# jobs_total の result ラベル
+RESULTS = ("ok", "partial", "stopped", "timeout", "rejected", "invalid", "error")
+
+
+class ServerBusy(RuntimeError):
+    """待ち行列が満杯のとき送出する。"""
+    pass
+
+
+class RemoteSolveError(SolveError):
+    """サーバーが依頼を処理できなかったとき送出する (status は HTTP ステータス、接続失敗なら 0)。"""
+
+    def __init__(self, message: str, status: int = 0):
+        super().__init__(message)
+        self.status = status
+
+
+class _Job:
+    __slots__ = ("mi", "cancel", "done", "result", "error", "enqueued", "started", "finished")
+
+    def __init__(self, mi: MonthInput):
+        self.mi = mi
+        self.cancel = threading.Event()
+        self.done = threading.Event()
+        self.result: SolveResult | None = None
+        self.error: SolveError | None = None
+        self.enqueued = time.monotonic()
+        self.started: float | None = None
+        self.finished: float | None = None
+
+
+class SolveService:
+    """
+    Bounded job queue served by a fixed pool of worker threads.
+
+    The workers solve in this process, so ortools stays imported and warm
+    between requests; their search threads are leased from `budget` (the
+    process budget by default) and shared fairly between concurrent solves.
+    A job whose deadline passes while queued is dropped; one already being
+    solved is cancelled and returns its best solution so far.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        queue_size: int = DEFAULT_QUEUE,
+        max_timeout: float = DEFAULT_TIMEOUT,
+        budget: CpuBudget | None = None,
+    ):
+        self.workers = max(1, workers)
+        self.max_timeout = max_timeout
+        self.budget = budget
+        self._queue: queue.Queue[_Job | None] = queue.Queue(max(1, queue_size))
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(RESULTS, 0)
+        self._busy = 0
+        self._solve_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._solved = 0
+        self._threads: list[threading.Thread] = []
+        self.started_at = time.time()
+        self.warm_up: dict[str, float] | None = None
+
+    # --- 実行 ---
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"shiftgen-serve-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads.clear()
+
+    def submit(self, mi: MonthInput) -> _Job:
+        job = _Job(mi)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.count("rejected")
+            raise ServerBusy("待ち行列が満杯です。しばらくしてから再試行してください。") from None
+        return job
+
+    def run(self, mi: MonthInput, timeout: float | None = None) -> _Job:
+        """依頼を待ち行列に入れ、終わるまで待つ。timeout を過ぎたら探索を打ち切る。"""
+        timeout = self.max_timeout if timeout is None else min(timeout, self.max_timeout)
+        job = self.submit(mi)
+        if job.done.wait(timeout):
+            return job
+        with self._lock:
+            job.cancel.set()
+            queued = job.started is None
+            if queued:
+                # まだ待ち行列にいるなら、ここで打ち切る (ワーカーは取り出したときに捨てる)
+                self._counts["timeout"] += 1
+                self._wait_seconds += time.monotonic() - job.enqueued
+        if queued:
+            job.error = SolveCancelled("待ち行列にいる間にタイムアウトしました。")
+            return job
+        job.done.wait()  # 探索中なら打ち切りを待つ (最良解が返る)
+        return job
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.cancel.is_set():
+                    continue  # 待ち行列にいる間にタイムアウトして応答済み
+                job.started = time.monotonic()
+                self._busy += 1
+            try:
+                job.result = solve(job.mi, budget=self.budget, cancel=job.cancel)
+            except SolveError as e:
+                job.error = e
+            except Exception as e:  # 想定外の失敗でもワーカーは止めない
+                log.exception("solve failed")
+                job.error = SolveError(f"{type(e).__name__}: {e}")
+            finally:
+                with self._lock:
+                    self._busy -= 1
+            job.finished = time.monotonic()
+            self._finish(job)
+            job.done.set()
+
+    def _finish(self, job: _Job) -> None:
+        res = job.result
+        if res is not None:
+            result = "stopped" if res.stopped_early else ("partial" if res.is_partial else "ok")
+        elif isinstance(job.error, SolveCancelled):
+            result = "timeout"
+        else:
+            result = "error"
+        with self._lock:
+            self._counts[result] += 1
+            self._wait_seconds += job.started - job.enqueued
+            if res is not None:
+                self._solved += 1
+                self._solve_seconds += job.finished - job.started
+
+    def count(self, result: str) -> None:
+        with self._lock:
+            self._counts[result] += 1
+
+    # --- 状態 ---
+
+    def health(self) -> dict[str, Any]:
+        with self._lock:
+            busy = self._busy
+        return {
+            "status": "ok",
+            "uptime": round(time.time() - self.started_at, 3),
+            "workers": self.workers,
+            "busy": busy,
+            "queued": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "max_timeout": self.max_timeout,
+            "warm_up": self.warm_up,
+        }
+
+    def metrics_text(self) -> str:
+        """Prometheus のテキスト形式の指標。"""
+        with self._lock:
+            counts = dict(self._counts)
+            busy, solved = self._busy, self._solved
+            solve_s, wait_s = self._solve_seconds, self._wait_seconds
+        lines = [
+            "# HELP shiftgen_jobs_total Solve requests by outcome.",
+            "# TYPE shiftgen_jobs_total counter",
+            *(f'shiftgen_jobs_total{{result="{k}"}} {v}' for k, v in counts.items()),
+            "# HELP shiftgen_solve_seconds Time spent solving (requests that produced a schedule).",
+            "# TYPE shiftgen_solve_seconds summary",
+            f"shiftgen_solve_seconds_sum {solve_s:.6f}",
+            f"shiftgen_solve_seconds_count {solved}",
+            "# HELP shiftgen_queue_wait_seconds_total Time requests spent waiting in the queue.",
+            "# TYPE shiftgen_queue_wait_seconds_total counter",
+            f"shiftgen_queue_wait_seconds_total {wait_s:.6f}",
+            "# TYPE shiftgen_queue_depth gauge",
+            f"shiftgen_queue_depth {self._queue.qsize()}",
+            "# TYPE shiftgen_queue_capacity gauge",
+            f"shiftgen_queue_capacity {self._queue.maxsize}",
+            "# TYPE shiftgen_workers gauge",
+            f"shiftgen_workers {self.workers}",
+            "# TYPE shiftgen_busy_workers gauge",
+            f"shiftgen_busy_workers {busy}",
+            "# TYPE shiftgen_uptime_seconds gauge",
+            f"shiftgen_uptime_seconds {time.time() - self.started_at:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+# --- 応答の組み立て ---
+
+
+def result_to_dict(mi: MonthInput, result: SolveResult) -> dict[str, Any]:
+    """JSON 応答の本体。緩和モードの結果には満たせなかった制約の一覧を付ける。"""
+    violations = validate_schedule(mi, result.assignments).violations if result.is_partial else ()
+    return {
+        "month": mi.month,
+        "is_partial": result.is_partial,
+        "stopped_early": result.stopped_early,
+        "stats": asdict(result.stats) if result.stats is not None else None,
+        "assignments": [{"date": a.day.isoformat(), "slots": dict(a.slots)} for a in result.assignments],
+        "violations": [{"code": v.code, "message": v.message} for v in violations],
+    }
+
+
+def render_result(mi: MonthInput, result: SolveResult, fmt: str) -> bytes:
+    """結果を応答の形式 (json / sgsnap / xlsx / csv など) のバイト列にする。"""
+    if fmt == FORMAT_JSON:
+        return json.dumps(result_to_dict(mi, result), ensure_ascii=False).encode("utf-8")
+    if fmt == FORMAT_SNAPSHOT:
+        return snapshot_to_bytes(mi, result)
+    # 出力関数はパスに書くので、一時ファイルを経由する
+    with tempfile.TemporaryDirectory(prefix="shiftgen-") as tmp:
+        path = os.path.join(tmp, f"out.{fmt}")
+        matrix = result.to_matrix(mi)
+        if fmt == FORMAT_XLSX:
+            export_xlsx(mi, matrix, path)
+        else:
+            export_schedule(mi, matrix, path, fmt)
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "shiftgen"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug("%s %s", self.address_string(), format % args)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj: Any, headers: dict[str, str] | None = None) -> None:
+        self._send(status, json.dumps(obj, ensure_ascii=False).encode("utf-8"), _CONTENT_TYPES[FORMAT_JSON], headers)
+
+    def _error(self, status: int, message: str, **extra: Any) -> None:
+        self._json(status, {"error": message, **extra})
+
+    def do_GET(self) -> None:
+        service: SolveService = self.server.service
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._json(200, service.health())
+        elif path == "/metrics":
+            self._send(200, service.metrics_text().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._error(404, f"不明なパスです: {path}")
+
+    def do_POST(self) -> None:
+        service: SolveService = self.server.service
+        url = urlsplit(self.path)
+        if url.path != "/solve":
+            self._error(404, f"不明なパスです: {url.path}")
+            return
+        query = parse_qs(url.query)
+        fmt = query.get("format", [FORMAT_JSON])[0]
+        if fmt not in RESPONSE_FORMATS:
+            self._error(400, f"format は {' / '.join(RESPONSE_FORMATS)} のいずれかで指定してください: {fmt}")
+            return
+        try:
+            if fmt in FORMATS:
+                check_format_available(fmt)
+            timeout = float(query["timeout"][0]) if "timeout" in query else None
+        except RuntimeError as e:
+            self._error(400, str(e))
+            return
+        except ValueError:
+            self._error(400, "timeout は秒数で指定してください。")
+            return
+        if timeout is not None and timeout <= 0:
+            self._error(400, "timeout は0より大きい秒数で指定してください。")
+            return
+
+        header = self.headers.get("Content-Length")
+        if header is None:
+            self.close_connection = True
+            self._error(411, "Content-Length を指定してください。")
+            return
+        try:
+            length = int(header)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._error(400, f"Content-Length が不正です: {header}")
+            return
+        if length > MAX_BODY:
+            self.close_connection = True
+            self._error(413, f"入力が大きすぎます (上限 {MAX_BODY} バイト)。")
+            return
+        body = self.rfile.read(length)
+        try:
+            mi = month_input_from_dict(loads(body))
+        except MonthInputJsonError as e:
+            service.count("invalid")
+            self._error(400, str(e), issues=[{"path": i.path, "message": i.message} for i in e.issues])
+            return
+        except ValueError as e:  # JSON として読めない
+            service.count("invalid")
+            self._error(400, f"JSON として読めません: {e}")
+            return
+
+        try:
+            job = service.run(mi, timeout)
+        except ServerBusy as e:
+            self._json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+        if job.result is None:
+            if isinstance(job.error, SolveCancelled):
+                self._error(504, f"制限時間内に解が見つかりませんでした ({job.error})")
+            else:
+                self._error(422, str(job.error))
+            return
+        res = job.result
+        body = render_result(mi, res, fmt)
+        self._send(
+            200,
+            body,
+            _CONTENT_TYPES[fmt],
+            {
+                "X-Shiftgen-Partial": str(int(res.is_partial)),
+                "X-Shiftgen-Stopped-Early": str(int(res.stopped_early)),
+                "X-Shiftgen-Queue-Seconds": f"{job.started - job.enqueued:.3f}",
+                "X-Shiftgen-Solve-Seconds": f"{job.finished - job.started:.3f}",
+            },
+        )
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], service: SolveService):
+        self.service = service
+        super().__init__(address, _Handler)
+
+
+def _remove_stale_socket(path: str) -> None:
+    """前回異常終了したデーモンのソケットだけを消す。動いているデーモンやソケット以外のファイルは消さない。"""
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        raise FileExistsError(errno.EEXIST, "ソケット以外のファイルがあるため待ち受けできません", path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # 誰も待ち受けていない
+            return
+    raise FileExistsError(errno.EEXIST, "別のデーモンが待ち受けています", path)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, service: SolveService):
+        self.service = service
+        _remove_stale_socket(path)
+        super().__init__(path, _Handler)
+
+    def get_request(self) -> tuple[socket.socket, tuple[str, int]]:
+        conn, _addr = self.socket.accept()
+        return conn, ("unix", 0)  # BaseHTTPRequestHandler はアドレスを (host, port) とみなす
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def make_server(
+    service: SolveService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str | None = None
+) -> socketserver.BaseServer:
+    """HTTP (host:port) か Unix ソケット (socket_path) で待ち受けるサーバーを作る。"""
+    if socket_path:
+        return _UnixServer(socket_path, service)
+    return _TCPServer((host, port), service)
+
+
+def _raise_interrupt(signum: int, frame: Any) -> None:
+    raise KeyboardInterrupt
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: str | None = None,
+    workers: int = DEFAULT_WORKERS,
+    queue_size: int = DEFAULT_QUEUE,
+    max_timeout: float = DEFAULT_TIMEOUT,
+    warm: bool = True,
+) -> None:
+    """
+    Run the solve daemon until interrupted. The heavy modules are warmed up
+    before the socket is opened, so the first request is as fast as later ones.
+    """
+    service = SolveService(workers, queue_size, max_timeout)
+    if warm:
+        from .warmup import warm_up
+
+        service.warm_up = {k: round(v, 3) for k, v in warm_up().items()}
+    service.start()
+    try:
+        server = make_server(service, host, port, socket_path)
+    except BaseException:
+        service.stop()
+        raise
+    if threading.current_thread() is threading.main_thread():
+        # systemd などの停止 (SIGTERM) でも Ctrl-C と同じ後片付けをする
+        signal.signal(signal.SIGTERM, _raise_interrupt)
+    log.info("listening on %s", socket_path or f"http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+# --- クライアント ---
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def _connection(address: str, timeout: float | None) -> http.client.HTTPConnection:
+    """`http://host:port` または `unix:/path/to.sock` (またはソケットのパス) に接続する。"""
+    if address.startswith("unix:"):
+        return _UnixHTTPConnection(address[len("unix:") :], timeout)
+    if "://" not in address and address.startswith(("/", ".")):
+        return _UnixHTTPConnection(address, timeout)
+    url = urlsplit(address if "://" in address else f"http://{address}")
+    if url.scheme != "http":
+        raise ValueError(f"http:// か unix: で指定してください: {address}")
+    return http.client.HTTPConnection(url.hostname or DEFAULT_HOST, url.port or DEFAULT_PORT, timeout=timeout)
+
+
+def request(
+    address: str, method: str, path: str, body: bytes | None = None, timeout: float | None = None
+) -> tuple[int, dict[str, str], bytes]:
+    """サーバーへ1回だけ依頼し、(ステータス, ヘッダー, 本体) を返す。"""
+    conn = _connection(address, timeout)
+    try:
+        headers = {"Content-Type": _CONTENT_TYPES[FORMAT_JSON]} if body is not None else {}
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        return resp.status, dict(resp.getheaders()), resp.read()
+    finally:
+        conn.close()
+
+
+def remote_solve(address: str, mi: MonthInput, timeout: float | None = None) -> Snapshot:
+    """
+    Solve mi on a running `serve` daemon. The result comes back as a
+    snapshot, so it carries the solver stats just like a local solve.
+    Raises RemoteSolveError when the server is unreachable or refuses.
+    """
+    path = f"/solve?format={FORMAT_SNAPSHOT}"
+    if timeout is not None:
+        path += f"&timeout={quote(str(timeout))}"
+    body = json.dumps(month_input_to_dict(mi), ensure_ascii=False).encode("utf-8")
+    try:
+        # サーバー側の上限で打ち切られるので、ここでは待ち続ける
+        status, _headers, data = request(address, "POST", path, body)
+    except (OSError, http.client.HTTPException) as e:
+        raise RemoteSolveError(f"サーバーに接続できません ({address}): {e}") from e
+    if status != 200:
+        try:
+            message = json.loads(data)["error"]
+        except (ValueError, KeyError, TypeError):
+            message = data.decode("utf-8", "replace")
+        raise RemoteSolveError(f"サーバーが処理できませんでした ({status}): {message}", status)
+    try:
+        return snapshot_from_bytes(data)
+    except SnapshotError as e:
+        raise RemoteSolveError(f"サーバーの応答を読めません: {e}") from e
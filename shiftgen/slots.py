@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, Mapping
+
+# 日種別ごとのシフト枠テンプレート。
+# 各 kind は min〜max 人で、min 人分が必須枠・残りが任意枠に展開される。
+#   max == 1 の kind => 枠名は kind そのもの        (例: "wd_early")
+#   max >= 2 の kind => 枠名は kind + 連番 (1始まり) (例: "wd_a1", "wd_a2")
+# weekdays は Mon=0 ... Sun=6。どの日種別にも属さない曜日は定休日になる。
+DEFAULT_SLOT_TEMPLATES: dict[str, Any] = {
+    "day_types": [
+        {
+            "name": "weekday",
+            "label": "平日",
+            "weekdays": [0, 1, 2, 3, 4],
+            "hours": 8.5,
+            "saturday": False,
+            "kinds": [
+                {"kind": "wd_early", "label": "平日早番", "min": 1, "max": 1},
+                {"kind": "wd_a", "label": "平日A", "min": 1, "max": 2},
+                {"kind": "wd_b", "label": "平日B", "min": 2, "max": 2},
+                {"kind": "wd_bplus", "label": "平日B+", "min": 1, "max": 1},
+            ],
+        },
+        {
+            "name": "saturday",
+            "label": "土曜",
+            "weekdays": [5],
+            "hours": 4.5,
+            "saturday": True,
+            "kinds": [
+                {"kind": "sat_early", "label": "土曜早番", "min": 1, "max": 1},
+                {"kind": "sat_a", "label": "土曜A", "min": 2, "max": 3},
+                {"kind": "sat_b", "label": "土曜B", "min": 2, "max": 2},
+            ],
+        },
+    ],
+}
+
+NO_DAY_TYPE = -1
+
+
+@dataclass(frozen=True)
+class SlotTable:
+    """
+    Slot templates compiled into integer-indexed tables.
+
+    Slots, kinds and day types are referred to by their position in the
+    tuples below, so the solver and exporters can index plain tuples instead
+    of hashing slot-name strings. The `*_index` dicts map names back to IDs at
+    the I/O boundary only.
+    """
+
+    slot_names: tuple[str, ...]
+    slot_labels: tuple[str, ...]
+    slot_kind: tuple[int, ...]
+    slot_optional: tuple[bool, ...]
+    slot_day_type: tuple[int, ...]
+    slot_index: Mapping[str, int]
+
+    kind_names: tuple[str, ...]
+    kind_labels: tuple[str, ...]
+    kind_index: Mapping[str, int]
+
+    day_type_names: tuple[str, ...]
+    day_type_labels: tuple[str, ...]
+    day_type_hours: tuple[float, ...]
+    day_type_is_saturday: tuple[bool, ...]
+    day_type_slots: tuple[tuple[int, ...], ...]
+    day_type_of_weekday: tuple[int, ...]  # len 7, NO_DAY_TYPE => 定休日
+
+    def day_type_of(self, weekday: int) -> int:
+        return self.day_type_of_weekday[weekday]
+
+    def hours_for(self, saturday: bool) -> float:
+        """平日/土曜の1回あたり勤務時間 (該当する最初の日種別の値)。"""
+        for dt, is_sat in enumerate(self.day_type_is_saturday):
+            if is_sat == saturday:
+                return self.day_type_hours[dt]
+        return 0.0
+
+    def kind_mask(self, kinds) -> int:
+        """kind 名の集合をビットマスクに変換する。None は全 kind 許可。"""
+        if kinds is None:
+            return (1 << len(self.kind_names)) - 1
+        mask = 0
+        for k in kinds:
+            ki = self.kind_index.get(k)
+            if ki is None:
+                raise ValueError(f"未知のシフト種別です: {k}")
+            mask |= 1 << ki
+        return mask
+
+    def to_raw(self) -> dict[str, Any]:
+        """JSON 化可能なテンプレート定義に戻す。"""
+        day_types = []
+        for dt, name in enumerate(self.day_type_names):
+            kinds: list[dict[str, Any]] = []
+            by_kind: dict[int, list[int]] = {}
+            for si in self.day_type_slots[dt]:
+                by_kind.setdefault(self.slot_kind[si], []).append(si)
+            for ki, sis in by_kind.items():
+                kinds.append(
+                    {
+                        "kind": self.kind_names[ki],
+                        "label": self.kind_labels[ki],
+                        "min": sum(1 for si in sis if not self.slot_optional[si]),
+                        "max": len(sis),
+                    }
+                )
+            day_types.append(
+                {
+                    "name": name,
+                    "label": self.day_type_labels[dt],
+                    "weekdays": [wd for wd in range(7) if self.day_type_of_weekday[wd] == dt],
+                    "hours": self.day_type_hours[dt],
+                    "saturday": self.day_type_is_saturday[dt],
+                    "kinds": kinds,
+                }
+            )
+        return {"day_types": day_types}
+
+
+def compile_slot_templates(raw: Mapping[str, Any]) -> SlotTable:
+    day_types_raw = raw.get("day_types")
+    if not isinstance(day_types_raw, list) or not day_types_raw:
+        raise ValueError("slot_templates.day_types が不正です。")
+
+    slot_names: list[str] = []
+    slot_labels: list[str] = []
+    slot_kind: list[int] = []
+    slot_optional: list[bool] = []
+    slot_day_type: list[int] = []
+    kind_names: list[str] = []
+    kind_labels: list[str] = []
+    kind_index: dict[str, int] = {}
+    dt_names: list[str] = []
+    dt_labels: list[str] = []
+    dt_hours: list[float] = []
+    dt_sat: list[bool] = []
+    dt_slots: list[tuple[int, ...]] = []
+    dt_of_wd = [NO_DAY_TYPE] * 7
+
+    for dt, d in enumerate(day_types_raw):
+        name = str(d["name"])
+        if name in dt_names:
+            raise ValueError(f"日種別が重複しています: {name}")
+        dt_names.append(name)
+        dt_labels.append(str(d.get("label", name)))
+        dt_hours.append(float(d.get("hours", 0.0)))
+        dt_sat.append(bool(d.get("saturday", False)))
+        for wd in d.get("weekdays", []):
+            wd = int(wd)
+            if not 0 <= wd <= 6:
+                raise ValueError(f"weekdays は 0-6 で指定してください: {wd}")
+            if dt_of_wd[wd] != NO_DAY_TYPE:
+                raise ValueError(f"曜日 {wd} が複数の日種別に属しています。")
+            dt_of_wd[wd] = dt
+
+        ids: list[int] = []
+        for k in d.get("kinds", []):
+            kind = str(k["kind"])
+            if kind in kind_index:
+                raise ValueError(f"シフト種別が重複しています: {kind}")
+            label = str(k.get("label", kind))
+            lo = int(k.get("min", 1))
+            hi = int(k.get("max", lo))
+            if lo < 0 or hi < 1 or lo > hi:
+                raise ValueError(f"{kind} の min/max が不正です: {lo}-{hi}")
+            ki = len(kind_names)
+            kind_index[kind] = ki
+            kind_names.append(kind)
+            kind_labels.append(label)
+            for n in range(1, hi + 1):
+                ids.append(len(slot_names))
+                slot_names.append(kind if hi == 1 else f"{kind}{n}")
+                slot_labels.append(label if hi == 1 else f"{label}({n})")
+                slot_kind.append(ki)
+                slot_optional.append(n > lo)
+                slot_day_type.append(dt)
+        dt_slots.append(tuple(ids))
+
+    if len(set(slot_names)) != len(slot_names):
+        raise ValueError("シフト枠名が重複しています。")
+
+    return SlotTable(
+        slot_names=tuple(slot_names),
+        slot_labels=tuple(slot_labels),
+        slot_kind=tuple(slot_kind),
+        slot_optional=tuple(slot_optional),
+        slot_day_type=tuple(slot_day_type),
+        slot_index={n: i for i, n in enumerate(slot_names)},
+        kind_names=tuple(kind_names),
+        kind_labels=tuple(kind_labels),
+        kind_index=kind_index,
+        day_type_names=tuple(dt_names),
+        day_type_labels=tuple(dt_labels),
+        day_type_hours=tuple(dt_hours),
+        day_type_is_saturday=tuple(dt_sat),
+        day_type_slots=tuple(dt_slots),
+        day_type_of_weekday=tuple(dt_of_wd),
+    )
+
+
+def load_slot_templates_json(path: str) -> SlotTable:
+    with open(path, "r", encoding="utf-8") as f:
+        return compile_slot_templates(json.load(f))
+
+
+DEFAULT_SLOT_TABLE = compile_slot_templates(DEFAULT_SLOT_TEMPLATES)
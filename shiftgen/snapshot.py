@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Any, Iterable, Iterator
+
+from .availability import availability_from_raw, availability_to_raw
+from .domain import CarryOver, MonthInput, Requirements, Staff
+from .schedule import ScheduleMatrix
+from .slots import DEFAULT_SLOT_TABLE, compile_slot_templates
+from .solver import SolveResult, SolveStats
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = ".sgsnap"
+MAGIC = b"SGSN"
+VERSION = 1
+
+# ヘッダー (固定長・リトルエンディアン)。一覧表示に要る値はここだけで読める
+_HEADER = struct.Struct("<4sHH8sIIIddddIIII")
+FLAG_ZLIB = 1
+FLAG_PARTIAL = 2
+FLAG_STOPPED_EARLY = 4
+FLAG_STATS = 8
+
+# 本体の整数表 (名前, typecode)。この順に meta JSON の後ろへ連結する
+_SECTIONS = (
+    ("staff_flags", "B"),  # bit0 = マネージャー, bit1 = allowed_kinds あり
+    ("allowed_offsets", "I"),  # スタッフごとの allowed_kinds の範囲 (CSR)
+    ("allowed_kinds", "H"),  # meta["kinds"] の番号
+    ("closed", "i"),  # 臨時休業日 (date.toordinal)
+    ("request_offsets", "I"),  # meta["request_ids"] ごとの希望休の範囲 (CSR)
+    ("request_days", "i"),  # 希望休 (date.toordinal)
+    ("days", "i"),  # 勤務表の営業日 (date.toordinal)
+    ("cells", "i"),  # 日×枠のスタッフ番号 (ScheduleMatrix のバッファそのまま)
+)
+_STAFF_MANAGER = 1
+_STAFF_HAS_KINDS = 2
+
+_SWAP = sys.byteorder != "little"
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class SnapshotHeader:
+    path: str
+    version: int
+    month: str
+    n_staff: int
+    n_days: int
+    n_slots: int
+    compressed: bool
+    is_partial: bool
+    stopped_early: bool
+    objective: float | None  # 解いた記録 (stats) が無ければ None
+    bound: float | None
+    wall_time: float | None
+    saved_at: float  # time.time()
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    month_input: MonthInput
+    result: SolveResult
+    saved_at: float
+
+
+def is_snapshot_path(path: str) -> bool:
+    return path.lower().endswith(SNAPSHOT_SUFFIX)
+
+
+# --- 書き出し ---
+
+
+def _tables(mi: MonthInput, matrix: ScheduleMatrix) -> tuple[dict[str, Any], dict[str, array]]:
+    kinds: dict[str, int] = {}
+    staff_flags = array("B")
+    allowed_offsets = array("I", [0])
+    allowed_kinds = array("H")
+    for s in mi.staff:
+        flags = _STAFF_MANAGER if s.is_manager else 0
+        if s.allowed_kinds is not None:
+            flags |= _STAFF_HAS_KINDS
+            allowed_kinds.extend(kinds.setdefault(k, len(kinds)) for k in s.allowed_kinds)
+        staff_flags.append(flags)
+        allowed_offsets.append(len(allowed_kinds))
+
+    request_ids = list(mi.requests_off)
+    request_offsets = array("I", [0])
+    request_days = array("i")
+    for sid in request_ids:
+        request_days.extend(d.toordinal() for d in mi.requests_off[sid])
+        request_offsets.append(len(request_days))
+
+    cells = array("i")
+    cells.frombytes(matrix.tobytes())
+
+    meta = {
+        "month": mi.month,
+        "auto_close_jp_holidays": mi.auto_close_jp_holidays,
+        "requirements": asdict(mi.requirements),
+        "staff_ids": [s.id for s in mi.staff],
+        "staff_names": [s.name for s in mi.staff],
+        "kinds": list(kinds),
+        "request_ids": request_ids,
+        "availability": {sid: availability_to_raw(av) for sid, av in mi.availability.items()},
+        "slot_templates": None if mi.slot_table is DEFAULT_SLOT_TABLE else mi.slot_table.to_raw(),
+        "carry_over": {sid: asdict(c) for sid, c in mi.carry_over.items()},
+    }
+    tables = {
+        "staff_flags": staff_flags,
+        "allowed_offsets": allowed_offsets,
+        "allowed_kinds": allowed_kinds,
+        "closed": array("i", (d.toordinal() for d in mi.closed_dates)),
+        "request_offsets": request_offsets,
+        "request_days": request_days,
+        "days": array("i", (d.toordinal() for d in matrix.days)),
+        "cells": cells,
+    }
+    return meta, tables
+
+
+def snapshot_to_bytes(mi: MonthInput, result: SolveResult, compress: bool = True, saved_at: float | None = None) -> bytes:
+    """mi と result (と solve の記録) を1つのスナップショットにする。"""
+    matrix = result.to_matrix(mi)
+    if matrix.staff_ids != tuple(s.id for s in mi.staff) or matrix.slot_names != mi.slot_table.slot_names:
+        raise ValueError("勤務表のスタッフ・枠が入力と一致しません。")
+    meta, tables = _tables(mi, matrix)
+    stats = result.stats
+    meta["stats"] = asdict(stats) if stats is not None else None
+    meta["sections"] = [[name, len(tables[name])] for name, _code in _SECTIONS]
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    parts = [meta_bytes]
+    for name, _code in _SECTIONS:
+        a = tables[name]
+        if _SWAP:
+            a = array(a.typecode, a)
+            a.byteswap()
+        parts.append(a.tobytes())
+    raw = b"".join(parts)
+    body = zlib.compress(raw, 6) if compress else raw
+
+    flags = (FLAG_ZLIB if compress else 0) | (FLAG_PARTIAL if result.is_partial else 0)
+    flags |= FLAG_STOPPED_EARLY if result.stopped_early else 0
+    flags |= FLAG_STATS if stats is not None else 0
+    nan = math.nan
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        flags,
+        mi.month.encode("ascii")[:8],
+        len(mi.staff),
+        len(matrix.days),
+        len(matrix.slot_names),
+        stats.objective if stats is not None else nan,
+        stats.bound if stats is not None else nan,
+        stats.wall_time if stats is not None else nan,
+        time.time() if saved_at is None else saved_at,
+        len(meta_bytes),
+        len(body),
+        len(raw),
+        zlib.crc32(body),
+    )
+    return header + body
+
+
+def save_snapshot(path: str, mi: MonthInput, result: SolveResult, compress: bool = True) -> int:
+    """スナップショットを書き出し、バイト数を返す。"""
+    data = snapshot_to_bytes(mi, result, compress=compress)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+# --- 読込 ---
+
+
+def _unpack_header(buf, path: str) -> tuple[SnapshotHeader, int, int, int, int]:
+    if len(buf) < _HEADER.size:
+        raise SnapshotError(f"スナップショットではありません: {path}")
+    (magic, version, flags, month, n_staff, n_days, n_slots, objective, bound, wall_time, saved_at,
+     meta_len, body_len, raw_len, crc) = _HEADER.unpack_from(buf, 0)  # fmt: skip
+    if magic != MAGIC:
+        raise SnapshotError(f"スナップショットではありません: {path}")
+    if version > VERSION:
+        raise SnapshotError(f"新しい版の shiftgen で保存されたスナップショットです (形式 v{version}): {path}")
+    try:
+        month = month.rstrip(b"\0").decode("ascii")
+    except UnicodeDecodeError as e:
+        raise SnapshotError(f"スナップショットが壊れています: {path}") from e
+    has_stats = bool(flags & FLAG_STATS)
+    header = SnapshotHeader(
+        path=path,
+        version=version,
+        month=month,
+        n_staff=n_staff,
+        n_days=n_days,
+        n_slots=n_slots,
+        compressed=bool(flags & FLAG_ZLIB),
+        is_partial=bool(flags & FLAG_PARTIAL),
+        stopped_early=bool(flags & FLAG_STOPPED_EARLY),
+        objective=objective if has_stats else None,
+        bound=bound if has_stats else None,
+        wall_time=wall_time if has_stats else None,
+        saved_at=saved_at,
+    )
+    return header, meta_len, body_len, raw_len, crc
+
+
+def _decode(buf, path: str) -> Snapshot:
+    header, meta_len, body_len, raw_len, crc = _unpack_header(buf, path)
+    # mmap を閉じられるよう、本体の memoryview は必ず解放する
+    with memoryview(buf) as mv, mv[_HEADER.size : _HEADER.size + body_len] as body:
+        if len(body) != body_len or zlib.crc32(body) != crc:
+            raise SnapshotError(f"スナップショットが壊れています: {path}")
+        try:
+            raw = zlib.decompress(body, bufsize=raw_len) if header.compressed else bytes(body)
+        except zlib.error as e:
+            raise SnapshotError(f"スナップショットが壊れています: {path} ({e})") from e
+    # CRC が守るのは本体だけなので、ヘッダの長さやフラグが壊れていると中身の解釈で失敗する
+    try:
+        return _decode_body(header, raw, meta_len, raw_len, path)
+    except SnapshotError:
+        raise
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        raise SnapshotError(f"スナップショットが壊れています: {path} ({type(e).__name__}: {e})") from e
+
+
+def _decode_body(header: SnapshotHeader, raw: bytes, meta_len: int, raw_len: int, path: str) -> Snapshot:
+    meta = json.loads(raw[:meta_len].decode("utf-8"))
+
+    tables: dict[str, array] = {}
+    pos = meta_len
+    for (name, count), (_name, code) in zip(meta["sections"], _SECTIONS):
+        a = array(code)
+        end = pos + count * a.itemsize
+        a.frombytes(raw[pos:end])
+        if _SWAP:
+            a.byteswap()
+        tables[name] = a
+        pos = end
+    if pos != raw_len:
+        raise SnapshotError(f"スナップショットが壊れています: {path}")
+
+    kinds = meta["kinds"]
+    flags, offs, allowed = tables["staff_flags"], tables["allowed_offsets"], tables["allowed_kinds"]
+    staff = tuple(
+        Staff(
+            id=sid,
+            name=name,
+            is_manager=bool(flags[p] & _STAFF_MANAGER),
+            allowed_kinds=tuple(kinds[k] for k in allowed[offs[p] : offs[p + 1]]) if flags[p] & _STAFF_HAS_KINDS else None,
+        )
+        for p, (sid, name) in enumerate(zip(meta["staff_ids"], meta["staff_names"]))
+    )
+    from_ord = date.fromordinal
+    req_offs, req_days = tables["request_offsets"], tables["request_days"]
+    slot_raw = meta["slot_templates"]
+    mi = MonthInput(
+        month=meta["month"],
+        staff=staff,
+        closed_dates=tuple(map(from_ord, tables["closed"])),
+        requests_off={
+            sid: tuple(map(from_ord, req_days[req_offs[i] : req_offs[i + 1]])) for i, sid in enumerate(meta["request_ids"])
+        },
+        requirements=Requirements(**meta["requirements"]),
+        auto_close_jp_holidays=meta["auto_close_jp_holidays"],
+        slot_table=compile_slot_templates(slot_raw) if slot_raw else DEFAULT_SLOT_TABLE,
+        availability={sid: availability_from_raw(a) for sid, a in meta["availability"].items()},
+        carry_over={sid: CarryOver(**c) for sid, c in meta.get("carry_over", {}).items()},
+    )
+
+    matrix = ScheduleMatrix(
+        tuple(map(from_ord, tables["days"])), mi.slot_table.slot_names, meta["staff_ids"], data=tables["cells"]
+    )
+    stats = meta["stats"]
+    result = SolveResult(
+        assignments=matrix.to_assignments(),
+        is_partial=header.is_partial,
+        matrix=matrix,
+        stopped_early=header.stopped_early,
+        stats=SolveStats(**stats) if stats is not None else None,
+    )
+    return Snapshot(month_input=mi, result=result, saved_at=header.saved_at)
+
+
+def snapshot_from_bytes(data: bytes) -> Snapshot:
+    return _decode(data, "<bytes>")
+
+
+@contextmanager
+def _mapped(path: str) -> Iterator[mmap.mmap]:
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:  # 空のファイル
+            raise SnapshotError(f"スナップショットではありません: {path}") from e
+        with mm:
+            yield mm
+
+
+def load_snapshot(path: str) -> Snapshot:
+    """スナップショットを開く (解き直さない)。"""
+    with _mapped(path) as mm:
+        return _decode(mm, path)
+
+
+def read_snapshot_header(path: str) -> SnapshotHeader:
+    """
+    Read only the fixed-size header of a snapshot. The file is memory-mapped,
+    so only its first page is actually read no matter how large the body is.
+    """
+    with _mapped(path) as mm:
+        return _unpack_header(mm, path)[0]
+
+
+def iter_snapshot_paths(root: str) -> Iterator[str]:
+    """root 以下の *.sgsnap をパス順に返す。"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if is_snapshot_path(name):
+                yield os.path.join(dirpath, name)
+
+
+def scan_snapshots(paths: str | Iterable[str]) -> list[SnapshotHeader]:
+    """
+    Headers of many snapshots (a directory, searched recursively, or a list of
+    paths), sorted by month then path. Files that are not readable snapshots
+    are logged and skipped.
+    """
+    if isinstance(paths, str):
+        paths = iter_snapshot_paths(paths)
+    out = []
+    for path in paths:
+        try:
+            out.append(read_snapshot_header(path))
+        except (OSError, SnapshotError) as e:
+            log.warning("skip %s: %s", path, e)
+    out.sort(key=lambda h: (h.month, h.path))
+    return out
@@ -1,160 +1,227 @@
 from __future__ import annotations
 
+import threading
+import time
 from dataclasses import dataclass
 from datetime import date
-
-from .calendar_utils import is_saturday, is_sunday, iter_dates, month_range
-from .domain import Assignment, MonthInput, SLOT_TO_KIND
-from .jp_holidays import jp_holidays_in_month
+from typing import Callable
+
+from .cpu_budget import CpuBudget, default_budget
+from .domain import Assignment, MonthInput
+from .schedule import ScheduleMatrix
+from .validate import (
+    W_NO_MANAGER,
+    W_SAT_CARRY,
+    W_SAT_EXCESS,
+    W_SPREAD,
+    W_UNFILLED_MANDATORY,
+    W_UNFILLED_OPTIONAL_RELAXED,
+    W_UNFILLED_OPTIONAL_STRICT,
+    carry_over_offsets,
+)
 
 
 class SolveError(RuntimeError):
     pass
 
 
+class SolveCancelled(SolveError):
+    """解が1つも見つかる前に中止されたとき送出する。"""
+    pass
+
+
 class _InfeasibleError(Exception):
     """厳格制約で解なしのとき内部的に送出し、緩和モードへの切り替えに使う。"""
     pass
 
 
+@dataclass(frozen=True)
+class SolveStats:
+    """最終フェーズの探索の記録。"""
+
+    phase: str  # "strict" / "relaxed"
+    optimal: bool
+    objective: float
+    bound: float  # 目的関数値の下界
+    solutions: int  # このフェーズで見つかった解の数
+    wall_time: float  # solve() 開始からの経過秒
+    workers: int  # 使った探索ワーカー数
+
+
 @dataclass(frozen=True)
 class SolveResult:
     assignments: tuple[Assignment, ...]
     is_partial: bool = False  # True のとき制約緩和モードで生成（空きスロットあり）
+    matrix: ScheduleMatrix | None = None  # assignments と同じ内容の整数行列表現
+    stopped_early: bool = False  # True のとき中止要求により最適化の途中で打ち切った
+    stats: SolveStats | None = None  # solve() で作った結果のときだけ入る
+
+    def to_matrix(self, mi: MonthInput) -> ScheduleMatrix:
+        if self.matrix is not None:
+            return self.matrix
+        return ScheduleMatrix.for_month_input(mi, self.assignments)
+
+
+@dataclass(frozen=True)
+class SolveProgress:
+    """探索中に改善解が見つかるたびに progress コールバックへ渡す。"""
+
+    phase: str  # "strict" / "relaxed"
+    elapsed: float  # solve() 開始からの経過秒
+    objective: float
+    bound: float  # 目的関数値の下界
+    solutions: int  # このフェーズで見つかった解の数
+    result: SolveResult  # その時点の最良解
+
+
+ProgressCallback = Callable[[SolveProgress], None]
 
 
 def _open_days(mi: MonthInput) -> list[date]:
-    start, end = month_range(mi.month)
-    closed = set(mi.closed_dates)
-    jp_holidays = set(jp_holidays_in_month(mi.month).keys()) if mi.auto_close_jp_holidays else set()
+    return mi.calendar.open_days()
 
-    days: list[date] = []
-    for d in iter_dates(start, end):
-        if is_sunday(d):
-            continue
-        if d in jp_holidays:
-            continue
-        if d in closed:
-            continue
-        days.append(d)
-    return days
 
+MAX_SEARCH_WORKERS = 8
 
-def solve(mi: MonthInput) -> SolveResult:
-    """まず厳格制約で解を求め、不可能なら制約緩和モードで再挑戦する。"""
+
+def solve(
+    mi: MonthInput,
+    budget: CpuBudget | None = None,
+    progress: ProgressCallback | None = None,
+    cancel: threading.Event | None = None,
+    hint: SolveResult | None = None,
+) -> SolveResult:
+    """まず厳格制約で解を求め、不可能なら制約緩和モードで再挑戦する。
+
+    探索ワーカー数は `budget` (省略時はプロセス共通の予算) から借り受けるため、
+    同時に複数の solve を走らせても合計スレッド数が CPU 数を超えない。
+
+    `progress` は改善解が見つかるたびにソルバーのスレッドから呼ばれる。
+    `cancel` がセットされると探索を打ち切り、それまでの最良解を
+    `stopped_early=True` で返す (解がまだ無ければ SolveCancelled)。
+    `hint` に前回の結果を渡すと、同じ日・枠・スタッフの割当を探索の初期値にする
+    (入力が少し変わっただけなら、最初の解がすぐ見つかる)。
+    """
+    if budget is None:
+        budget = default_budget()
+    started = time.monotonic()
     try:
         try:
-            return _solve_with_ortools(mi, relaxed=False)
+            return _solve_with_ortools(
+                mi, relaxed=False, budget=budget, progress=progress, cancel=cancel, started=started, hint=hint
+            )
         except _InfeasibleError:
-            return _solve_with_ortools(mi, relaxed=True)
+            return _solve_with_ortools(
+                mi, relaxed=True, budget=budget, progress=progress, cancel=cancel, started=started, hint=hint
+            )
     except ModuleNotFoundError as e:
         raise SolveError(
             "ortools が見つかりません。`pip install -r requirements.txt` を実行してください。"
         ) from e
 
 
-def _solve_with_ortools(mi: MonthInput, relaxed: bool = False) -> SolveResult:
+def _solve_with_ortools(
+    mi: MonthInput,
+    relaxed: bool = False,
+    budget: CpuBudget | None = None,
+    progress: ProgressCallback | None = None,
+    cancel: threading.Event | None = None,
+    started: float | None = None,
+    hint: SolveResult | None = None,
+) -> SolveResult:
     from ortools.sat.python import cp_model
 
     staff = list(mi.staff)
     if not staff:
         raise SolveError("スタッフが0人です。")
 
-    staff_ids = [s.id for s in staff]
-    staff_index = {sid: i for i, sid in enumerate(staff_ids)}
-    managers = {s.id for s in staff if s.is_manager}
-    if not managers:
+    idx = mi.index
+    staff_ids = idx.staff_ids
+    if not idx.manager_mask:
         raise SolveError("マネージャースキル保有者が0人です。")
-
-    days = _open_days(mi)
+    if idx.unknown_request_ids:
+        raise SolveError(f"requests_off / availability に未知の staff id があります: {idx.unknown_request_ids[0]}")
+    if idx.invalid_kinds:
+        sid, kind = idx.invalid_kinds[0]
+        raise SolveError(f"{sid}: 未知のシフト種別です: {kind}")
+
+    cal = mi.calendar
+    open_pos = [i for i, is_open in enumerate(cal.open) if is_open]
+    days = [cal.dates[i] for i in open_pos]
     if not days:
         raise SolveError("営業日が0日です。祝日/休業日設定を確認してください。")
 
     req = mi.requirements
-
-    # Weekday: early(1), A(1-2), B(2), B+(1) -> 5-6
-    # Saturday: early(1), A(2-3), B(2)      -> 5-6
-    def day_slots(d: date) -> list[tuple[str, bool]]:
-        if is_saturday(d):
-            return [
-                ("sat_early", False),
-                ("sat_a1", False),
-                ("sat_a2", False),
-                ("sat_a3", True),
-                ("sat_b1", False),
-                ("sat_b2", False),
-            ]
-        return [
-            ("wd_early", False),
-            ("wd_a1", False),
-            ("wd_a2", True),
-            ("wd_b1", False),
-            ("wd_b2", False),
-            ("wd_bplus", False),
-        ]
+    table = mi.slot_table
+    n_staff = len(staff)
+    staff_range = range(n_staff)
+
+    # 枠は (営業日, 枠ID) の組に通し番号 k を振り、以降は整数添字だけで扱う。
+    # 平日: 早番(1), A(1-2), B(2), B+(1) / 土曜: 早番(1), A(2-3), B(2) (slots.DEFAULT_SLOT_TEMPLATES)
+    day_types = [cal.day_types[i] for i in open_pos]
+    key_day: list[int] = []
+    key_slot: list[int] = []
+    day_keys: list[list[int]] = []
+    for di, dt in enumerate(day_types):
+        ks = []
+        for si in table.day_type_slots[dt]:
+            ks.append(len(key_slot))
+            key_day.append(di)
+            key_slot.append(si)
+        day_keys.append(ks)
+    n_keys = len(key_slot)
+    key_optional = [table.slot_optional[si] for si in key_slot]
 
     model = cp_model.CpModel()
 
-    slot_keys: list[tuple[int, str]] = []
-    slot_optional: dict[tuple[int, str], bool] = {}
-    day_to_slots: dict[int, list[str]] = {}
-    for di, d in enumerate(days):
-        day_to_slots[di] = []
-        for slot_name, is_opt in day_slots(d):
-            key = (di, slot_name)
-            slot_keys.append(key)
-            slot_optional[key] = is_opt
-            day_to_slots[di].append(slot_name)
-
     # 緩和モードでは必須スロットも任意（空き可）にする
-    active: dict[tuple[int, str], cp_model.IntVar] = {}
-    for key in slot_keys:
-        if slot_optional[key] or relaxed:
-            active[key] = model.NewBoolVar(f"active_d{key[0]}_{key[1]}")
+    active: list[cp_model.IntVar] = []
+    for k in range(n_keys):
+        if key_optional[k] or relaxed:
+            active.append(model.NewBoolVar(f"active_k{k}"))
         else:
-            active[key] = model.NewConstant(1)
+            active.append(model.NewConstant(1))
 
-    x: dict[tuple[int, int, str], cp_model.IntVar] = {}
-    for p in range(len(staff)):
-        for di, slot_name in slot_keys:
-            x[(p, di, slot_name)] = model.NewBoolVar(f"x_p{p}_d{di}_{slot_name}")
+    x: list[list[cp_model.IntVar]] = [
+        [model.NewBoolVar(f"x_p{p}_k{k}") for k in range(n_keys)] for p in staff_range
+    ]
 
-    for di, slot_name in slot_keys:
-        model.Add(sum(x[(p, di, slot_name)] for p in range(len(staff))) == active[(di, slot_name)])
+    for k in range(n_keys):
+        model.Add(sum(x[p][k] for p in staff_range) == active[k])
 
-    for p in range(len(staff)):
-        for di in range(len(days)):
-            model.Add(sum(x[(p, di, slot_name)] for slot_name in day_to_slots[di]) <= 1)
+    # day_work[p][di]: その日に勤務するか (1日1枠まで)
+    day_work: list[list] = []
+    for p in staff_range:
+        xp = x[p]
+        row = [sum(xp[k] for k in day_keys[di]) for di in range(len(days))]
+        for w in row:
+            model.Add(w <= 1)
+        day_work.append(row)
 
     # 希望休・種別制限は緩和モードでも常にハード制約
-    for sid, offs in mi.requests_off.items():
-        if sid not in staff_index:
-            raise SolveError(f"requests_off に未知の staff id があります: {sid}")
-        p = staff_index[sid]
-        off_set = set(offs)
-        for di, d in enumerate(days):
-            if d in off_set:
-                for slot_name in day_to_slots[di]:
-                    model.Add(x[(p, di, slot_name)] == 0)
-
-    for p, s in enumerate(staff):
-        if not s.allowed_kinds:
-            continue
-        allowed = set(s.allowed_kinds)
-        for di, slot_name in slot_keys:
-            kind = SLOT_TO_KIND.get(slot_name)
-            if kind is None:
-                raise SolveError(f"未知の slot_name です: {slot_name}")
-            if kind not in allowed:
-                model.Add(x[(p, di, slot_name)] == 0)
+    day_bits = [1 << i for i in open_pos]
+    key_kind = [table.slot_kind[si] for si in key_slot]
+    for p in staff_range:
+        off = idx.off_bits[p]
+        if off:
+            for di, bit in enumerate(day_bits):
+                if off & bit:
+                    for k in day_keys[di]:
+                        model.Add(x[p][k] == 0)
+        allowed = idx.kind_masks[p]
+        for k in range(n_keys):
+            if not (allowed >> key_kind[k]) & 1:
+                model.Add(x[p][k] == 0)
+
+    # 前月までの偏り (history から。無ければすべて0)
+    carry_days, carry_sat = carry_over_offsets(mi)
 
     # 土曜出勤上限
+    sat_days = [di for di, dt in enumerate(day_types) if table.day_type_is_saturday[dt]]
     sat_excess_vars: list[cp_model.IntVar] = []
-    for p in range(len(staff)):
-        sat_work = []
-        for di, d in enumerate(days):
-            if is_saturday(d):
-                sat_work.append(sum(x[(p, di, slot_name)] for slot_name in day_to_slots[di]))
+    sat_carry_vars: list[cp_model.IntVar] = []
+    for p in staff_range:
+        sat_work = [day_work[p][di] for di in sat_days]
         if not sat_work:
             continue
         if relaxed:
@@ -164,14 +231,19 @@ def _solve_with_ortools(mi: MonthInput, relaxed: bool = False) -> SolveResult:
             sat_excess_vars.append(excess)
         else:
             model.Add(sum(sat_work) <= req.saturday_max_per_person)
+        # 繰越込みの土曜回数が上限を超える分 (月の上限はそのままに、偏っていた人の土曜を減らす)。
+        # 繰越の無い人の超過は sat_excess で数えているので、二重に罰しない。
+        limit = req.saturday_max_per_person - carry_sat[p]
+        if carry_sat[p] > 0 and limit < len(sat_work):
+            carry_excess = model.NewIntVar(0, len(sat_work) - min(limit, 0), f"sat_carry_p{p}")
+            model.Add(sum(sat_work) - limit <= carry_excess)
+            sat_carry_vars.append(carry_excess)
 
     # マネージャー1日1人以上
+    manager_ps = [p for p in staff_range if idx.is_manager(p)]
     no_manager_vars: list[cp_model.IntVar] = []
     for di in range(len(days)):
-        manager_work = []
-        for p, s in enumerate(staff):
-            if s.id in managers:
-                manager_work.append(sum(x[(p, di, slot_name)] for slot_name in day_to_slots[di]))
+        manager_work = [day_work[p][di] for p in manager_ps]
         if relaxed:
             # ソフト制約: マネージャー不在日をペナルティ変数で捕捉
             no_mgr = model.NewBoolVar(f"no_mgr_d{di}")
@@ -181,32 +253,35 @@ def _solve_with_ortools(mi: MonthInput, relaxed: bool = False) -> SolveResult:
         else:
             model.Add(sum(manager_work) >= 1)
 
-    optional_keys = [k for k in slot_keys if slot_optional[k]]
+    optional_keys = [k for k in range(n_keys) if key_optional[k]]
     max_optional = len(optional_keys)
 
+    # 公平性は「今月の勤務日数 + 勤務日数の繰越」で測る
+    top = len(days) + max(carry_days)
     totals: list[cp_model.IntVar] = []
-    for p in range(len(staff)):
-        v = model.NewIntVar(0, len(days), f"total_p{p}")
-        model.Add(v == sum(x[(p, di, slot_name)] for (di, slot_name) in slot_keys))
+    for p in staff_range:
+        v = model.NewIntVar(0, top, f"total_p{p}")
+        model.Add(v == sum(x[p]) + carry_days[p])
         totals.append(v)
 
-    max_total = model.NewIntVar(0, len(days), "max_total")
-    min_total = model.NewIntVar(0, len(days), "min_total")
+    max_total = model.NewIntVar(0, top, "max_total")
+    min_total = model.NewIntVar(0, top, "min_total")
     model.AddMaxEquality(max_total, totals)
     model.AddMinEquality(min_total, totals)
 
-    total_assigned = model.NewIntVar(0, len(slot_keys), "total_assigned")
-    model.Add(total_assigned == sum(active[k] for k in slot_keys))
-    avg = model.NewIntVar(0, len(days), "avg")
-    model.AddDivisionEquality(avg, total_assigned, len(staff))
+    carry_sum = sum(carry_days)
+    total_assigned = model.NewIntVar(0, n_keys + carry_sum, "total_assigned")
+    model.Add(total_assigned == sum(active) + carry_sum)
+    avg = model.NewIntVar(0, top, "avg")
+    model.AddDivisionEquality(avg, total_assigned, n_staff)
 
     diffs: list[cp_model.IntVar] = []
     for p, v in enumerate(totals):
-        diff = model.NewIntVar(0, len(days), f"absdiff_p{p}")
+        diff = model.NewIntVar(0, top, f"absdiff_p{p}")
         model.AddAbsEquality(diff, v - avg)
         diffs.append(diff)
 
-    imbalance_obj = (max_total - min_total) * 1000 + sum(diffs)
+    imbalance_obj = (max_total - min_total) * W_SPREAD + sum(diffs) + sum(sat_carry_vars) * W_SAT_CARRY
 
     if relaxed:
         # 優先度(高→低):
@@ -214,57 +289,138 @@ def _solve_with_ortools(mi: MonthInput, relaxed: bool = False) -> SolveResult:
         # 2. マネージャーが不在の日を減らす (100万/日)
         # 3. 土曜上限超過を減らす (1万/人-土曜)
         # 4. 勤務日数の均等化
-        mandatory_keys = [k for k in slot_keys if not slot_optional[k]]
+        mandatory_keys = [k for k in range(n_keys) if not key_optional[k]]
         unfilled_mandatory = model.NewIntVar(0, len(mandatory_keys), "unfilled_mandatory")
         model.Add(unfilled_mandatory == len(mandatory_keys) - sum(active[k] for k in mandatory_keys))
 
         objective = (
-            unfilled_mandatory * 10_000_000
-            + sum(no_manager_vars) * 1_000_000
-            + sum(sat_excess_vars) * 10_000
+            unfilled_mandatory * W_UNFILLED_MANDATORY
+            + sum(no_manager_vars) * W_NO_MANAGER
+            + sum(sat_excess_vars) * W_SAT_EXCESS
             + imbalance_obj
         )
         if req.prefer_max_headcount and max_optional:
             filled_optional = sum(active[k] for k in optional_keys)
             unfilled_opt = model.NewIntVar(0, max_optional, "unfilled_optional")
             model.Add(unfilled_opt == max_optional - filled_optional)
-            objective = objective + unfilled_opt * 1_000
+            objective = objective + unfilled_opt * W_UNFILLED_OPTIONAL_RELAXED
     else:
         objective = imbalance_obj
         if req.prefer_max_headcount and max_optional:
             filled_optional = sum(active[k] for k in optional_keys)
             unfilled = model.NewIntVar(0, max_optional, "unfilled_optional")
             model.Add(unfilled == max_optional - filled_optional)
-            objective = unfilled * 1_000_000 + objective
+            objective = unfilled * W_UNFILLED_OPTIONAL_STRICT + objective
 
     model.Minimize(objective)
 
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 10.0
-    solver.parameters.num_search_workers = 8
-
-    status = solver.Solve(model)
-    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-        if relaxed:
-            raise SolveError("制約を緩和しても解が見つかりませんでした。スタッフ数や希望休設定を見直してください。")
-        raise _InfeasibleError()
-
-    assignments: list[Assignment] = []
-    for di, d in enumerate(days):
-        slots_out: dict[str, str] = {}
-        for slot_name in day_to_slots[di]:
-            if solver.Value(active[(di, slot_name)]) == 0:
+    if hint is not None:
+        # 前回の割当を (日付, 枠名, staff id) で引き直し、部分的な初期解にする。
+        # 希望休・種別制限に反するようになったものは使わない (残りはソルバーが補う)
+        prev = {(a.day, name): sid for a in hint.assignments for name, sid in a.slots.items()}
+        pos = {sid: p for p, sid in enumerate(staff_ids)}
+        for k in range(n_keys):
+            di = key_day[k]
+            p = pos.get(prev.get((days[di], table.slot_names[key_slot[k]])))
+            if p is not None and not idx.off_bits[p] & day_bits[di] and (idx.kind_masks[p] >> key_kind[k]) & 1:
+                model.AddHint(x[p][k], 1)
+
+    def extract(value) -> ScheduleMatrix:
+        matrix = ScheduleMatrix(days, table.slot_names, staff_ids)
+        for k in range(n_keys):
+            if value(active[k]) == 0:
                 continue
             chosen = None
-            for p in range(len(staff)):
-                if solver.Value(x[(p, di, slot_name)]) == 1:
-                    chosen = staff[p].id
+            for p in staff_range:
+                if value(x[p][k]) == 1:
+                    chosen = p
                     break
             if chosen is None:
                 if not relaxed:
                     raise SolveError("内部エラー: slot が未割当です。")
                 continue  # 緩和モードでは空きスロットをスキップ
-            slots_out[slot_name] = chosen
-        assignments.append(Assignment(day=d, slots=slots_out))
+            matrix[key_day[k], key_slot[k]] = chosen
+        return matrix
+
+    if cancel is not None and cancel.is_set():
+        raise SolveCancelled("生成を中止しました。")
+    if started is None:
+        started = time.monotonic()
+    phase = "relaxed" if relaxed else "strict"
+
+    class _Progress(cp_model.CpSolverSolutionCallback):
+        def __init__(self):
+            super().__init__()
+            self.solutions = 0
+
+        def on_solution_callback(self):
+            self.solutions += 1
+            if cancel is not None and cancel.is_set():
+                self.StopSearch()
+                return
+            if progress is None:
+                return
+            matrix = extract(self.Value)
+            result = SolveResult(assignments=matrix.to_assignments(), is_partial=relaxed, matrix=matrix)
+            progress(
+                SolveProgress(
+                    phase=phase,
+                    elapsed=time.monotonic() - started,
+                    objective=self.ObjectiveValue(),
+                    bound=self.BestObjectiveBound(),
+                    solutions=self.solutions,
+                    result=result,
+                )
+            )
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = 10.0
+    callback = _Progress()
+
+    # 中止要求はコールバックを待たずに監視スレッドから StopSearch する
+    # (解が1つも出ていない間もすぐ止まるように)。Solve() が始まる前の
+    # StopSearch は効かないので、終わるまで繰り返し呼ぶ。
+    done = threading.Event()
+    if cancel is not None:
+
+        def watch():
+            while not done.is_set():
+                if cancel.wait(0.1):
+                    solver.StopSearch()
+                    done.wait(0.1)
+
+        threading.Thread(target=watch, name="shiftgen-solve-cancel", daemon=True).start()
+
+    try:
+        with (budget or default_budget()).lease(MAX_SEARCH_WORKERS) as workers:
+            # CPU の空きを待っている間に中止されていたら探索しない
+            if cancel is not None and cancel.is_set():
+                raise SolveCancelled("生成を中止しました。")
+            solver.parameters.num_search_workers = workers
+            status = solver.Solve(model, callback)
+    finally:
+        done.set()
+    cancelled = cancel is not None and cancel.is_set()
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        if cancelled:
+            raise SolveCancelled("生成を中止しました。")
+        if relaxed:
+            raise SolveError("制約を緩和しても解が見つかりませんでした。スタッフ数や希望休設定を見直してください。")
+        raise _InfeasibleError()
 
-    return SolveResult(assignments=tuple(assignments), is_partial=relaxed)
+    matrix = extract(solver.Value)
+    return SolveResult(
+        assignments=matrix.to_assignments(),
+        is_partial=relaxed,
+        matrix=matrix,
+        stopped_early=cancelled and status != cp_model.OPTIMAL,
+        stats=SolveStats(
+            phase=phase,
+            optimal=status == cp_model.OPTIMAL,
+            objective=solver.ObjectiveValue(),
+            bound=solver.BestObjectiveBound(),
+            solutions=callback.solutions,
+            wall_time=time.monotonic() - started,
+            workers=workers,
+        ),
+    )
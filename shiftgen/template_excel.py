@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-from datetime import date
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Iterable, Iterator, Mapping
 
-from .calendar_utils import month_range
+from .availability import ALL_WEEKDAYS, WEEKDAY_NAMES, Availability, AvailabilityRule, weekday_mask
 from .domain import MonthInput, Requirements, Staff
+from .slots import DEFAULT_SLOT_TABLE, compile_slot_templates
 
 
 def _parse_date(s: str) -> date:
@@ -14,13 +18,21 @@ def _parse_date(s: str) -> date:
 def _as_date_cell(v) -> date | None:
     if v is None or v == "":
         return None
+    if isinstance(v, datetime):
+        return v.date()
     if isinstance(v, date):
         return v
     if isinstance(v, str):
-        return _parse_date(v.strip())
+        try:
+            return _parse_date(v.strip())
+        except ValueError:
+            pass
     raise ValueError(f"日付の形式が不正です: {v!r}")
 
 
+SLOT_SHEET_COLUMNS = ["day_type", "day_label", "weekdays", "hours", "saturday", "kind", "kind_label", "min", "max"]
+
+
 def export_template_xlsx(mi: MonthInput, out_path: str) -> None:
     try:
         from openpyxl import Workbook
@@ -65,8 +77,7 @@ def export_template_xlsx(mi: MonthInput, out_path: str) -> None:
     ws.column_dimensions["C"].width = 12
     ws.column_dimensions["D"].width = 30
 
-    start, end = month_range(mi.month)
-    days = list(range(1, end.day + 1))
+    days = [d.day for d in mi.calendar.dates]
 
     ws = wb.create_sheet("RequestsOffCalendar")
     write_header(ws, ["staff_id", "name"] + [str(d) for d in days])
@@ -88,122 +99,400 @@ def export_template_xlsx(mi: MonthInput, out_path: str) -> None:
         ws.append([d.isoformat()])
     ws.column_dimensions["A"].width = 14
 
+    # 定期的な勤務不可ルール: 1行 = 1ルール (weekdays は "tue,thu" 形式、空欄は全曜日)
+    ws = wb.create_sheet("Availability")
+    write_header(ws, ["staff_id", "weekdays", "start", "end", "every_n_weeks", "anchor"])
+    for sid, av in mi.availability.items():
+        for r in av.rules:
+            ws.append([
+                sid,
+                "" if r.weekdays == ALL_WEEKDAYS else ",".join(WEEKDAY_NAMES[wd] for wd in range(7) if (r.weekdays >> wd) & 1),
+                r.start.isoformat() if r.start else "",
+                r.end.isoformat() if r.end else "",
+                r.every_n_weeks,
+                r.anchor.isoformat() if r.anchor else "",
+            ])
+    for col, w in zip("ABCDEF", (10, 18, 14, 14, 14, 14)):
+        ws.column_dimensions[col].width = w
+
+    # ルールの例外日: available=TRUE ならルールに関わらず勤務可、FALSE なら追加の勤務不可日
+    ws = wb.create_sheet("AvailabilityExceptions")
+    write_header(ws, ["staff_id", "date", "available"])
+    for sid, av in mi.availability.items():
+        for d in av.on:
+            ws.append([sid, d.isoformat(), "TRUE"])
+        for d in av.off:
+            ws.append([sid, d.isoformat(), "FALSE"])
+    for col, w in zip("ABC", (10, 14, 10)):
+        ws.column_dimensions[col].width = w
+
+    # シフト枠テンプレート: 1行 = 1シフト種別。日種別の列は同じ day_type の行で共通。
+    ws = wb.create_sheet("Slots")
+    write_header(ws, SLOT_SHEET_COLUMNS)
+    for dt in mi.slot_table.to_raw()["day_types"]:
+        for k in dt["kinds"]:
+            ws.append([
+                dt["name"],
+                dt["label"],
+                ",".join(str(wd) for wd in dt["weekdays"]),
+                dt["hours"],
+                "TRUE" if dt["saturday"] else "FALSE",
+                k["kind"],
+                k["label"],
+                k["min"],
+                k["max"],
+            ])
+    for col, w in zip("ABCDEFGHI", (12, 10, 14, 8, 10, 12, 12, 6, 6)):
+        ws.column_dimensions[col].width = w
+
     wb.save(out_path)
 
 
-def import_from_template_xlsx(path: str) -> MonthInput:
-    try:
-        from openpyxl import load_workbook
-    except ModuleNotFoundError as e:
-        raise RuntimeError(
-            "openpyxl が見つかりません。`pip install -r requirements.txt` を実行してください。"
-        ) from e
+@dataclass(frozen=True)
+class TemplateIssue:
+    sheet: str
+    row: int | None  # Excel の行番号 (シート全体の問題なら None)
+    message: str
 
-    wb = load_workbook(path)
-    if "Config" not in wb.sheetnames or "Staff" not in wb.sheetnames:
-        raise ValueError("テンプレのシート構成が不正です (Config/Staff が必要)。")
+    def __str__(self) -> str:
+        where = f"{self.sheet} {self.row}行目" if self.row is not None else self.sheet
+        return f"{where}: {self.message}"
 
-    config = {}
-    ws = wb["Config"]
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        if not row or row[0] in (None, ""):
-            continue
-        config[str(row[0]).strip()] = row[1]
-
-    month = str(config.get("month", "")).strip()
-    if not month or len(month) != 7 or month[4] != "-":
-        raise ValueError("Config.month が不正です (YYYY-MM)。")
-
-    def as_bool(v, default: bool) -> bool:
-        if v is None or v == "":
-            return default
-        if isinstance(v, bool):
-            return v
-        s = str(v).strip().lower()
-        if s in ("true", "1", "yes", "y"):
-            return True
-        if s in ("false", "0", "no", "n"):
-            return False
+
+class TemplateImportError(ValueError):
+    """テンプレの読込で見つかった問題をすべてまとめて送出する。"""
+
+    MAX_LISTED = 20
+
+    def __init__(self, issues: Iterable[TemplateIssue]):
+        self.issues = tuple(issues)
+        lines = [f"テンプレに {len(self.issues)} 件の問題があります。"]
+        lines += [f"・{i}" for i in self.issues[: self.MAX_LISTED]]
+        if len(self.issues) > self.MAX_LISTED:
+            lines.append(f"…ほか {len(self.issues) - self.MAX_LISTED}件")
+        super().__init__("\n".join(lines))
+
+
+def _as_bool(v, default: bool) -> bool:
+    if v is None or v == "":
         return default
+    if isinstance(v, bool):
+        return v
+    s = str(v).strip().lower()
+    if s in ("true", "1", "yes", "y"):
+        return True
+    if s in ("false", "0", "no", "n"):
+        return False
+    return default
 
-    auto_close = as_bool(config.get("auto_close_jp_holidays"), True)
-    prefer_max = as_bool(config.get("prefer_max_headcount"), True)
-    sat_max = int(str(config.get("saturday_max_per_person", "3")).strip())
-    requirements = Requirements(saturday_max_per_person=sat_max, prefer_max_headcount=prefer_max)
 
-    staff: list[Staff] = []
-    ws = wb["Staff"]
-    for row in ws.iter_rows(min_row=2, values_only=True):
+def _data_rows(ws) -> Iterator[tuple[int, tuple]]:
+    """2行目以降の空でない行を (行番号, 値タプル) で返す。セルオブジェクトは作らない。"""
+    for r, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
         if not row or row[0] in (None, ""):
             continue
-        sid = str(row[0]).strip()
-        name = str(row[1]).strip() if row[1] is not None else ""
-        if not name:
-            raise ValueError(f"Staff.name が空です: {sid}")
-        is_mgr = as_bool(row[2], False)
-        allowed_raw = str(row[3]).strip() if (len(row) > 3 and row[3] is not None) else ""
-        allowed = tuple(x.strip() for x in allowed_raw.split(",") if x.strip()) or None
-        staff.append(Staff(id=sid, name=name, is_manager=is_mgr, allowed_kinds=allowed))
-    if not staff:
-        raise ValueError("Staff シートにスタッフがありません。")
+        yield r, row
 
-    staff_ids = {s.id for s in staff}
 
-    requests_off: dict[str, list[date]] = {}
+# --- シートごとの解析 (1シート1パス。結果はシート単位で持ち、最後に組み立てる) ---
 
-    if "RequestsOffCalendar" in wb.sheetnames:
-        ws = wb["RequestsOffCalendar"]
-        header = [c for c in next(ws.iter_rows(min_row=1, max_row=1, values_only=True))]
-        if len(header) < 3 or str(header[0]).strip() != "staff_id":
-            raise ValueError("RequestsOffCalendar のヘッダが不正です。")
-        day_cols: list[int] = []
-        for h in header[2:]:
-            if h in (None, ""):
-                continue
-            day_cols.append(int(str(h).strip()))
 
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not row or row[0] in (None, ""):
-                continue
-            sid = str(row[0]).strip()
-            if sid not in staff_ids:
-                raise ValueError(f"RequestsOffCalendar に未知の staff_id があります: {sid}")
-            for i, day_num in enumerate(day_cols):
-                cell = row[2 + i] if (2 + i) < len(row) else None
-                if cell is None or cell == "":
-                    continue
-                sval = str(cell).strip().lower()
-                if sval in ("off", "1", "x", "yes", "y", "true"):
-                    requests_off.setdefault(sid, []).append(_parse_date(f"{month}-{day_num:02d}"))
-
-    if "RequestsOff" in wb.sheetnames:
-        ws = wb["RequestsOff"]
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not row or row[0] in (None, ""):
+def _parse_config(ws, month: str | None, issues: list[TemplateIssue]) -> dict[str, Any]:
+    config: dict[str, Any] = {}
+    for _r, row in _data_rows(ws):
+        config[str(row[0]).strip()] = row[1] if len(row) > 1 else None
+    return config
+
+
+def _parse_staff(ws, month: str | None, issues: list[TemplateIssue]) -> list[tuple[int, Staff]]:
+    staff: list[tuple[int, Staff]] = []
+    for r, row in _data_rows(ws):
+        row = tuple(row) + (None,) * (4 - len(row))
+        sid = str(row[0]).strip()
+        name = str(row[1]).strip() if row[1] is not None else ""
+        if not name:
+            issues.append(TemplateIssue("Staff", r, f"Staff.name が空です: {sid}"))
+            continue
+        allowed_raw = str(row[3]).strip() if row[3] is not None else ""
+        allowed = tuple(x.strip() for x in allowed_raw.split(",") if x.strip()) or None
+        staff.append((r, Staff(id=sid, name=name, is_manager=_as_bool(row[2], False), allowed_kinds=allowed)))
+    return staff
+
+
+def _parse_requests_calendar(ws, month: str | None, issues: list[TemplateIssue]) -> list[tuple[int, str, date]]:
+    sheet = "RequestsOffCalendar"
+    out: list[tuple[int, str, date]] = []
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if not header or len(header) < 3 or str(header[0]).strip() != "staff_id":
+        issues.append(TemplateIssue(sheet, 1, "RequestsOffCalendar のヘッダが不正です。"))
+        return out
+    day_cols: list[tuple[int, int]] = []  # (列位置, 日)
+    for col, h in enumerate(header[2:], start=2):
+        if h in (None, ""):
+            continue
+        try:
+            day_cols.append((col, int(str(h).strip())))
+        except ValueError:
+            issues.append(TemplateIssue(sheet, 1, f"日付の列見出しが不正です: {h!r}"))
+    if month is None:
+        return out  # 対象月が読めないと日付にできない (Config 側でエラー済み)
+
+    for r, row in enumerate(rows, start=2):
+        if not row or row[0] in (None, ""):
+            continue
+        sid = str(row[0]).strip()
+        for col, day_num in day_cols:
+            cell = row[col] if col < len(row) else None
+            if cell is None or cell == "":
                 continue
-            sid = str(row[0]).strip()
-            if sid not in staff_ids:
-                raise ValueError(f"RequestsOff に未知の staff_id があります: {sid}")
+            if str(cell).strip().lower() in ("off", "1", "x", "yes", "y", "true"):
+                try:
+                    out.append((r, sid, _parse_date(f"{month}-{day_num:02d}")))
+                except ValueError:
+                    issues.append(TemplateIssue(sheet, r, f"{month} に {day_num} 日はありません。"))
+    return out
+
+
+def _parse_requests_list(ws, month: str | None, issues: list[TemplateIssue]) -> list[tuple[int, str, date]]:
+    out: list[tuple[int, str, date]] = []
+    for r, row in _data_rows(ws):
+        try:
             d = _as_date_cell(row[1] if len(row) > 1 else None)
             if d is not None:
-                requests_off.setdefault(sid, []).append(d)
+                out.append((r, str(row[0]).strip(), d))
+        except (ValueError, TypeError) as e:
+            issues.append(TemplateIssue("RequestsOff", r, str(e)))
+    return out
 
-    closed_dates: list[date] = []
-    if "Closed" in wb.sheetnames:
-        ws = wb["Closed"]
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not row or row[0] in (None, ""):
-                continue
+
+def _parse_closed(ws, month: str | None, issues: list[TemplateIssue]) -> list[date]:
+    out: list[date] = []
+    for r, row in _data_rows(ws):
+        try:
             d = _as_date_cell(row[0])
             if d is not None:
-                closed_dates.append(d)
+                out.append(d)
+        except (ValueError, TypeError) as e:
+            issues.append(TemplateIssue("Closed", r, str(e)))
+    return out
+
+
+def _parse_availability(ws, month: str | None, issues: list[TemplateIssue]) -> list[tuple[int, str, AvailabilityRule]]:
+    out: list[tuple[int, str, AvailabilityRule]] = []
+    for r, row in _data_rows(ws):
+        try:
+            row = tuple(row) + (None,) * (6 - len(row))
+            wds = str(row[1]).replace("、", ",").split(",") if row[1] not in (None, "") else []
+            rule = AvailabilityRule(
+                weekdays=weekday_mask(w for w in wds if w.strip()) if wds else ALL_WEEKDAYS,
+                start=_as_date_cell(row[2]),
+                end=_as_date_cell(row[3]),
+                every_n_weeks=max(1, int(row[4])) if row[4] not in (None, "") else 1,
+                anchor=_as_date_cell(row[5]),
+            )
+            out.append((r, str(row[0]).strip(), rule))
+        except (ValueError, TypeError) as e:
+            issues.append(TemplateIssue("Availability", r, str(e)))
+    return out
+
+
+def _parse_availability_exceptions(ws, month: str | None, issues: list[TemplateIssue]) -> list[tuple[int, str, date, bool]]:
+    out: list[tuple[int, str, date, bool]] = []
+    for r, row in _data_rows(ws):
+        try:
+            d = _as_date_cell(row[1] if len(row) > 1 else None)
+            if d is not None:
+                out.append((r, str(row[0]).strip(), d, _as_bool(row[2] if len(row) > 2 else None, False)))
+        except (ValueError, TypeError) as e:
+            issues.append(TemplateIssue("AvailabilityExceptions", r, str(e)))
+    return out
+
+
+def _parse_slots(ws, month: str | None, issues: list[TemplateIssue]) -> dict[str, dict]:
+    day_types: dict[str, dict] = {}
+    for r, row in _data_rows(ws):
+        try:
+            row = tuple(row) + (None,) * (len(SLOT_SHEET_COLUMNS) - len(row))
+            name = str(row[0]).strip()
+            dt = day_types.get(name)
+            if dt is None:
+                weekdays = [int(x) for x in str(row[2] or "").replace(" ", "").split(",") if x != ""]
+                dt = {
+                    "name": name,
+                    "label": str(row[1]).strip() if row[1] not in (None, "") else name,
+                    "weekdays": weekdays,
+                    "hours": float(row[3] or 0),
+                    "saturday": _as_bool(row[4], False),
+                    "kinds": [],
+                }
+            kind = {
+                "kind": str(row[5]).strip(),
+                "label": str(row[6]).strip() if row[6] not in (None, "") else str(row[5]).strip(),
+                "min": int(row[7] if row[7] not in (None, "") else 1),
+                "max": int(row[8] if row[8] not in (None, "") else (row[7] or 1)),
+            }
+            day_types[name] = dt
+            dt["kinds"].append(kind)
+        except (ValueError, TypeError) as e:
+            issues.append(TemplateIssue("Slots", r, str(e)))
+    return day_types
+
+
+# シート名 -> 解析関数 (ws, 対象月, issues) -> シート単位の解析結果
+SHEET_PARSERS: dict[str, Callable[[Any, str | None, list[TemplateIssue]], Any]] = {
+    "Config": _parse_config,
+    "Staff": _parse_staff,
+    "RequestsOffCalendar": _parse_requests_calendar,
+    "RequestsOff": _parse_requests_list,
+    "Closed": _parse_closed,
+    "Availability": _parse_availability,
+    "AvailabilityExceptions": _parse_availability_exceptions,
+    "Slots": _parse_slots,
+}
+
+# シート単位の解析結果: (データ, そのシートで見つかった問題)
+ParsedSheet = tuple[Any, tuple[TemplateIssue, ...]]
+
+
+# JSON スキーマ (month_input.schema.json) の month と同じ形式
+_MONTH_RE = re.compile(r"[0-9]{4}-(0[1-9]|1[0-2])")
+
+
+def config_month(config: Mapping[str, Any]) -> str | None:
+    """Config.month (YYYY-MM)。形式か月の範囲が不正なら None。"""
+    month = str(config.get("month", "") or "").strip()
+    if not _MONTH_RE.fullmatch(month):
+        return None
+    return month
+
+
+def parse_sheet(wb, name: str, month: str | None) -> ParsedSheet:
+    """1シートを1パスで解析する。`wb` は read-only で開いたブックでよい。"""
+    issues: list[TemplateIssue] = []
+    ws = wb[name]
+    ws.reset_dimensions()  # 保存元によって dimension が不正確なことがあるため、実データを最後まで読む
+    data = SHEET_PARSERS[name](ws, month, issues)
+    return data, tuple(issues)
+
+
+def open_template_workbook(path: str):
+    try:
+        from openpyxl import load_workbook
+    except ModuleNotFoundError as e:
+        raise RuntimeError(
+            "openpyxl が見つかりません。`pip install -r requirements.txt` を実行してください。"
+        ) from e
+    # read_only: セルを必要な分だけストリームで読む / data_only: 数式ではなく値を読む
+    return load_workbook(path, read_only=True, data_only=True)
+
+
+def parse_template_sheets(wb) -> dict[str, ParsedSheet]:
+    """ブック内の既知のシートをすべて解析する (Config を先に読み、対象月を他のシートに渡す)。"""
+    if "Config" not in wb.sheetnames or "Staff" not in wb.sheetnames:
+        raise TemplateImportError([TemplateIssue("(ブック)", None, "テンプレのシート構成が不正です (Config/Staff が必要)。")])
+    parsed: dict[str, ParsedSheet] = {"Config": parse_sheet(wb, "Config", None)}
+    month = config_month(parsed["Config"][0])
+    for name in SHEET_PARSERS:
+        if name != "Config" and name in wb.sheetnames:
+            parsed[name] = parse_sheet(wb, name, month)
+    return parsed
+
+
+def build_month_input(parsed: Mapping[str, ParsedSheet]) -> MonthInput:
+    """シートごとの解析結果から MonthInput を組み立てる。問題があればまとめて TemplateImportError。"""
+    issues: list[TemplateIssue] = []
+    for _data, sheet_issues in parsed.values():
+        issues.extend(sheet_issues)
+
+    def data(name: str, default):
+        got = parsed.get(name)
+        return got[0] if got is not None else default
+
+    config = data("Config", {})
+    month = config_month(config)
+    if month is None:
+        issues.append(TemplateIssue("Config", None, "Config.month が不正です (YYYY-MM)。"))
+    try:
+        sat_max = int(str(config.get("saturday_max_per_person", "3")).strip())
+    except ValueError:
+        issues.append(TemplateIssue("Config", None, "Config.saturday_max_per_person は整数で指定してください。"))
+        sat_max = 3
+    requirements = Requirements(
+        saturday_max_per_person=sat_max,
+        prefer_max_headcount=_as_bool(config.get("prefer_max_headcount"), True),
+    )
+
+    staff = [s for _r, s in data("Staff", [])]
+    if not staff and "Staff" in parsed:
+        issues.append(TemplateIssue("Staff", None, "Staff シートにスタッフがありません。"))
+    staff_ids = {s.id for s in staff}
 
+    def known(sheet: str, r: int, sid: str) -> bool:
+        if sid in staff_ids:
+            return True
+        issues.append(TemplateIssue(sheet, r, f"{sheet} に未知の staff_id があります: {sid}"))
+        return False
+
+    requests_off: dict[str, set[date]] = {}
+    for sheet in ("RequestsOffCalendar", "RequestsOff"):
+        for r, sid, d in data(sheet, []):
+            if known(sheet, r, sid):
+                requests_off.setdefault(sid, set()).add(d)
+
+    av_rules: dict[str, list[AvailabilityRule]] = {}
+    for r, sid, rule in data("Availability", []):
+        if known("Availability", r, sid):
+            av_rules.setdefault(sid, []).append(rule)
+    av_on: dict[str, set[date]] = {}
+    av_off: dict[str, set[date]] = {}
+    for r, sid, d, available in data("AvailabilityExceptions", []):
+        if known("AvailabilityExceptions", r, sid):
+            (av_on if available else av_off).setdefault(sid, set()).add(d)
+    availability = {
+        sid: Availability(
+            rules=tuple(av_rules.get(sid, ())),
+            off=tuple(sorted(av_off.get(sid, ()))),
+            on=tuple(sorted(av_on.get(sid, ()))),
+        )
+        for sid in set(av_rules) | set(av_on) | set(av_off)
+    }
+
+    slot_table = DEFAULT_SLOT_TABLE
+    day_types = data("Slots", {})
+    if day_types:
+        try:
+            slot_table = compile_slot_templates({"day_types": list(day_types.values())})
+        except ValueError as e:
+            issues.append(TemplateIssue("Slots", None, str(e)))
+
+    if issues:
+        order = {name: i for i, name in enumerate(SHEET_PARSERS)}
+        issues.sort(key=lambda i: (order.get(i.sheet, -1), i.row or 0))
+        raise TemplateImportError(issues)
     return MonthInput(
         month=month,
         staff=tuple(staff),
-        closed_dates=tuple(sorted(set(closed_dates))),
-        requests_off={sid: tuple(sorted(set(ds))) for sid, ds in requests_off.items()},
+        closed_dates=tuple(sorted(set(data("Closed", [])))),
+        requests_off={sid: tuple(sorted(ds)) for sid, ds in requests_off.items()},
         requirements=requirements,
-        auto_close_jp_holidays=auto_close,
+        auto_close_jp_holidays=_as_bool(config.get("auto_close_jp_holidays"), True),
+        slot_table=slot_table,
+        availability=availability,
     )
 
+
+def import_from_template_xlsx(path: str) -> MonthInput:
+    """
+    Read a template workbook in read-only streaming mode.
+
+    Each sheet is parsed in a single pass over its row values. Problems are
+    collected with their sheet and row and raised together as a
+    TemplateImportError (a ValueError) once every sheet has been read.
+    """
+    wb = open_template_workbook(path)
+    try:
+        parsed = parse_template_sheets(wb)
+    finally:
+        wb.close()
+    return build_month_input(parsed)
@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable
+
+from .domain import Assignment, MonthInput
+from .schedule import EMPTY, ScheduleMatrix
+
+# 目的関数の重み (solver と共通)
+W_UNFILLED_MANDATORY = 10_000_000
+W_NO_MANAGER = 1_000_000
+W_SAT_EXCESS = 10_000
+W_UNFILLED_OPTIONAL_RELAXED = 1_000
+W_UNFILLED_OPTIONAL_STRICT = 1_000_000
+W_SPREAD = 1_000
+W_SAT_CARRY = 1_000  # 前月までの土曜の偏りを足すと上限を超える回数
+
+V_REQUEST_OFF = "request_off"
+V_KIND = "kind"
+V_SLOT = "slot"  # その日種別に存在しない枠
+V_CLOSED = "closed"  # 営業日以外への割当
+V_UNKNOWN_STAFF = "unknown_staff"
+V_DOUBLE_BOOKING = "double_booking"
+V_NO_MANAGER = "no_manager"
+V_SATURDAY_CAP = "saturday_cap"
+V_UNFILLED = "unfilled"  # 必須枠の空き
+
+
+@dataclass(frozen=True)
+class Violation:
+    code: str
+    message: str
+    day: date | None = None
+    slot: str | None = None
+    staff_id: str | None = None
+
+
+@dataclass(frozen=True)
+class ObjectiveTerms:
+    unfilled_mandatory: int
+    unfilled_optional: int
+    no_manager_days: int
+    saturday_excess: int
+    workday_spread: int  # 勤務日数の最大 - 最小 (carry_over があれば繰越込み)
+    workday_deviation: int  # Σ|勤務日数 - 平均| (同上)
+    saturday_carry_excess: int = 0  # Σ max(0, 土曜勤務 + 土曜の繰越 - 上限)
+
+    def objective(self, relaxed: bool = False, prefer_max_headcount: bool = True) -> int:
+        """solver と同じ重みで目的関数値を計算する。"""
+        imbalance = self.workday_spread * W_SPREAD + self.workday_deviation + self.saturday_carry_excess * W_SAT_CARRY
+        if relaxed:
+            obj = (
+                self.unfilled_mandatory * W_UNFILLED_MANDATORY
+                + self.no_manager_days * W_NO_MANAGER
+                + self.saturday_excess * W_SAT_EXCESS
+                + imbalance
+            )
+            if prefer_max_headcount:
+                obj += self.unfilled_optional * W_UNFILLED_OPTIONAL_RELAXED
+            return obj
+        if prefer_max_headcount:
+            return self.unfilled_optional * W_UNFILLED_OPTIONAL_STRICT + imbalance
+        return imbalance
+
+
+def carry_over_offsets(mi: MonthInput) -> tuple[list[int], list[int]]:
+    """
+    Per staff position: (work-day offset, Saturday offset) from
+    mi.carry_over. Work-day offsets are shifted so the smallest is 0; only
+    their differences matter for balancing, and this keeps the solver's
+    totals non-negative.
+    """
+    carry = mi.carry_over
+    days = [carry[s.id].workdays if s.id in carry else 0 for s in mi.staff]
+    sats = [carry[s.id].saturdays if s.id in carry else 0 for s in mi.staff]
+    if days:
+        low = min(days)
+        days = [d - low for d in days]
+    return days, sats
+
+
+@dataclass(frozen=True)
+class ValidationReport:
+    violations: tuple[Violation, ...]
+    terms: ObjectiveTerms
+
+    @property
+    def ok(self) -> bool:
+        return not self.violations
+
+
+class ScheduleValidator:
+    """
+    Validator for a (possibly hand-edited) schedule over a month's open days.
+
+    All counters are kept incrementally: `set_cell()` re-checks only the edited
+    cell, its day and the affected staff members, so a single edit costs O(1)
+    amortized (O(slots) for the day) instead of re-validating the month.
+    Violations that do not depend on cells of the grid (assignments on closed
+    days, unknown staff ids) are collected once by `from_assignments()`.
+    """
+
+    def __init__(self, mi: MonthInput):
+        self.mi = mi
+        idx = mi.index
+        table = mi.slot_table
+        self._idx = idx
+        self._table = table
+        cal = mi.calendar
+        open_pos = [i for i, is_open in enumerate(cal.open) if is_open]
+        self.days = tuple(cal.dates[i] for i in open_pos)
+        self._day_pos = {d: di for di, d in enumerate(self.days)}
+        self._day_type = [cal.day_types[i] for i in open_pos]
+        self._is_sat_day = [table.day_type_is_saturday[dt] for dt in self._day_type]
+        self._slot_ok = [set(table.day_type_slots[dt]) for dt in self._day_type]
+        self.matrix = ScheduleMatrix(self.days, table.slot_names, idx.staff_ids)
+
+        n_staff = len(idx.staff_ids)
+        self._n_staff = n_staff
+        self._cap = mi.requirements.saturday_max_per_person
+        self._booked = [[0] * n_staff for _ in self.days]  # [day][staff] 枠数
+        self._mgr_cells = [0] * len(self.days)
+        self._sat = [0] * n_staff
+        carry_days, self._carry_sat = carry_over_offsets(mi)
+        self._carry_days_sum = sum(carry_days)
+        self._total = list(carry_days)  # 勤務枠数 + 勤務日数の繰越
+        self._hist: dict[int, int] = {}  # 同上 -> 人数
+        for t in self._total:
+            self._hist[t] = self._hist.get(t, 0) + 1
+        self._max_total = max(self._total, default=0)
+        self._min_total = min(self._total, default=0)
+        self._assigned = 0
+
+        self._mandatory_total = sum(
+            1 for dt in self._day_type for si in table.day_type_slots[dt] if not table.slot_optional[si]
+        )
+        self._optional_total = sum(
+            1 for dt in self._day_type for si in table.day_type_slots[dt] if table.slot_optional[si]
+        )
+        self._filled_mandatory = 0
+        self._filled_optional = 0
+
+        self._cell_v: dict[tuple[int, int], tuple[Violation, ...]] = {}
+        self._day_v: dict[int, tuple[Violation, ...]] = {}
+        self._sat_v: dict[int, Violation] = {}
+        self._static_v: list[Violation] = []
+        for di in range(len(self.days)):
+            self._recheck_day(di)
+
+    # --- 構築 ---
+
+    @classmethod
+    def from_assignments(cls, mi: MonthInput, assignments: Iterable[Assignment]) -> "ScheduleValidator":
+        v = cls(mi)
+        staff_pos = mi.index.staff_pos
+        slot_index = mi.slot_table.slot_index
+        for a in assignments:
+            di = v._day_pos.get(a.day)
+            for slot_name, sid in a.slots.items():
+                if di is None:
+                    v._static_v.append(
+                        Violation(V_CLOSED, f"{a.day.isoformat()} は営業日ではありません。", a.day, slot_name, sid)
+                    )
+                    continue
+                si = slot_index.get(slot_name)
+                if si is None:
+                    v._static_v.append(Violation(V_SLOT, f"未知の枠です: {slot_name}", a.day, slot_name, sid))
+                    continue
+                p = staff_pos.get(sid)
+                if p is None:
+                    v._static_v.append(
+                        Violation(V_UNKNOWN_STAFF, f"未知の staff id です: {sid}", a.day, slot_name, sid)
+                    )
+                    continue
+                v._assign(di, si, p)
+        return v
+
+    # --- 編集 ---
+
+    def set_cell(self, day: date, slot_name: str, staff_id: str | None) -> None:
+        """1セルを変更し、影響する日・人だけ再検証する。staff_id=None で空ける。"""
+        di = self._day_pos.get(day)
+        if di is None:
+            raise ValueError(f"{day.isoformat()} は営業日ではありません。")
+        si = self._table.slot_index.get(slot_name)
+        if si is None:
+            raise ValueError(f"未知の枠です: {slot_name}")
+        p = EMPTY
+        if staff_id is not None:
+            p = self._idx.staff_pos.get(staff_id, EMPTY)
+            if p == EMPTY:
+                raise ValueError(f"未知の staff id です: {staff_id}")
+        self._assign(di, si, p)
+
+    def _assign(self, di: int, si: int, p: int) -> None:
+        old = self.matrix[di, si]
+        if old == p:
+            return
+        if old != EMPTY:
+            self._count(di, si, old, -1)
+        self.matrix[di, si] = p
+        if p != EMPTY:
+            self._count(di, si, p, +1)
+        self._recheck_cell(di, si)
+        self._recheck_day(di)
+        for q in (old, p):
+            if q != EMPTY and self._is_sat_day[di]:
+                self._recheck_saturday(q)
+
+    def _count(self, di: int, si: int, p: int, delta: int) -> None:
+        self._booked[di][p] += delta
+        if self._idx.is_manager(p):
+            self._mgr_cells[di] += delta
+        if self._is_sat_day[di]:
+            self._sat[p] += delta
+        if si in self._slot_ok[di]:
+            if self._table.slot_optional[si]:
+                self._filled_optional += delta
+            else:
+                self._filled_mandatory += delta
+        self._assigned += delta
+
+        t = self._total[p]
+        self._hist[t] -= 1
+        if not self._hist[t]:
+            del self._hist[t]
+        t += delta
+        self._total[p] = t
+        self._hist[t] = self._hist.get(t, 0) + 1
+        # 最大・最小は1ずつしか動かないため、ヒストグラムで O(1) 更新できる
+        if delta > 0:
+            self._max_total = max(self._max_total, t)
+            if t - 1 == self._min_total and self._min_total not in self._hist:
+                self._min_total = t
+        else:
+            self._min_total = min(self._min_total, t)
+            if t + 1 == self._max_total and self._max_total not in self._hist:
+                self._max_total = t
+
+    # --- 再検証 ---
+
+    def _recheck_cell(self, di: int, si: int) -> None:
+        key = (di, si)
+        p = self.matrix[di, si]
+        if p == EMPTY:
+            self._cell_v.pop(key, None)
+            return
+        d = self.days[di]
+        slot = self._table.slot_names[si]
+        sid = self._idx.staff_ids[p]
+        out: list[Violation] = []
+        if si not in self._slot_ok[di]:
+            out.append(Violation(V_SLOT, f"{d.isoformat()} に {slot} 枠はありません。", d, slot, sid))
+        if self._idx.is_off(p, d):
+            out.append(Violation(V_REQUEST_OFF, f"{sid} は {d.isoformat()} が希望休です。", d, slot, sid))
+        if not self._idx.allows_kind(p, self._table.slot_kind[si]):
+            out.append(Violation(V_KIND, f"{sid} は {slot} に入れません。", d, slot, sid))
+        if out:
+            self._cell_v[key] = tuple(out)
+        else:
+            self._cell_v.pop(key, None)
+
+    def _recheck_day(self, di: int) -> None:
+        d = self.days[di]
+        out: list[Violation] = []
+        row = self.matrix.day_row(di)
+        for si in self._table.day_type_slots[self._day_type[di]]:
+            if row[si] == EMPTY and not self._table.slot_optional[si]:
+                slot = self._table.slot_names[si]
+                out.append(Violation(V_UNFILLED, f"{d.isoformat()} の {slot} が空いています。", d, slot))
+        if not self._mgr_cells[di]:
+            out.append(Violation(V_NO_MANAGER, f"{d.isoformat()} にマネージャーがいません。", d))
+        booked = self._booked[di]
+        for p in set(row):
+            if p != EMPTY and booked[p] > 1:
+                sid = self._idx.staff_ids[p]
+                out.append(Violation(V_DOUBLE_BOOKING, f"{sid} が {d.isoformat()} に重複しています。", d, None, sid))
+        if out:
+            self._day_v[di] = tuple(out)
+        else:
+            self._day_v.pop(di, None)
+
+    def _recheck_saturday(self, p: int) -> None:
+        if self._sat[p] > self._cap:
+            sid = self._idx.staff_ids[p]
+            self._sat_v[p] = Violation(
+                V_SATURDAY_CAP, f"{sid} の土曜勤務が上限 {self._cap} 回を超えています ({self._sat[p]}回)。", staff_id=sid
+            )
+        else:
+            self._sat_v.pop(p, None)
+
+    # --- 結果 ---
+
+    def violations(self) -> tuple[Violation, ...]:
+        out: list[Violation] = list(self._static_v)
+        for key in sorted(self._cell_v):
+            out.extend(self._cell_v[key])
+        for di in sorted(self._day_v):
+            out.extend(self._day_v[di])
+        for p in sorted(self._sat_v):
+            out.append(self._sat_v[p])
+        return tuple(out)
+
+    def terms(self) -> ObjectiveTerms:
+        avg = (self._assigned + self._carry_days_sum) // self._n_staff if self._n_staff else 0
+        deviation = sum(n * abs(t - avg) for t, n in self._hist.items())
+        carry_excess = 0
+        if any(self._is_sat_day):  # 土曜の無い月は solver もこの項を作らない
+            carry_excess = sum(max(0, c + k - self._cap) for c, k in zip(self._sat, self._carry_sat) if k > 0)
+        return ObjectiveTerms(
+            unfilled_mandatory=self._mandatory_total - self._filled_mandatory,
+            unfilled_optional=self._optional_total - self._filled_optional,
+            no_manager_days=sum(1 for c in self._mgr_cells if not c),
+            saturday_excess=sum(max(0, c - self._cap) for c in self._sat),
+            workday_spread=self._max_total - self._min_total,
+            workday_deviation=deviation,
+            saturday_carry_excess=carry_excess,
+        )
+
+    def report(self) -> ValidationReport:
+        return ValidationReport(violations=self.violations(), terms=self.terms())
+
+
+def validate_schedule(mi: MonthInput, assignments: Iterable[Assignment]) -> ValidationReport:
+    return ScheduleValidator.from_assignments(mi, assignments).report()
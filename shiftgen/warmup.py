@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import date
+
+log = logging.getLogger(__name__)
+
+
+def _warm_ortools() -> None:
+    from ortools.sat.python import cp_model
+
+    # 初回の Solve はソルバー本体の初期化を含むため、極小モデルを1度解いておく
+    model = cp_model.CpModel()
+    a = model.NewBoolVar("a")
+    b = model.NewBoolVar("b")
+    model.Add(a + b == 1)
+    model.Maximize(a)
+    solver = cp_model.CpSolver()
+    solver.parameters.num_search_workers = 1
+    solver.parameters.max_time_in_seconds = 1.0
+    solver.Solve(model)
+
+
+def _warm_openpyxl() -> None:
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Font, PatternFill
+
+    wb = Workbook()
+    ws = wb.active
+    ws.cell(row=1, column=1, value="shiftgen").font = Font(bold=True)
+    ws.cell(row=1, column=1).fill = PatternFill("solid", fgColor="1F2937")
+    ws.cell(row=1, column=1).alignment = Alignment(horizontal="center")
+
+
+def _warm_holidays() -> None:
+    from .jp_holidays import holidays_in_year
+
+    holidays_in_year(date.today().year)
+
+
+WARM_STEPS = (
+    ("ortools", _warm_ortools),
+    ("openpyxl", _warm_openpyxl),
+    ("jp_holidays", _warm_holidays),
+)
+
+
+def warm_up() -> dict[str, float]:
+    """
+    Import the heavy optional modules and run each once so that the first
+    生成 / Excel出力 does not pay for it. Returns {step: seconds}; failed
+    steps are logged and skipped (the real call reports the error later).
+    """
+    timings: dict[str, float] = {}
+    for name, step in WARM_STEPS:
+        t0 = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            log.debug("warm-up %s failed", name, exc_info=True)
+            continue
+        timings[name] = time.perf_counter() - t0
+        log.debug("warm-up %s: %.3fs", name, timings[name])
+    return timings
+
+
+def start_warm_up() -> threading.Thread:
+    """warm_up() をデーモンスレッドで開始する。"""
+    t = threading.Thread(target=warm_up, name="shiftgen-warmup", daemon=True)
+    t.start()
+    return t
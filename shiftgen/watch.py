@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import io
+import os
+import posixpath
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+from .domain import MonthInput
+from .io import MonthInputJsonError, load_month_input_json
+from .template_excel import (
+    SHEET_PARSERS,
+    ParsedSheet,
+    TemplateImportError,
+    TemplateIssue,
+    build_month_input,
+    config_month,
+    open_template_workbook,
+    parse_sheet,
+)
+
+# 変更の確認間隔 (秒)
+DEFAULT_INTERVAL = 0.5
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_WORKBOOK = "xl/workbook.xml"
+_WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+_STYLES = "xl/styles.xml"
+_SHARED_STRINGS = "xl/sharedStrings.xml"
+
+
+def _sheet_members(z: zipfile.ZipFile) -> dict[str, str]:
+    """シート名 -> zip 内のシート XML のパス。"""
+    rels = ET.fromstring(z.read(_WORKBOOK_RELS))
+    targets = {}
+    for rel in rels.iter(f"{_NS_PKG_REL}Relationship"):
+        target = rel.get("Target", "")
+        # 相対パスは xl/ から、"/" 始まりはパッケージのルートから
+        targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(f"xl/{target}")
+    wb = ET.fromstring(z.read(_WORKBOOK))
+    return {
+        sheet.get("name"): targets.get(sheet.get(f"{_NS_REL}id"), "")
+        for sheet in wb.iter(f"{_NS_MAIN}sheet")
+    }
+
+
+def _shared_strings(z: zipfile.ZipFile) -> list[bytes]:
+    try:
+        root = ET.fromstring(z.read(_SHARED_STRINGS))
+    except KeyError:
+        return []
+    return [ET.tostring(si) for si in root.iter(f"{_NS_MAIN}si")]
+
+
+class TemplateReader:
+    """
+    Re-read a template workbook, re-parsing only the sheets that changed.
+
+    An xlsx file is a zip archive whose central directory records a CRC
+    for every member, so comparing the CRC of each sheet's XML with the
+    previous read tells which sheets were edited without decompressing
+    anything. Unchanged sheets reuse their earlier ParsedSheet. Everything
+    is re-parsed when a workbook-wide part changes (sheet list, styles,
+    or shared strings other than appended ones, since sheets refer to
+    strings by index) or when Config's month changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parsed: dict[str, ParsedSheet] = {}
+        self._crcs: dict[str, int] = {}
+        self._global: tuple[int, ...] | None = None
+        self._strings_crc: int | None = None
+        self._strings: list[bytes] = []
+        self._month: str | None = None
+        self.last_parsed: tuple[str, ...] = ()  # 直前の read() で解析し直したシート
+
+    def _reset(self) -> None:
+        self._parsed.clear()
+        self._crcs.clear()
+
+    def read(self) -> MonthInput:
+        with open(self.path, "rb") as f:
+            data = f.read()  # 同じ中身から CRC とセルを読む (途中で保存されても食い違わない)
+        try:
+            z = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile as e:
+            raise TemplateImportError([TemplateIssue("(ブック)", None, f"xlsx として読めません: {e}")]) from e
+        with z:
+            crcs = {info.filename: info.CRC for info in z.infolist()}
+            try:
+                members = {name: m for name, m in _sheet_members(z).items() if name in SHEET_PARSERS}
+                strings_crc = crcs.get(_SHARED_STRINGS, -1)
+                strings = _shared_strings(z) if strings_crc != self._strings_crc else self._strings
+            except (KeyError, ET.ParseError) as e:
+                raise TemplateImportError([TemplateIssue("(ブック)", None, f"xlsx の構成が不正です: {e}")]) from e
+        glob = tuple(crcs.get(name, -1) for name in (_WORKBOOK, _WORKBOOK_RELS, _STYLES))
+        if glob != self._global:
+            self._reset()
+            self._global = glob
+        # 共有文字列は末尾への追加だけなら既存の番号が変わらないので、変わっていないシートはそのまま使える
+        if strings[: len(self._strings)] != self._strings:
+            self._reset()
+        self._strings, self._strings_crc = strings, strings_crc
+
+        if "Config" not in members or "Staff" not in members:
+            raise TemplateImportError([TemplateIssue("(ブック)", None, "テンプレのシート構成が不正です (Config/Staff が必要)。")])
+        for name in set(self._parsed) - set(members):
+            del self._parsed[name]
+            del self._crcs[name]
+        dirty = [name for name, m in members.items() if name not in self._parsed or self._crcs.get(name) != crcs.get(m)]
+        if dirty:
+            wb = open_template_workbook(io.BytesIO(data))
+            try:
+                if "Config" in dirty:
+                    self._parsed["Config"] = parse_sheet(wb, "Config", None)
+                    self._crcs["Config"] = crcs.get(members["Config"])
+                    month = config_month(self._parsed["Config"][0])
+                    if month != self._month:  # 他のシートは対象月を前提に解析している
+                        self._month = month
+                        dirty = list(members)
+                for name in SHEET_PARSERS:
+                    if name != "Config" and name in dirty:
+                        self._parsed[name] = parse_sheet(wb, name, self._month)
+                        self._crcs[name] = crcs.get(members[name])
+            finally:
+                wb.close()
+        self.last_parsed = tuple(name for name in SHEET_PARSERS if name in dirty)
+        return build_month_input(self._parsed)
+
+
+class InputReader:
+    """入力ファイルを読み直す。テンプレはシート単位、JSON はファイル全体を読み直す。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._template = TemplateReader(path) if path.lower().endswith(".xlsx") else None
+
+    @property
+    def last_parsed(self) -> tuple[str, ...] | None:
+        """直前に解析し直したシート (JSON なら None)。"""
+        return self._template.last_parsed if self._template is not None else None
+
+    def read(self) -> MonthInput:
+        if self._template is not None:
+            return self._template.read()
+        return load_month_input_json(self.path)
+
+
+# 読み直しで報告する入力エラー
+INPUT_ERRORS = (OSError, TemplateImportError, MonthInputJsonError)
+
+
+def file_state(path: str) -> tuple[int, int] | None:
+    """(更新時刻 ns, サイズ)。保存の途中でファイルが無ければ None。"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def wait_for_change(
+    path: str,
+    last: tuple[int, int] | None,
+    interval: float = DEFAULT_INTERVAL,
+) -> tuple[int, int]:
+    """
+    Poll `path` until its (mtime, size) differs from `last` and then stays
+    the same for one more interval, so a save in progress is not read
+    half-written. Returns the new state.
+    """
+    while True:
+        time.sleep(interval)
+        state = file_state(path)
+        if state is None or state == last:
+            continue
+        time.sleep(interval)
+        if file_state(path) == state:
+            return state